@@ -1,83 +1,936 @@
+import time
+_STARTUP_T0 = time.perf_counter()
 import sys
+import os
+import argparse
+import bisect
+import csv
+import hashlib
+import itertools
+import io
+import json
+import shutil
+import sqlite3
+import tempfile
+import threading
+import random
+import re
+from array import array
+from collections import OrderedDict
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QTabWidget, QWidget, QVBoxLayout, QHBoxLayout,
     QTableView, QPushButton, QDialog, QFormLayout, QLineEdit, QTextEdit, QComboBox,
     QDoubleSpinBox, QSpinBox, QDialogButtonBox, QMessageBox, QMenuBar, QAction,
-    QStatusBar, QToolBar, QLabel, QDateEdit, QSplashScreen
+    QStatusBar, QToolBar, QLabel, QDateEdit, QSplashScreen, QCheckBox, QProgressDialog,
+    QHeaderView, QInputDialog, QFileDialog, QCompleter
 )
 from PyQt5.QtSql import QSqlDatabase, QSqlQuery, QSqlTableModel, QSqlQueryModel
-from PyQt5.QtCore import Qt, QDate, QTimer
+from PyQt5.QtCore import (
+    Qt, QDate, QTimer, QThread, QObject, QCoreApplication, QAbstractTableModel, QModelIndex, pyqtSignal,
+    QRunnable, QThreadPool, QEventLoop, QEvent, QAbstractListModel, QT_VERSION_STR, PYQT_VERSION_STR
+)
 from PyQt5.QtGui import QIcon, QFont, QPixmap
 from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
+
+# --- Query Instrumentation ---
+# All SQL runs through SqlQuery, a QSqlQuery that reports each execution to
+# query_stats once its result is done with: the time spent executing and
+# fetching, the rows returned or changed, and the calling function.
+# Executions slower than SLOW_QUERY_MS are appended to SLOW_QUERY_LOG (one
+# JSON object per line) with their bound values and query plan. A statement
+# run N_PLUS_ONE_THRESHOLD or more times within one user action, i.e. before
+# control returns to the event loop, or within one background task, counts
+# as an N+1 pattern.
+SLOW_QUERY_MS = float(os.environ.get("STOCK_SLOW_QUERY_MS", "100"))
+# Kept out of the working directory, which may be a source checkout.
+SLOW_QUERY_LOG = os.environ.get("STOCK_SLOW_QUERY_LOG",
+                                os.path.join(tempfile.gettempdir(), "stock_management_slow_queries.log"))
+N_PLUS_ONE_THRESHOLD = int(os.environ.get("STOCK_N_PLUS_ONE_THRESHOLD", "10"))
+QUERY_LATENCY_BUCKETS_MS = (0.1, 0.5, 1, 5, 10, 50, 100, 500, 1000)
+QUERY_STATS_MAX_STATEMENTS = 2000
+QUERY_STATS_RECENT_SLOW = 50
+QUERY_STATS_REFRESH_MS = 2000
+
+# Generic helpers that only pass SQL through; a call site names their caller.
+_CALL_SITE_SKIP = {"load_combo", "QueryService.submit", "QueryService.fetch", "RowsTableModel.load",
+                   "RowsTableModel.load_rows"}
+
+def _call_site(depth):
+    frame = sys._getframe(depth + 1)
+    while frame.f_back is not None and frame.f_code.co_qualname in _CALL_SITE_SKIP:
+        frame = frame.f_back
+    site = f"{frame.f_code.co_qualname}:{frame.f_lineno}"
+    # Background tasks name the code that submitted them.
+    task_site = getattr(query_stats._local, "task_site", None)
+    return site if task_site is None else f"{task_site} > {site}"
+
+def _percentile_ms(histogram, calls, max_ms, fraction):
+    # Upper bound of the latency bucket holding the given fraction of calls.
+    seen = 0
+    for bound, count in zip(QUERY_LATENCY_BUCKETS_MS, histogram):
+        seen += count
+        if seen >= calls * fraction:
+            return min(bound, max_ms)
+    return max_ms
+
+class QueryStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self._local = threading.local()
+        self.reset()
+    
+    def reset(self):
+        with self.lock:
+            self.calls = 0
+            self.total_ms = 0.0
+            self.slow = 0
+            self.statements = {}
+            self.n_plus_one = {}
+            self.recent_slow = []
+        self._local.counts = None
+    
+    def record(self, sql, elapsed_ms, rows, site):
+        bucket = bisect.bisect_left(QUERY_LATENCY_BUCKETS_MS, elapsed_ms)
+        with self.lock:
+            self.calls += 1
+            self.total_ms += elapsed_ms
+            entry = self.statements.get(sql)
+            if entry is None:
+                if len(self.statements) >= QUERY_STATS_MAX_STATEMENTS:
+                    sql = "(other statements)"
+                entry = self.statements.setdefault(sql, {
+                    "calls": 0, "rows": 0, "total_ms": 0.0, "max_ms": 0.0,
+                    "histogram": [0] * (len(QUERY_LATENCY_BUCKETS_MS) + 1), "sites": {}})
+            entry["calls"] += 1
+            entry["rows"] += max(rows, 0)
+            entry["total_ms"] += elapsed_ms
+            entry["max_ms"] = max(entry["max_ms"], elapsed_ms)
+            entry["histogram"][bucket] += 1
+            entry["sites"][site] = entry["sites"].get(site, 0) + 1
+        counts = getattr(self._local, "counts", None)
+        if counts is None:
+            counts = self._local.counts = {}
+            if threading.current_thread() is threading.main_thread() and QCoreApplication.instance() is not None:
+                QTimer.singleShot(0, self.end_action)
+        counts[sql] = counts.get(sql, 0) + 1
+    
+    def end_action(self):
+        counts = getattr(self._local, "counts", None)
+        self._local.counts = None
+        if not counts:
+            return
+        repeated = [(sql, count) for sql, count in counts.items() if count >= N_PLUS_ONE_THRESHOLD]
+        if repeated:
+            with self.lock:
+                for sql, count in repeated:
+                    entry = self.n_plus_one.setdefault(sql, {"actions": 0, "max_repeats": 0})
+                    entry["actions"] += 1
+                    entry["max_repeats"] = max(entry["max_repeats"], count)
+    
+    def record_slow(self, sql, params, elapsed_ms, rows, site, plan):
+        entry = {"time": time.strftime("%Y-%m-%d %H:%M:%S"), "ms": round(elapsed_ms, 2), "rows": rows,
+                 "site": site, "sql": sql, "params": [repr(value)[:100] for value in params], "plan": plan}
+        with self.lock:
+            self.slow += 1
+            self.recent_slow = self.recent_slow[-(QUERY_STATS_RECENT_SLOW - 1):] + [entry]
+            if SLOW_QUERY_LOG:
+                try:
+                    with open(SLOW_QUERY_LOG, "a", encoding="utf-8") as log:
+                        log.write(json.dumps(entry) + "\n")
+                except OSError as error:
+                    print(f"Could not write {SLOW_QUERY_LOG}: {error}", file=sys.stderr)
+    
+    def summary(self):
+        with self.lock:
+            return (f"SQL: {self.calls} statements, {self.total_ms / 1000:.1f} s, "
+                    f"{self.slow} slow, {len(self.n_plus_one)} N+1")
+    
+    def report(self, top=50):
+        with self.lock:
+            statements = sorted(self.statements.items(), key=lambda item: item[1]["total_ms"], reverse=True)
+            n_plus_one = sorted(self.n_plus_one.items(), key=lambda item: item[1]["actions"], reverse=True)
+            report = {
+                "statements_run": self.calls,
+                "total_ms": round(self.total_ms, 1),
+                "distinct_statements": len(self.statements),
+                "slow_threshold_ms": SLOW_QUERY_MS,
+                "slow": self.slow,
+                "n_plus_one_threshold": N_PLUS_ONE_THRESHOLD,
+                "n_plus_one": [{"sql": sql, **entry, "sites": self.statements.get(sql, {}).get("sites", {})}
+                               for sql, entry in n_plus_one],
+                "statements": [],
+                "recent_slow": list(self.recent_slow),
+            }
+            labels = [f"<={bound}ms" for bound in QUERY_LATENCY_BUCKETS_MS] + [f">{QUERY_LATENCY_BUCKETS_MS[-1]}ms"]
+            for sql, entry in statements[:top]:
+                calls = entry["calls"]
+                report["statements"].append({
+                    "sql": sql,
+                    "calls": calls,
+                    "rows": entry["rows"],
+                    "total_ms": round(entry["total_ms"], 2),
+                    "mean_ms": round(entry["total_ms"] / calls, 3),
+                    "p50_ms": round(_percentile_ms(entry["histogram"], calls, entry["max_ms"], 0.5), 3),
+                    "p95_ms": round(_percentile_ms(entry["histogram"], calls, entry["max_ms"], 0.95), 3),
+                    "max_ms": round(entry["max_ms"], 2),
+                    "histogram": {label: count for label, count in zip(labels, entry["histogram"]) if count},
+                    "sites": dict(sorted(entry["sites"].items(), key=lambda item: item[1], reverse=True)),
+                })
+            return report
+    
+    def dump(self, path):
+        with open(path, "w", encoding="utf-8") as out:
+            json.dump(self.report(), out, indent=2)
+
+query_stats = QueryStats()
+
+class SqlQuery(QSqlQuery):
+    # An execution is reported when the next one starts, when next() runs out
+    # of rows, or on finish(), clear() or garbage collection.
+    def __init__(self, db=None):
+        if db is None:
+            super().__init__()
+        else:
+            super().__init__(db)
+        self._db = db
+        self._active = False
+        self._elapsed = 0.0
+        self._fetched = 0
+        self._params = ()
+        self._batch = False
+        self._site = None
+    
+    def _started(self, start, ok, batch=False):
+        self._elapsed = time.perf_counter() - start
+        if ok:
+            self._active = True
+            params = list(self.boundValues().values())
+            # A batch is reported as one execution; its first row stands in
+            # for the bound values.
+            self._fetched = len(params[0]) if batch and params else 0
+            self._params = [values[0] for values in params] if batch and params and params[0] else params
+            self._batch = batch
+            self._site = _call_site(2)
+            if not self.isSelect() and threading.current_thread() is threading.main_thread():
+                change_feed.note_write()
+        return ok
+    
+    def _report(self):
+        if not self._active:
+            return
+        self._active = False
+        elapsed_ms = self._elapsed * 1000
+        rows = self._fetched if self._batch or self.isSelect() else self.numRowsAffected()
+        sql = " ".join(self.lastQuery().split())
+        query_stats.record(sql, elapsed_ms, rows, self._site)
+        if elapsed_ms >= SLOW_QUERY_MS:
+            query_stats.record_slow(sql, self._params, elapsed_ms, rows, self._site, self._plan())
+    
+    def _plan(self):
+        plan = QSqlQuery(self._db) if self._db is not None else QSqlQuery()
+        plan.prepare("EXPLAIN QUERY PLAN " + self.lastQuery())
+        for value in self._params:
+            plan.addBindValue(value)
+        if not plan.exec_():
+            return [plan.lastError().text()]
+        lines = []
+        while plan.next():
+            lines.append(plan.value(3))
+        return lines
+    
+    def prepare(self, sql):
+        self._report()
+        return super().prepare(sql)
+    
+    def exec_(self, sql=None):
+        self._report()
+        start = time.perf_counter()
+        return self._started(start, super().exec_() if sql is None else super().exec_(sql))
+    
+    def execBatch(self, mode=QSqlQuery.ValuesAsRows):
+        self._report()
+        start = time.perf_counter()
+        return self._started(start, super().execBatch(mode), batch=True)
+    
+    def next(self):
+        start = time.perf_counter()
+        ok = super().next()
+        self._elapsed += time.perf_counter() - start
+        if ok:
+            self._fetched += 1
+        else:
+            self._report()
+        return ok
+    
+    def finish(self):
+        self._report()
+        super().finish()
+    
+    def clear(self):
+        self._report()
+        super().clear()
+    
+    def __del__(self):
+        self._report()
+
+def select_model(model):
+    # QSqlTableModel runs its own SQL; this reports its select like SqlQuery.
+    start = time.perf_counter()
+    ok = model.select()
+    query_stats.record(" ".join(model.query().lastQuery().split()), (time.perf_counter() - start) * 1000,
+                       model.rowCount(), _call_site(1))
+    return ok
 
 # --- Database Setup ---
-def setup_database():
-    db = QSqlDatabase.addDatabase("QSQLITE")
-    db.setDatabaseName("stock_management.db")
+DB_FILENAME = "stock_management.db"
+
+def _seed_invoice_settings(query):
+    query.prepare("INSERT OR IGNORE INTO InvoiceSettings (key, value) VALUES (?, ?)")
+    query.addBindValue(list(INVOICE_TEMPLATE_DEFAULTS.keys()))
+    query.addBindValue(list(INVOICE_TEMPLATE_DEFAULTS.values()))
+    return query.execBatch()
+
+# Columns indexed by each table's {table}Search full-text index.
+SEARCH_COLUMNS = {
+    "StockItems": ["name", "description"],
+    "Customers": ["name", "contact_person", "phone", "email", "address"],
+    "Suppliers": ["name", "contact_person", "phone", "email", "address"],
+}
+
+def _fts_insert_trigger(table, columns):
+    search = f"{table}Search"
+    column_list = ", ".join(columns)
+    new_values = ", ".join(f"new.{column}" for column in columns)
+    return f"""CREATE TRIGGER IF NOT EXISTS {search}_ai AFTER INSERT ON {table} BEGIN
+                INSERT INTO {search} (rowid, {column_list}) VALUES (new.id, {new_values});
+            END"""
+
+def _fts_statements(table, columns):
+    # External-content FTS5 index over table, kept in sync by triggers.
+    search = f"{table}Search"
+    column_list = ", ".join(columns)
+    new_values = ", ".join(f"new.{column}" for column in columns)
+    old_values = ", ".join(f"old.{column}" for column in columns)
+    return [
+        f"""CREATE VIRTUAL TABLE IF NOT EXISTS {search} USING fts5(
+                {column_list}, content='{table}', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2', prefix='2 3 4')""",
+        _fts_insert_trigger(table, columns),
+        f"""CREATE TRIGGER IF NOT EXISTS {search}_ad AFTER DELETE ON {table} BEGIN
+                INSERT INTO {search} ({search}, rowid, {column_list}) VALUES ('delete', old.id, {old_values});
+            END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {search}_au AFTER UPDATE ON {table} BEGIN
+                INSERT INTO {search} ({search}, rowid, {column_list}) VALUES ('delete', old.id, {old_values});
+                INSERT INTO {search} (rowid, {column_list}) VALUES (new.id, {new_values});
+            END""",
+        f"INSERT INTO {search} ({search}) VALUES ('rebuild')",
+    ]
+
+PURCHASE_STATUSES = ["Pending", "Received", "Cancelled"]
+SALES_STATUSES = ["Pending", "Shipped", "Completed"]
+# Order statuses at which the goods have physically moved.
+PURCHASE_POSTED_STATUSES = ("Received",)
+SALES_POSTED_STATUSES = ("Shipped", "Completed")
+
+STOCK_MOVEMENTS_APPLY_TRIGGER = """CREATE TRIGGER IF NOT EXISTS stockmovements_apply AFTER INSERT ON StockMovements BEGIN
+                INSERT OR IGNORE INTO StockLevels (item_id, quantity) VALUES (new.item_id, 0);
+                UPDATE StockLevels SET quantity = quantity + new.quantity WHERE item_id = new.item_id;
+            END"""
+STOCK_MOVEMENTS_NO_DELETE_TRIGGER = """CREATE TRIGGER IF NOT EXISTS stockmovements_no_delete BEFORE DELETE ON StockMovements BEGIN
+                SELECT RAISE(ABORT, 'stock movements are append-only');
+            END"""
+
+# Lookup tables cached by reference_data, with the query that loads each.
+REFERENCE_TABLES = {
+    "Categories": "SELECT id, name FROM Categories ORDER BY name",
+    "Suppliers": "SELECT id, name FROM Suppliers WHERE archived = 0 ORDER BY name",
+    "Customers": "SELECT id, name FROM Customers WHERE archived = 0 ORDER BY name",
+}
+
+def _reference_version_triggers(table):
+    # Counts every change to table in ReferenceVersions.
+    return [f"""CREATE TRIGGER IF NOT EXISTS {table.lower()}_version_{event.lower()} AFTER {event} ON {table} BEGIN
+                    UPDATE ReferenceVersions SET version = version + 1 WHERE table_name = '{table}';
+                END""" for event in ("INSERT", "UPDATE", "DELETE")]
+
+def _ledger_triggers(order_table, item_table, posted_statuses, sign, reason):
+    # Post an order's lines to StockMovements when it enters a posted status,
+    # reverse them when it leaves one, and keep lines added, changed or
+    # removed on an already posted order in step.
+    prefix = order_table.lower()
+    posted = ", ".join(f"'{status}'" for status in posted_statuses)
+    now = "datetime('now', 'localtime')"
+    is_posted = f"(SELECT status FROM {order_table} WHERE id = {{row}}.order_id) IN ({posted})"
+    return [
+        f"""CREATE TRIGGER IF NOT EXISTS {prefix}_post_stock AFTER UPDATE OF status ON {order_table}
+            WHEN new.status IN ({posted}) AND COALESCE(old.status, '') NOT IN ({posted}) BEGIN
+                INSERT INTO StockMovements (item_id, quantity, movement_date, reason, order_id)
+                SELECT item_id, {sign} quantity, {now}, '{reason}', order_id FROM {item_table} WHERE order_id = new.id;
+            END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {prefix}_unpost_stock AFTER UPDATE OF status ON {order_table}
+            WHEN old.status IN ({posted}) AND COALESCE(new.status, '') NOT IN ({posted}) BEGIN
+                INSERT INTO StockMovements (item_id, quantity, movement_date, reason, order_id)
+                SELECT item_id, -({sign} quantity), {now}, '{reason} reversal', order_id FROM {item_table} WHERE order_id = new.id;
+            END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {prefix}_line_insert_stock AFTER INSERT ON {item_table}
+            WHEN {is_posted.format(row="new")} BEGIN
+                INSERT INTO StockMovements (item_id, quantity, movement_date, reason, order_id)
+                VALUES (new.item_id, {sign} new.quantity, {now}, '{reason}', new.order_id);
+            END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {prefix}_line_update_stock AFTER UPDATE OF item_id, quantity ON {item_table}
+            WHEN {is_posted.format(row="new")} BEGIN
+                INSERT INTO StockMovements (item_id, quantity, movement_date, reason, order_id)
+                VALUES (old.item_id, -({sign} old.quantity), {now}, '{reason} reversal', old.order_id);
+                INSERT INTO StockMovements (item_id, quantity, movement_date, reason, order_id)
+                VALUES (new.item_id, {sign} new.quantity, {now}, '{reason}', new.order_id);
+            END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {prefix}_line_delete_stock AFTER DELETE ON {item_table}
+            WHEN {is_posted.format(row="old")} BEGIN
+                INSERT INTO StockMovements (item_id, quantity, movement_date, reason, order_id)
+                VALUES (old.item_id, -({sign} old.quantity), {now}, '{reason} reversal', old.order_id);
+            END""",
+    ]
+
+ORDER_TOTAL_COLUMNS = ("line_count", "subtotal", "total")
+# Orders whose stored totals differ from their lines by more than this.
+ORDER_TOTAL_TOLERANCE = 0.005
+
+def _order_line_totals(item_table, order_id):
+    # line_count, subtotal and total of one order, computed from its lines.
+    amount = "ROUND(COALESCE(SUM(COALESCE(quantity, 0) * COALESCE(price, 0)), 0), 2)"
+    return f"SELECT COUNT(*), {amount}, {amount} FROM {item_table} WHERE order_id = {order_id}"
+
+def _order_totals_statements(order_table, item_table):
+    # Denormalized line_count, subtotal and total on each order, adjusted by
+    # the change in every line inserted, updated or deleted. total is
+    # subtotal for now; it is stored so it can be indexed. Amounts are kept
+    # rounded to cents so repeated adjustments cannot drift.
+    prefix = order_table.lower()
+    columns = ", ".join(ORDER_TOTAL_COLUMNS)
+    return [
+        f"ALTER TABLE {order_table} ADD COLUMN line_count INTEGER NOT NULL DEFAULT 0",
+        f"ALTER TABLE {order_table} ADD COLUMN subtotal REAL NOT NULL DEFAULT 0",
+        f"ALTER TABLE {order_table} ADD COLUMN total REAL NOT NULL DEFAULT 0",
+        f"UPDATE {order_table} SET ({columns}) = ({_order_line_totals(item_table, f'{order_table}.id')})",
+        f"CREATE INDEX IF NOT EXISTS idx_{prefix}_total ON {order_table} (total)",
+    ] + _order_totals_triggers(order_table, item_table)
+
+def _order_totals_triggers(order_table, item_table):
+    prefix = order_table.lower()
+    amount = "COALESCE({row}.quantity, 0) * COALESCE({row}.price, 0)"
+    def adjust(row, sign):
+        value = amount.format(row=row)
+        return f"""UPDATE {order_table} SET line_count = line_count {sign} 1,
+                        subtotal = ROUND(subtotal {sign} {value}, 2), total = ROUND(total {sign} {value}, 2)
+                    WHERE id = {row}.order_id;"""
+    return [
+        f"""CREATE TRIGGER IF NOT EXISTS {prefix}_line_insert_totals AFTER INSERT ON {item_table} BEGIN
+                {adjust("new", "+")}
+            END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {prefix}_line_update_totals AFTER UPDATE OF order_id, quantity, price ON {item_table} BEGIN
+                {adjust("old", "-")}
+                {adjust("new", "+")}
+            END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {prefix}_line_delete_totals AFTER DELETE ON {item_table} BEGIN
+                {adjust("old", "-")}
+            END""",
+    ]
+
+def _fts_update_trigger(table, columns):
+    # Reindexes a row only when an indexed column changes.
+    search = f"{table}Search"
+    column_list = ", ".join(columns)
+    new_values = ", ".join(f"new.{column}" for column in columns)
+    old_values = ", ".join(f"old.{column}" for column in columns)
+    return [
+        f"DROP TRIGGER IF EXISTS {search}_au",
+        f"""CREATE TRIGGER {search}_au AFTER UPDATE OF {column_list} ON {table} BEGIN
+                INSERT INTO {search} ({search}, rowid, {column_list}) VALUES ('delete', old.id, {old_values});
+                INSERT INTO {search} (rowid, {column_list}) VALUES (new.id, {new_values});
+            END""",
+    ]
+
+def _rebuild_table(table, create, columns, keep_rows="1"):
+    # SQLite cannot change a table's constraints in place: copy the rows
+    # (those matching keep_rows) into a new table made by create, keep the
+    # AUTOINCREMENT counter, and swap it in. Dropping the old table drops its
+    # indexes and triggers; the migration creates them again afterwards.
+    # Runs with foreign keys off and legacy_alter_table on, so nothing
+    # cascades and the rename leaves references from other tables alone.
+    column_list = ", ".join(name for name, value in columns)
+    values = ", ".join(value for name, value in columns)
+    return [
+        create.format(table=f"{table}_rebuild"),
+        f"INSERT INTO {table}_rebuild ({column_list}) SELECT {values} FROM {table} WHERE {keep_rows}",
+        f"DELETE FROM sqlite_sequence WHERE name = '{table}_rebuild'",
+        f"INSERT INTO sqlite_sequence (name, seq) SELECT '{table}_rebuild', seq FROM sqlite_sequence WHERE name = '{table}'",
+        f"DROP TABLE {table}",
+        f"ALTER TABLE {table}_rebuild RENAME TO {table}",
+    ]
+
+def _foreign_key_check(*tables):
+    # Migration step that fails if any row of tables breaks a foreign key.
+    def check(query):
+        for table in tables:
+            if not query.exec_(f"PRAGMA foreign_key_check({table})") or query.next():
+                return False
+        return True
+    return check
+
+ORDER_LINES_TABLE = """CREATE TABLE {{table}} (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                order_id INTEGER,
+                item_id INTEGER,
+                quantity INTEGER,
+                price REAL,
+                FOREIGN KEY (order_id) REFERENCES {order_table}(id) ON DELETE CASCADE,
+                FOREIGN KEY (item_id) REFERENCES StockItems(id))"""
+STOCK_LEVELS_TABLE = """CREATE TABLE {table} (
+                item_id INTEGER PRIMARY KEY,
+                quantity INTEGER NOT NULL,
+                reorder_point INTEGER NOT NULL DEFAULT 10,
+                safety_stock INTEGER NOT NULL DEFAULT 0,
+                FOREIGN KEY (item_id) REFERENCES StockItems(id) ON DELETE CASCADE)"""
+# Rows that can be archived instead of deleted while orders or stock
+# history still refer to them.
+ARCHIVABLE_TABLES = ("StockItems", "Suppliers", "Customers")
+
+# Columns whose changes count as a new version of the row. Stock quantity is
+# left out: it only moves by relative ledger adjustments, which never
+# conflict with each other.
+VERSIONED_COLUMNS = {
+    "StockItems": ("sku", "name", "description", "category_id", "unit_price"),
+    "StockLevels": ("reorder_point", "safety_stock"),
+    "PurchaseOrders": ("supplier_id", "order_date", "status"),
+    "SalesOrders": ("customer_id", "order_date", "status"),
+}
+
+def _row_version_statements(table, columns):
+    # Writers that compare and swap bump version themselves; the trigger
+    # bumps it for any other update of the versioned columns.
+    return [
+        f"ALTER TABLE {table} ADD COLUMN version INTEGER NOT NULL DEFAULT 0",
+        f"""CREATE TRIGGER IF NOT EXISTS {table.lower()}_version AFTER UPDATE OF {", ".join(columns)} ON {table}
+            WHEN new.version = old.version BEGIN
+                UPDATE {table} SET version = version + 1 WHERE rowid = new.rowid;
+            END""",
+    ]
+
+# Tables whose row changes are logged for the views showing them.
+CHANGE_LOG_TABLES = ("StockItems", "Suppliers", "Customers", "PurchaseOrders", "SalesOrders")
+
+def _change_log_triggers(table):
+    # One ChangeLog row per touched row: a new change replaces the row's
+    # entry with one at the end of the log. structural marks rows inserted
+    # or deleted since the entry was made, which move other rows rather than
+    # just changing in place; an update keeps the flag it finds.
+    log = "INSERT OR REPLACE INTO ChangeLog (table_name, row_id, structural) VALUES"
+    sticky = f"COALESCE((SELECT structural FROM ChangeLog WHERE table_name = '{table}' AND row_id = new.id), 0)"
+    prefix = table.lower()
+    return [
+        f"""CREATE TRIGGER IF NOT EXISTS {prefix}_log_insert AFTER INSERT ON {table} BEGIN
+                {log} ('{table}', new.id, 1);
+            END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {prefix}_log_update AFTER UPDATE ON {table} BEGIN
+                {log} ('{table}', new.id, {sticky});
+            END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {prefix}_log_delete AFTER DELETE ON {table} BEGIN
+                {log} ('{table}', old.id, 1);
+            END""",
+    ]
+
+def _order_lines_rebuild(order_table, item_table):
+    # Lines of orders that no longer exist are dropped; lines of deleted
+    # items are kept without an item, as invoices already show them.
+    prefix = order_table.lower()
+    columns = [("id", "id"), ("order_id", "order_id"),
+               ("item_id", "CASE WHEN item_id IN (SELECT id FROM StockItems) THEN item_id END"),
+               ("quantity", "quantity"), ("price", "price")]
+    return (_rebuild_table(item_table, ORDER_LINES_TABLE.format(order_table=order_table), columns,
+                           f"order_id IN (SELECT id FROM {order_table})")
+            + [f"CREATE INDEX IF NOT EXISTS idx_{item_table.lower()}_order_id ON {item_table} (order_id)",
+               f"CREATE INDEX IF NOT EXISTS idx_{item_table.lower()}_item_id ON {item_table} (item_id)"])
+
+# Each entry upgrades the schema by one version; PRAGMA user_version records
+# how many have been applied. Steps are SQL strings or callables taking a
+# QSqlQuery. Only ever append to this list.
+MIGRATIONS = [
+    # 1: base schema
+    [
+        """CREATE TABLE IF NOT EXISTS Categories (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL)""",
+        """CREATE TABLE IF NOT EXISTS StockItems (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL,
+                description TEXT,
+                category_id INTEGER,
+                unit_price REAL,
+                FOREIGN KEY (category_id) REFERENCES Categories(id))""",
+        """CREATE TABLE IF NOT EXISTS StockLevels (
+                item_id INTEGER PRIMARY KEY,
+                quantity INTEGER NOT NULL,
+                FOREIGN KEY (item_id) REFERENCES StockItems(id))""",
+        """CREATE TABLE IF NOT EXISTS Suppliers (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL,
+                contact_person TEXT,
+                phone TEXT,
+                email TEXT,
+                address TEXT)""",
+        """CREATE TABLE IF NOT EXISTS Customers (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL,
+                contact_person TEXT,
+                phone TEXT,
+                email TEXT,
+                address TEXT)""",
+        """CREATE TABLE IF NOT EXISTS PurchaseOrders (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                supplier_id INTEGER,
+                order_date TEXT,
+                status TEXT,
+                FOREIGN KEY (supplier_id) REFERENCES Suppliers(id))""",
+        """CREATE TABLE IF NOT EXISTS PurchaseOrderItems (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                order_id INTEGER,
+                item_id INTEGER,
+                quantity INTEGER,
+                price REAL,
+                FOREIGN KEY (order_id) REFERENCES PurchaseOrders(id),
+                FOREIGN KEY (item_id) REFERENCES StockItems(id))""",
+        """CREATE TABLE IF NOT EXISTS SalesOrders (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                customer_id INTEGER,
+                order_date TEXT,
+                status TEXT,
+                FOREIGN KEY (customer_id) REFERENCES Customers(id))""",
+        """CREATE TABLE IF NOT EXISTS SalesOrderItems (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                order_id INTEGER,
+                item_id INTEGER,
+                quantity INTEGER,
+                price REAL,
+                FOREIGN KEY (order_id) REFERENCES SalesOrders(id),
+                FOREIGN KEY (item_id) REFERENCES StockItems(id))""",
+        """CREATE TABLE IF NOT EXISTS InvoiceSettings (
+                key TEXT PRIMARY KEY,
+                value TEXT)""",
+        _seed_invoice_settings,
+    ],
+    # 2: indexes on join and filter columns
+    [
+        "CREATE INDEX IF NOT EXISTS idx_stockitems_category_id ON StockItems (category_id)",
+        "CREATE INDEX IF NOT EXISTS idx_stocklevels_quantity ON StockLevels (quantity)",
+        "CREATE INDEX IF NOT EXISTS idx_purchaseorders_supplier_id ON PurchaseOrders (supplier_id)",
+        "CREATE INDEX IF NOT EXISTS idx_purchaseorders_order_date ON PurchaseOrders (order_date)",
+        "CREATE INDEX IF NOT EXISTS idx_purchaseorderitems_order_id ON PurchaseOrderItems (order_id)",
+        "CREATE INDEX IF NOT EXISTS idx_purchaseorderitems_item_id ON PurchaseOrderItems (item_id)",
+        "CREATE INDEX IF NOT EXISTS idx_salesorders_customer_id ON SalesOrders (customer_id)",
+        "CREATE INDEX IF NOT EXISTS idx_salesorders_order_date ON SalesOrders (order_date)",
+        "CREATE INDEX IF NOT EXISTS idx_salesorderitems_order_id ON SalesOrderItems (order_id)",
+        "CREATE INDEX IF NOT EXISTS idx_salesorderitems_item_id ON SalesOrderItems (item_id)",
+    ],
+    # 3: name indexes so the list tabs can be sorted by name
+    [
+        "CREATE INDEX IF NOT EXISTS idx_stockitems_name ON StockItems (name)",
+        "CREATE INDEX IF NOT EXISTS idx_suppliers_name ON Suppliers (name)",
+        "CREATE INDEX IF NOT EXISTS idx_customers_name ON Customers (name)",
+    ],
+    # 4: full-text search
+    _fts_statements("StockItems", SEARCH_COLUMNS["StockItems"])
+    + _fts_statements("Customers", SEARCH_COLUMNS["Customers"])
+    + _fts_statements("Suppliers", SEARCH_COLUMNS["Suppliers"]),
+    # 5: per-item reorder points; the partial index holds exactly the items
+    # below their reorder point, so the low stock report reads O(low items)
+    [
+        "ALTER TABLE StockLevels ADD COLUMN reorder_point INTEGER NOT NULL DEFAULT 10",
+        "ALTER TABLE StockLevels ADD COLUMN safety_stock INTEGER NOT NULL DEFAULT 0",
+        "CREATE INDEX IF NOT EXISTS idx_stocklevels_below_reorder ON StockLevels (item_id) WHERE quantity < reorder_point",
+    ],
+    # 6: append-only stock ledger; StockLevels.quantity becomes the balance
+    # materialized from it by trigger, and StockSnapshots holds periodic
+    # copies of all balances for point-in-time queries
+    [
+        """CREATE TABLE IF NOT EXISTS StockMovements (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                item_id INTEGER NOT NULL,
+                quantity INTEGER NOT NULL,
+                movement_date TEXT NOT NULL,
+                reason TEXT NOT NULL,
+                order_id INTEGER,
+                FOREIGN KEY (item_id) REFERENCES StockItems(id))""",
+        "CREATE INDEX IF NOT EXISTS idx_stockmovements_item_date ON StockMovements (item_id, movement_date)",
+        """CREATE TABLE IF NOT EXISTS StockSnapshots (
+                snapshot_date TEXT NOT NULL,
+                item_id INTEGER NOT NULL,
+                quantity INTEGER NOT NULL,
+                last_movement_id INTEGER NOT NULL,
+                PRIMARY KEY (snapshot_date, item_id)) WITHOUT ROWID""",
+        # Opening balances, posted before the balance trigger exists.
+        """INSERT INTO StockMovements (item_id, quantity, movement_date, reason)
+           SELECT item_id, quantity, datetime('now', 'localtime'), 'opening' FROM StockLevels WHERE quantity != 0""",
+        STOCK_MOVEMENTS_APPLY_TRIGGER,
+        """CREATE TRIGGER IF NOT EXISTS stockmovements_no_update BEFORE UPDATE ON StockMovements BEGIN
+                SELECT RAISE(ABORT, 'stock movements are append-only');
+            END""",
+        STOCK_MOVEMENTS_NO_DELETE_TRIGGER,
+    ]
+    + _ledger_triggers("PurchaseOrders", "PurchaseOrderItems", PURCHASE_POSTED_STATUSES, "", "purchase")
+    + _ledger_triggers("SalesOrders", "SalesOrderItems", SALES_POSTED_STATUSES, "-", "sale"),
+    # 7: optional, unique SKU per item and a case-insensitive name index,
+    # both read by range scans in the item picker
+    [
+        "ALTER TABLE StockItems ADD COLUMN sku TEXT",
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_stockitems_sku ON StockItems (sku)",
+        "CREATE INDEX IF NOT EXISTS idx_stockitems_name_nocase ON StockItems (name COLLATE NOCASE)",
+    ],
+    # 8: per-table change counters for the reference data cache
+    [
+        """CREATE TABLE IF NOT EXISTS ReferenceVersions (
+                table_name TEXT PRIMARY KEY,
+                version INTEGER NOT NULL DEFAULT 0) WITHOUT ROWID""",
+        "INSERT OR IGNORE INTO ReferenceVersions (table_name) VALUES " + ", ".join(
+            f"('{table}')" for table in REFERENCE_TABLES),
+    ]
+    + [trigger for table in REFERENCE_TABLES for trigger in _reference_version_triggers(table)],
+    # 9: stored order totals, maintained from the order lines by trigger
+    _order_totals_statements("PurchaseOrders", "PurchaseOrderItems")
+    + _order_totals_statements("SalesOrders", "SalesOrderItems"),
+    # 10: foreign keys are enforced from here on. Stock levels and order
+    # lines go with their item or order (each child column is indexed, so a
+    # cascade is an index lookup per parent row); items, suppliers and
+    # customers still referenced by orders or stock history cannot be
+    # deleted, only archived. Orphaned rows are removed on the way.
+    ["PRAGMA legacy_alter_table = ON"]
+    + _rebuild_table("StockLevels", STOCK_LEVELS_TABLE,
+                     [(name, name) for name in ("item_id", "quantity", "reorder_point", "safety_stock")],
+                     "item_id IN (SELECT id FROM StockItems)")
+    + [
+        "CREATE INDEX IF NOT EXISTS idx_stocklevels_quantity ON StockLevels (quantity)",
+        "CREATE INDEX IF NOT EXISTS idx_stocklevels_below_reorder ON StockLevels (item_id) WHERE quantity < reorder_point",
+    ]
+    + _order_lines_rebuild("PurchaseOrders", "PurchaseOrderItems")
+    + _order_lines_rebuild("SalesOrders", "SalesOrderItems")
+    + _ledger_triggers("PurchaseOrders", "PurchaseOrderItems", PURCHASE_POSTED_STATUSES, "", "purchase")
+    + _ledger_triggers("SalesOrders", "SalesOrderItems", SALES_POSTED_STATUSES, "-", "sale")
+    + _order_totals_triggers("PurchaseOrders", "PurchaseOrderItems")
+    + _order_totals_triggers("SalesOrders", "SalesOrderItems")
+    + ["PRAGMA legacy_alter_table = OFF",
+       _foreign_key_check("StockLevels", "PurchaseOrderItems", "SalesOrderItems")]
+    + [f"ALTER TABLE {table} ADD COLUMN archived INTEGER NOT NULL DEFAULT 0" for table in ARCHIVABLE_TABLES]
+    + [statement for table in ARCHIVABLE_TABLES for statement in _fts_update_trigger(table, SEARCH_COLUMNS[table])],
+    # 11: row versions for optimistic concurrency between workstations
+    [statement for table, columns in VERSIONED_COLUMNS.items()
+     for statement in _row_version_statements(table, columns)],
+    # 12: log of changed rows, read by the views to refresh just those rows
+    [
+        """CREATE TABLE IF NOT EXISTS ChangeLog (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                table_name TEXT NOT NULL,
+                row_id INTEGER NOT NULL,
+                structural INTEGER NOT NULL,
+                UNIQUE (table_name, row_id))""",
+    ]
+    + [trigger for table in CHANGE_LOG_TABLES for trigger in _change_log_triggers(table)],
+    # 13: movements of an item by id, so stock_as_of replays only those
+    # recorded after the snapshot instead of the item's whole history.
+    # Movement dates come from each workstation's clock, so the seek is on
+    # id rather than on movement_date.
+    [
+        "CREATE INDEX IF NOT EXISTS idx_stockmovements_item_id ON StockMovements (item_id, id)",
+    ],
+    # 14: references left dangling by deletes made before foreign keys were
+    # enforced, which migration 10 did not clear. Items and orders are kept
+    # without the category, supplier or customer, as order lines are kept
+    # without their item; the ledger and snapshots of an item that is gone
+    # (its stock levels went in migration 10) go too.
+    [
+        "UPDATE StockItems SET category_id = NULL WHERE category_id NOT IN (SELECT id FROM Categories)",
+        "UPDATE PurchaseOrders SET supplier_id = NULL WHERE supplier_id NOT IN (SELECT id FROM Suppliers)",
+        "UPDATE SalesOrders SET customer_id = NULL WHERE customer_id NOT IN (SELECT id FROM Customers)",
+        "DROP TRIGGER IF EXISTS stockmovements_no_delete",
+        "DELETE FROM StockMovements WHERE item_id NOT IN (SELECT id FROM StockItems)",
+        STOCK_MOVEMENTS_NO_DELETE_TRIGGER,
+        "DELETE FROM StockSnapshots WHERE item_id NOT IN (SELECT id FROM StockItems)",
+        _foreign_key_check("StockItems", "PurchaseOrders", "SalesOrders", "StockMovements"),
+    ],
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+def schema_version(db):
+    query = SqlQuery(db)
+    if query.exec_("PRAGMA user_version") and query.next():
+        return query.value(0)
+    return None
+
+def migrate_database(db):
+    version = schema_version(db)
+    if version is None:
+        return False
+    if version >= SCHEMA_VERSION:
+        return True
+    query = SqlQuery(db)
+    # Table rebuilds must not fire ON DELETE actions, and foreign_keys cannot
+    # be changed inside a transaction.
+    query.exec_("PRAGMA foreign_keys = OFF")
+    try:
+        for number in range(version + 1, SCHEMA_VERSION + 1):
+            if not db.transaction():
+                return False
+            for step in MIGRATIONS[number - 1]:
+                ok = step(query) if callable(step) else query.exec_(step)
+                if not ok:
+                    db.rollback()
+                    return False
+            if not query.exec_(f"PRAGMA user_version = {number}") or not db.commit():
+                db.rollback()
+                return False
+    finally:
+        query.exec_("PRAGMA foreign_keys = ON")
+    return True
+
+# --- Connection Profile ---
+# Pragmas applied to every connection when it is opened. Select one with the
+# STOCK_DB_PROFILE environment variable.
+DB_PROFILES = {
+    "production": {
+        "busy_timeout": 5000,
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -65536,  # negative means KiB, so 64 MiB
+        "mmap_size": 268435456,
+        "temp_store": "MEMORY",
+        "wal_autocheckpoint": 1000,
+    },
+    "durable": {
+        "busy_timeout": 5000,
+        "journal_mode": "WAL",
+        "synchronous": "FULL",
+        "cache_size": -65536,
+        "mmap_size": 268435456,
+        "temp_store": "MEMORY",
+        "wal_autocheckpoint": 1000,
+    },
+    "default": {},
+}
+DB_PROFILE = os.environ.get("STOCK_DB_PROFILE", "production")
+# Checkpoint policy: SQLite checkpoints automatically every wal_autocheckpoint
+# pages, the main window runs a PASSIVE checkpoint on this interval, and the
+# WAL is truncated when the window closes.
+WAL_CHECKPOINT_INTERVAL_MS = 5 * 60 * 1000
+
+def db_profile_error():
+    # Message for a STOCK_DB_PROFILE that names no profile, else None.
+    if DB_PROFILE in DB_PROFILES:
+        return None
+    return f"Unknown STOCK_DB_PROFILE {DB_PROFILE!r}; valid profiles are {', '.join(DB_PROFILES)}"
+
+def active_db_profile():
+    error = db_profile_error()
+    if error:
+        raise ValueError(error)
+    return DB_PROFILES[DB_PROFILE]
+
+def profile_pragmas(profile=None):
+    # Foreign keys are enforced on every connection, whatever the profile.
+    if profile is None:
+        profile = active_db_profile()
+    return ["PRAGMA foreign_keys = ON"] + [f"PRAGMA {name} = {value}" for name, value in profile.items()]
+
+def apply_db_profile(db, profile=None):
+    query = SqlQuery(db)
+    for statement in profile_pragmas(profile):
+        if not query.exec_(statement):
+            return False
+    return True
+
+def checkpoint_database(db=None, mode="PASSIVE"):
+    query = SqlQuery(db)
+    return query.exec_(f"PRAGMA wal_checkpoint({mode})")
+
+def connect_sqlite(path, profile=None):
+    conn = sqlite3.connect(path)
+    for statement in profile_pragmas(profile):
+        conn.execute(statement)
+    return conn
+
+def open_database(path=DB_FILENAME, connection_name=None, profile=None):
+    if connection_name is None:
+        db = QSqlDatabase.addDatabase("QSQLITE")
+    else:
+        db = QSqlDatabase.addDatabase("QSQLITE", connection_name)
+    db.setDatabaseName(path)
     if not db.open():
+        return None
+    if not apply_db_profile(db, profile):
+        db.close()
+        return None
+    return db
+
+def _bench_connection(path, name, profile, commits, rows, reads):
+    db = open_database(path, name, profile)
+    query = SqlQuery(db)
+    query.exec_("CREATE TABLE bench (id INTEGER PRIMARY KEY, name TEXT, quantity INTEGER)")
+    query.prepare("INSERT INTO bench (name, quantity) VALUES (?, ?)")
+    start = time.perf_counter()
+    for i in range(commits):
+        query.addBindValue(f"Item {i}")
+        query.addBindValue(i)
+        query.exec_()
+    commit_elapsed = time.perf_counter() - start
+    start = time.perf_counter()
+    db.transaction()
+    for i in range(rows):
+        query.addBindValue(f"Item {i}")
+        query.addBindValue(i)
+        query.exec_()
+    db.commit()
+    insert_elapsed = time.perf_counter() - start
+    total = commits + rows
+    ids = [random.randint(1, total) for _ in range(reads)]
+    query.prepare("SELECT name, quantity FROM bench WHERE id = ?")
+    start = time.perf_counter()
+    for item_id in ids:
+        query.addBindValue(item_id)
+        query.exec_()
+        query.next()
+    read_elapsed = time.perf_counter() - start
+    query.finish()
+    del query
+    db.close()
+    del db
+    QSqlDatabase.removeDatabase(name)
+    return {
+        "commits_per_s": round(commits / commit_elapsed),
+        "inserts_per_s": round(rows / insert_elapsed),
+        "read_latency_us": round(read_elapsed * 1e6 / reads, 1),
+    }
+
+def benchmark_db_profile(commits=500, rows=100000, reads=20000):
+    # Autocommitted single-row inserts, bulk inserts in one transaction and
+    # point reads by primary key, once with SQLite defaults and once with
+    # the configured profile (production, if that is the defaults).
+    active_db_profile()
+    profile = DB_PROFILE if DB_PROFILE != "default" else "production"
+    results = {"profile": profile}
+    with tempfile.TemporaryDirectory() as directory:
+        for label in ("default", profile):
+            path = os.path.join(directory, f"{label}.db")
+            results[label] = _bench_connection(path, f"bench_{label}", DB_PROFILES[label],
+                                               commits, rows, reads)
+    return results
+
+def setup_database():
+    db = open_database()
+    if db is None:
         QMessageBox.critical(None, "Error", "Could not open database")
         return False
+    if not migrate_database(db):
+        QMessageBox.critical(None, "Error", "Could not upgrade the database schema")
+        return False
     
-    query = QSqlQuery()
-    # Create tables
-    query.exec_("""CREATE TABLE IF NOT EXISTS Categories (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    name TEXT NOT NULL)""")
-    query.exec_("""CREATE TABLE IF NOT EXISTS StockItems (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    name TEXT NOT NULL,
-                    description TEXT,
-                    category_id INTEGER,
-                    unit_price REAL,
-                    FOREIGN KEY (category_id) REFERENCES Categories(id))""")
-    query.exec_("""CREATE TABLE IF NOT EXISTS StockLevels (
-                    item_id INTEGER PRIMARY KEY,
-                    quantity INTEGER NOT NULL,
-                    FOREIGN KEY (item_id) REFERENCES StockItems(id))""")
-    query.exec_("""CREATE TABLE IF NOT EXISTS Suppliers (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    name TEXT NOT NULL,
-                    contact_person TEXT,
-                    phone TEXT,
-                    email TEXT,
-                    address TEXT)""")
-    query.exec_("""CREATE TABLE IF NOT EXISTS Customers (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    name TEXT NOT NULL,
-                    contact_person TEXT,
-                    phone TEXT,
-                    email TEXT,
-                    address TEXT)""")
-    query.exec_("""CREATE TABLE IF NOT EXISTS PurchaseOrders (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    supplier_id INTEGER,
-                    order_date TEXT,
-                    status TEXT,
-                    FOREIGN KEY (supplier_id) REFERENCES Suppliers(id))""")
-    query.exec_("""CREATE TABLE IF NOT EXISTS PurchaseOrderItems (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    order_id INTEGER,
-                    item_id INTEGER,
-                    quantity INTEGER,
-                    price REAL,
-                    FOREIGN KEY (order_id) REFERENCES PurchaseOrders(id),
-                    FOREIGN KEY (item_id) REFERENCES StockItems(id))""")
-    query.exec_("""CREATE TABLE IF NOT EXISTS SalesOrders (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    customer_id INTEGER,
-                    order_date TEXT,
-                    status TEXT,
-                    FOREIGN KEY (customer_id) REFERENCES Customers(id))""")
-    query.exec_("""CREATE TABLE IF NOT EXISTS SalesOrderItems (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    order_id INTEGER,
-                    item_id INTEGER,
-                    quantity INTEGER,
-                    price REAL,
-                    FOREIGN KEY (order_id) REFERENCES SalesOrders(id),
-                    FOREIGN KEY (item_id) REFERENCES StockItems(id))""")
-    
+    query = SqlQuery()
     # Insert sample data if tables are empty
     if not query.exec_("SELECT 1 FROM Categories LIMIT 1"):
         query.exec_("INSERT INTO Categories (name) VALUES ('Electronics')")
@@ -89,6 +942,1058 @@ def setup_database():
     
     return True
 
+# --- Data Events ---
+class DataEvents(QObject):
+    # Application-wide notifications that let views refresh themselves after
+    # another part of the app has changed the data they show.
+    stock_changed = pyqtSignal()
+
+data_events = DataEvents()
+
+# --- Background Queries ---
+# Reads run on QThreadPool workers, each with its own named QSqlDatabase
+# connection (WAL lets them read while the GUI thread writes). A request is
+# a function fn(db, cancelled, *args) run on a worker; its result is
+# delivered to on_result on the GUI thread via a queued signal. Requests
+# on the same channel supersede each other: submitting cancels the older
+# ones, which are skipped if not started yet and have their result dropped
+# otherwise. Row loops poll cancelled() so stale reads stop early.
+QUERY_WORKER_THREADS = 2
+
+def new_query(db=None):
+    return SqlQuery(QSqlDatabase.database() if db is None else db)
+
+def worker_database(path):
+    name = f"query_worker_{threading.get_ident()}"
+    if QSqlDatabase.contains(name):
+        return QSqlDatabase.database(name)
+    db = open_database(path, name)
+    if db is None:
+        raise RuntimeError(f"could not open {path} on a worker thread")
+    return db
+
+def fetch_rows(db, cancelled, sql, params=()):
+    query = SqlQuery(db)
+    query.setForwardOnly(True)
+    query.prepare(sql)
+    for value in params:
+        query.addBindValue(value)
+    if not query.exec_():
+        raise RuntimeError(query.lastError().text())
+    record = query.record()
+    columns = [record.fieldName(i) for i in range(record.count())]
+    rows = []
+    for values in query_rows(query):
+        rows.append(values)
+        if len(rows) % 1024 == 0 and cancelled():
+            return None
+    return columns, rows
+
+class QueryTaskSignals(QObject):
+    finished = pyqtSignal(int, object)
+    failed = pyqtSignal(int, str)
+
+class QueryTask(QRunnable):
+    def __init__(self, service, request_id, fn, args, site=None):
+        super().__init__()
+        self.service = service
+        self.request_id = request_id
+        self.fn = fn
+        self.args = args
+        self.site = site
+    
+    def run(self):
+        cancelled = lambda: self.service.is_cancelled(self.request_id)
+        if cancelled():
+            return
+        query_stats._local.task_site = self.site
+        try:
+            result = self.fn(worker_database(self.service.db_path), cancelled, *self.args)
+        except Exception as e:
+            self.service.signals.failed.emit(self.request_id, str(e))
+            return
+        finally:
+            query_stats._local.task_site = None
+            query_stats.end_action()
+        self.service.signals.finished.emit(self.request_id, result)
+
+class QueryService(QObject):
+    def __init__(self, max_threads=QUERY_WORKER_THREADS, parent=None):
+        super().__init__(parent)
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(max_threads)
+        # Worker threads keep their connection, so they are never retired.
+        self.pool.setExpiryTimeout(-1)
+        self.db_path = None
+        self.signals = QueryTaskSignals(self)
+        self.signals.finished.connect(self._finished)
+        self.signals.failed.connect(self._failed)
+        self._next_id = 0
+        # request id -> (channel, on_result, on_error)
+        self._pending = {}
+    
+    def submit(self, fn, *args, on_result=None, on_error=None, channel=None):
+        if channel is not None:
+            self.cancel_channel(channel)
+        if self.db_path is None:
+            self.db_path = QSqlDatabase.database().databaseName()
+        self._next_id += 1
+        request_id = self._next_id
+        self._pending[request_id] = (channel, on_result, on_error)
+        self.pool.start(QueryTask(self, request_id, fn, args, _call_site(1)))
+        return request_id
+    
+    def fetch(self, sql, params=(), on_result=None, on_error=None, channel=None):
+        # on_result receives (columns, rows).
+        return self.submit(fetch_rows, sql, list(params), on_result=on_result, on_error=on_error,
+                           channel=channel)
+    
+    def cancel(self, request_id):
+        self._pending.pop(request_id, None)
+    
+    def cancel_channel(self, channel):
+        for request_id in [request_id for request_id, (pending_channel, on_result, on_error)
+                           in self._pending.items() if pending_channel == channel]:
+            del self._pending[request_id]
+    
+    def is_cancelled(self, request_id):
+        return request_id not in self._pending
+    
+    def shutdown(self):
+        self._pending.clear()
+        self.pool.clear()
+        self.pool.waitForDone()
+    
+    def _finished(self, request_id, result):
+        entry = self._pending.pop(request_id, None)
+        if entry is not None and entry[1] is not None:
+            entry[1](result)
+    
+    def _failed(self, request_id, error):
+        entry = self._pending.pop(request_id, None)
+        if entry is None:
+            return
+        if entry[2] is not None:
+            entry[2](error)
+        else:
+            print(f"Background query failed: {error}", file=sys.stderr)
+
+query_service = QueryService()
+
+def load_combo(combo, sql, params=(), selected=None, ok_button=None):
+    # Fills combo with (data, label) rows from a background query; the combo
+    # and the dialog's OK button stay disabled until the rows arrive.
+    combo.clear()
+    combo.addItem("Loading...", None)
+    combo.setEnabled(False)
+    if ok_button is not None:
+        ok_button.setEnabled(False)
+    
+    def loaded(result):
+        columns, rows = result
+        combo.clear()
+        for data, label in rows:
+            combo.addItem(label, data)
+            if data == selected:
+                combo.setCurrentIndex(combo.count() - 1)
+        combo.setEnabled(True)
+        if ok_button is not None:
+            ok_button.setEnabled(True)
+    
+    query_service.fetch(sql, params, on_result=loaded, channel=combo)
+
+class LoadingIndicator(QLabel):
+    # Shown while a model with a loading_changed signal is fetching.
+    def __init__(self, model, parent=None):
+        super().__init__("Loading...", parent)
+        self.setStyleSheet("color: #888888;")
+        self.setVisible(model.loading)
+        model.loading_changed.connect(self.setVisible)
+
+class RowsTableModel(QAbstractTableModel):
+    # Read-only model over the rows of one background query.
+    loading_changed = pyqtSignal(bool)
+    
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.columns = []
+        self.rows = []
+        self.loading = False
+    
+    def load(self, sql, params=()):
+        self.load_rows(fetch_rows, sql, list(params))
+    
+    def load_rows(self, fn, *args):
+        # fn runs on query_service and returns (columns, rows).
+        self.loading = True
+        self.loading_changed.emit(True)
+        query_service.submit(fn, *args, on_result=self._loaded, on_error=self._failed, channel=self)
+    
+    def _loaded(self, result):
+        self.beginResetModel()
+        self.columns, self.rows = result
+        self.endResetModel()
+        self.loading = False
+        self.loading_changed.emit(False)
+    
+    def _failed(self, error):
+        self.loading = False
+        self.loading_changed.emit(False)
+        print(f"Query failed: {error}", file=sys.stderr)
+    
+    def append_rows(self, rows):
+        if not rows:
+            return
+        self.beginInsertRows(QModelIndex(), len(self.rows), len(self.rows) + len(rows) - 1)
+        self.rows.extend(rows)
+        self.endInsertRows()
+    
+    def remove_row(self, row):
+        self.beginRemoveRows(QModelIndex(), row, row)
+        del self.rows[row]
+        self.endRemoveRows()
+    
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+    
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.columns)
+    
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.columns[section]
+        return super().headerData(section, orientation, role)
+    
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role not in (Qt.DisplayRole, Qt.EditRole):
+            return None
+        return self.rows[index.row()][index.column()]
+
+def check_event_loop_responsiveness(seconds=5.0, tick_ms=50):
+    # Runs a CPU-bound query of about `seconds` through query_service while
+    # a QTimer ticks on this thread, and reports how regularly the timer was
+    # serviced. The query is a recursive count sized from a short probe.
+    count_sql = "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < ?) SELECT COUNT(*) FROM n"
+    probe_rows = 1000000
+    start = time.perf_counter()
+    fetch_rows(QSqlDatabase.database(), lambda: False, count_sql, [probe_rows])
+    rows = int(probe_rows * seconds / (time.perf_counter() - start))
+    ticks = []
+    result = {}
+    loop = QEventLoop()
+    timer = QTimer()
+    timer.setInterval(tick_ms)
+    timer.timeout.connect(lambda: ticks.append(time.perf_counter()))
+    
+    def done(value):
+        result["query_seconds"] = time.perf_counter() - query_start
+        loop.quit()
+    
+    def failed(error):
+        result["error"] = error
+        loop.quit()
+    
+    timer.start()
+    query_start = time.perf_counter()
+    query_service.fetch(count_sql, [rows], on_result=done, on_error=failed)
+    loop.exec_()
+    timer.stop()
+    if "error" in result:
+        raise RuntimeError(result["error"])
+    gaps = [later - earlier for earlier, later in zip(ticks, ticks[1:])]
+    max_gap_ms = max(gaps) * 1000 if gaps else result["query_seconds"] * 1000
+    expected = result["query_seconds"] * 1000 / tick_ms
+    return {
+        "query_seconds": round(result["query_seconds"], 2),
+        "tick_ms": tick_ms,
+        "ticks": len(ticks),
+        "expected_ticks": int(expected),
+        "max_gap_ms": round(max_gap_ms, 1),
+        # Serviced if no gap reached four intervals and most ticks fired.
+        "responsive": max_gap_ms < 4 * tick_ms and len(ticks) >= 0.8 * expected,
+    }
+
+# --- Change Feed ---
+# Notices committed changes: after a write on this connection, once control
+# is back in the event loop, and when PRAGMA data_version shows that another
+# connection (another window's worker, or another instance of the app) has
+# committed. data_changed is emitted for every such check; rows_changed
+# then carries, per table, the ChangeLog entries added since the last check
+# as {row_id: structural}, or None when there are too many to patch in. The
+# log is read on query_service so a large batch never stalls the GUI.
+DATA_VERSION_POLL_MS = 2000
+# More changed rows than this in one table and its views just reselect.
+CHANGE_FEED_MAX_ROWS = 1000
+
+def read_change_log(db, cancelled, cursor, max_rows):
+    query = SqlQuery(db)
+    query.setForwardOnly(True)
+    query.prepare("SELECT table_name, COUNT(*), MAX(id) FROM ChangeLog WHERE id > ? GROUP BY table_name")
+    query.addBindValue(cursor)
+    if not query.exec_():
+        raise RuntimeError(query.lastError().text())
+    counts = {table: (count, last_id) for table, count, last_id in query_rows(query)}
+    if not counts:
+        return cursor, {}
+    last_id = max(last_id for count, last_id in counts.values())
+    changes = {table: None for table, (count, _) in counts.items() if count > max_rows}
+    tables = [table for table in counts if table not in changes]
+    if tables:
+        query.prepare("SELECT table_name, row_id, structural FROM ChangeLog WHERE id > ? AND id <= ? "
+                      f"AND table_name IN ({', '.join('?' * len(tables))}) ORDER BY id")
+        for value in [cursor, last_id] + tables:
+            query.addBindValue(value)
+        if not query.exec_():
+            raise RuntimeError(query.lastError().text())
+        for table, row_id, structural in query_rows(query):
+            changes.setdefault(table, {})[row_id] = structural
+    return last_id, changes
+
+class ChangeFeed(QObject):
+    data_changed = pyqtSignal()
+    rows_changed = pyqtSignal(str, object)
+    
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.data_version = None
+        self.cursor = None
+        self._check_pending = False
+        self._reading = False
+        self._read_again = False
+        self.poll_timer = QTimer(self)
+        self.poll_timer.timeout.connect(self.poll)
+    
+    def start(self):
+        if self.poll_timer.isActive():
+            return
+        query = SqlQuery()
+        if query.exec_("SELECT COALESCE(MAX(id), 0) FROM ChangeLog") and query.next():
+            self.cursor = query.value(0)
+        query.finish()
+        self.poll()
+        self.poll_timer.start(DATA_VERSION_POLL_MS)
+    
+    def note_write(self):
+        # Called by SqlQuery after each write on the GUI thread.
+        if self.poll_timer.isActive() and not self._check_pending:
+            self._check_pending = True
+            QTimer.singleShot(0, self.check)
+    
+    def poll(self):
+        query = SqlQuery()
+        query.exec_("PRAGMA data_version")
+        data_version = query.value(0) if query.next() else None
+        query.finish()
+        if data_version != self.data_version:
+            self.data_version = data_version
+            self.check()
+    
+    def check(self):
+        self._check_pending = False
+        self.data_changed.emit()
+        self.read_log()
+    
+    def read_log(self):
+        if self.cursor is None:
+            return
+        if self._reading:
+            # Entries committed after the running read started are picked up next.
+            self._read_again = True
+            return
+        self._reading = True
+        query_service.submit(read_change_log, self.cursor, CHANGE_FEED_MAX_ROWS,
+                             on_result=self._log_read, on_error=self._read_done)
+    
+    def _log_read(self, result):
+        self.cursor, changes = result
+        for table, rows in changes.items():
+            self.rows_changed.emit(table, rows)
+        self._read_done()
+    
+    def _read_done(self, error=None):
+        self._reading = False
+        if self._read_again:
+            self._read_again = False
+            self.read_log()
+
+change_feed = ChangeFeed()
+
+# --- Reference Data ---
+# Categories, suppliers and customers are read once into shared list models
+# that every combo box showing them uses, so a dialog opened on a warm cache
+# runs no SQL for them. The version counters in ReferenceVersions are
+# re-read whenever the change feed sees a commit; only the tables whose
+# counter moved are reloaded.
+
+class ReferenceModel(QAbstractListModel):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.rows = []
+        self.row_by_id = {}
+        self.is_loaded = False
+    
+    def set_rows(self, rows):
+        self.beginResetModel()
+        self.rows = rows
+        self.row_by_id = {row[0]: i for i, row in enumerate(rows)}
+        self.is_loaded = True
+        self.endResetModel()
+    
+    def row_of(self, id):
+        return self.row_by_id.get(id, -1)
+    
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+    
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        if role in (Qt.DisplayRole, Qt.EditRole):
+            return self.rows[index.row()][1]
+        if role == Qt.UserRole:
+            return self.rows[index.row()][0]
+        return None
+
+class ReferenceData(QObject):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.models = {table: ReferenceModel(self) for table in REFERENCE_TABLES}
+        self.versions = {}
+        self.started = False
+    
+    def model(self, table):
+        if not self.started:
+            self.start()
+        return self.models[table]
+    
+    def start(self):
+        # Loads every table in the background and starts watching for changes.
+        if self.started:
+            return
+        self.started = True
+        change_feed.data_changed.connect(self.check)
+        self.check()
+        change_feed.start()
+    
+    def check(self):
+        query = SqlQuery()
+        query.exec_("SELECT table_name, version FROM ReferenceVersions")
+        changed = []
+        while query.next():
+            table, version = query.value(0), query.value(1)
+            if table in self.models and self.versions.get(table) != version:
+                self.versions[table] = version
+                changed.append(table)
+        for table in changed:
+            model = self.models[table]
+            query_service.fetch(REFERENCE_TABLES[table], on_result=lambda result, model=model: model.set_rows(result[1]),
+                                channel=model)
+
+reference_data = ReferenceData()
+
+class ReferenceComboBinding(QObject):
+    # Child of the combo, so its connections to the shared model go away
+    # with the combo.
+    def __init__(self, combo, model, selected=None, ok_button=None):
+        super().__init__(combo)
+        self.combo = combo
+        self.model = model
+        self.selected = selected
+        self.ok_button = ok_button
+        model.modelAboutToBeReset.connect(self.remember)
+        model.modelReset.connect(self.restore)
+    
+    def remember(self):
+        self.selected = self.combo.currentData()
+    
+    def restore(self):
+        row = self.model.row_of(self.selected)
+        if row >= 0:
+            self.combo.setCurrentIndex(row)
+        self.combo.setEnabled(True)
+        if self.ok_button is not None:
+            self.ok_button.setEnabled(True)
+
+def bind_reference_combo(combo, table, selected=None, ok_button=None):
+    # Shows the shared model for table in combo. Until its first load the
+    # combo and the dialog's OK button stay disabled; across reloads the
+    # combo keeps the id it had selected.
+    model = reference_data.model(table)
+    combo.setModel(model)
+    binding = ReferenceComboBinding(combo, model, selected, ok_button)
+    if model.is_loaded:
+        binding.restore()
+    else:
+        combo.setEnabled(False)
+        if ok_button is not None:
+            ok_button.setEnabled(False)
+
+# --- Stock Ledger ---
+# Stock only changes by appending to StockMovements; the stockmovements_apply
+# trigger keeps StockLevels.quantity equal to the sum of an item's movements
+# in the same transaction, so balance reads stay a primary key lookup.
+STOCK_SNAPSHOT_INTERVAL_DAYS = 30
+
+def post_stock_movement(item_id, quantity, reason, order_id=None, db=None):
+    query = new_query(db)
+    query.prepare("INSERT INTO StockMovements (item_id, quantity, movement_date, reason, order_id) "
+                  "VALUES (?, ?, datetime('now', 'localtime'), ?, ?)")
+    query.addBindValue(item_id)
+    query.addBindValue(quantity)
+    query.addBindValue(reason)
+    query.addBindValue(order_id)
+    return query.exec_()
+
+def set_order_status(order_type, order_id, status, original=None):
+    # Moving into or out of a posted status posts or reverses the order's
+    # lines through the ledger triggers, in the same transaction. original
+    # is the order's status and version as the caller last saw them; if
+    # another user has changed the status since, ConcurrentEditError is
+    # raised and nothing is written.
+    table = "PurchaseOrders" if order_type == "Purchase" else "SalesOrders"
+    db = QSqlDatabase.database()
+    if original is None:
+        original = read_versioned(table, order_id, ["status"])
+        if original is None:
+            return False
+    if not begin_write(db):
+        return False
+    try:
+        compare_and_swap(table, order_id, original, {"status": status})
+    except ConcurrentEditError:
+        db.rollback()
+        raise
+    except RuntimeError:
+        db.rollback()
+        return False
+    if db.commit():
+        return True
+    db.rollback()
+    return False
+
+def take_stock_snapshot(db=None):
+    # Copies the materialized balances, so a snapshot costs O(items) and never
+    # reads the movement history.
+    db = QSqlDatabase.database() if db is None else db
+    if not db.transaction():
+        return False
+    query = SqlQuery(db)
+    ok = query.exec_("""INSERT OR REPLACE INTO StockSnapshots (snapshot_date, item_id, quantity, last_movement_id)
+                        SELECT datetime('now', 'localtime'), item_id, quantity,
+                               (SELECT COALESCE(MAX(id), 0) FROM StockMovements)
+                        FROM StockLevels""")
+    if ok and db.commit():
+        return True
+    db.rollback()
+    return False
+
+def snapshot_due(interval_days=STOCK_SNAPSHOT_INTERVAL_DAYS, db=None):
+    query = new_query(db)
+    query.prepare("SELECT MAX(snapshot_date) < datetime('now', 'localtime', ?) OR MAX(snapshot_date) IS NULL "
+                  "FROM StockSnapshots")
+    query.addBindValue(f"-{interval_days} days")
+    return bool(query.exec_() and query.next() and query.value(0))
+
+STOCK_AS_OF_QUERY = """WITH snap AS (
+                           SELECT item_id, quantity, last_movement_id FROM StockSnapshots
+                           WHERE snapshot_date = (SELECT MAX(snapshot_date) FROM StockSnapshots
+                                                  WHERE snapshot_date <= :as_of))
+                       SELECT si.id, si.name,
+                              COALESCE(snap.quantity, 0)
+                              + COALESCE((SELECT SUM(m.quantity) FROM StockMovements m
+                                          WHERE m.item_id = si.id
+                                            AND m.id > COALESCE(snap.last_movement_id, 0)
+                                            AND m.movement_date <= :as_of), 0)
+                       FROM StockItems si
+                       LEFT JOIN snap ON snap.item_id = si.id"""
+
+def stock_as_of(as_of, item_id=None):
+    # Latest snapshot taken at or before as_of, plus the replay of the
+    # movements recorded after it up to as_of, read from
+    # idx_stockmovements_item_id starting at the snapshot's last movement.
+    sql = STOCK_AS_OF_QUERY
+    if item_id is not None:
+        sql += " WHERE si.id = :item_id"
+    query = SqlQuery()
+    query.setForwardOnly(True)
+    query.prepare(sql + " ORDER BY si.id")
+    query.bindValue(":as_of", as_of)
+    if item_id is not None:
+        query.bindValue(":item_id", item_id)
+    if not query.exec_():
+        return []
+    return list(query_rows(query))
+
+# --- Optimistic Concurrency ---
+# Several workstations may share the database file. A form remembers the
+# version of each row it read, and saving writes only the fields the user
+# changed, with "UPDATE ... SET version = version + 1 WHERE version = ?".
+# If another user saved the row in between, the fields only one of them
+# changed are merged; a field both changed to different values is a
+# conflict, left to the user. Stock quantities are never written back:
+# the difference the user made is posted to the ledger instead.
+class ConcurrentEditError(RuntimeError):
+    def __init__(self, table, row_id, fields, current):
+        super().__init__(f"{table} row {row_id} was changed by another user: {', '.join(fields)}")
+        self.table = table
+        self.row_id = row_id
+        self.fields = fields
+        self.current = current
+
+def begin_write(db=None):
+    # BEGIN IMMEDIATE takes the write lock up front, waiting busy_timeout
+    # for it. A deferred transaction that reads first can fail at once when
+    # it comes to write, if another connection committed in between.
+    query = new_query(db)
+    return query.exec_("BEGIN IMMEDIATE")
+
+def _same_value(a, b):
+    # Prices come back from the spin boxes rounded to cents.
+    if isinstance(a, float) or isinstance(b, float):
+        return a is not None and b is not None and abs(a - b) < 0.005
+    return a == b
+
+def changed_fields(original, values):
+    return {name: value for name, value in values.items() if not _same_value(original.get(name), value)}
+
+def read_versioned(table, row_id, fields, key_column="id", db=None):
+    # {field: value, ..., "version": version} of one row, or None.
+    query = new_query(db)
+    query.prepare(f"SELECT {', '.join(fields)}, version FROM {table} WHERE {key_column} = ?")
+    query.addBindValue(row_id)
+    if not query.exec_() or not query.next():
+        return None
+    row = {name: query.value(i) for i, name in enumerate(list(fields) + ["version"])}
+    # An unfinished read would pin this connection to an old snapshot, and a
+    # later write in it would fail rather than wait.
+    query.finish()
+    return row
+
+def compare_and_swap(table, row_id, original, changes, key_column="id", force=False, db=None):
+    # Writes changes to the row if it is still at original["version"],
+    # merging with whatever another user saved in between. Must run in the
+    # caller's write transaction (begin_write), so the re-read after a
+    # missed swap and the retry see the same row. With force
+    # the user's values win conflicts. Returns the version written.
+    version = original["version"]
+    if not changes:
+        return version
+    query = new_query(db)
+    assignments = ", ".join(f"{name} = ?" for name in changes)
+    while True:
+        query.prepare(f"UPDATE {table} SET {assignments}, version = version + 1 "
+                      f"WHERE {key_column} = ? AND version = ?")
+        for value in list(changes.values()) + [row_id, version]:
+            query.addBindValue(value)
+        if not query.exec_():
+            raise RuntimeError(query.lastError().databaseText() or query.lastError().text())
+        if query.numRowsAffected():
+            return version + 1
+        current = read_versioned(table, row_id, list(changes), key_column, db)
+        if current is None:
+            raise RuntimeError(f"{table} row {row_id} no longer exists")
+        conflicts = [name for name, value in changes.items()
+                     if not _same_value(current[name], original[name]) and not _same_value(current[name], value)]
+        if conflicts and not force:
+            raise ConcurrentEditError(table, row_id, conflicts, current)
+        version = current["version"]
+
+STOCK_ITEM_FIELDS = VERSIONED_COLUMNS["StockItems"]
+STOCK_LEVEL_FIELDS = VERSIONED_COLUMNS["StockLevels"]
+
+def load_stock_item(item_id, db=None):
+    # (item, level, quantity) as a stock item form starts from.
+    item = read_versioned("StockItems", item_id, STOCK_ITEM_FIELDS, db=db)
+    level = read_versioned("StockLevels", item_id, STOCK_LEVEL_FIELDS + ("quantity",), "item_id", db)
+    if level is None:
+        return item, None, 0
+    return item, level, level.pop("quantity")
+
+def save_stock_item(item_id, original_item, original_level, item_values, level_values, quantity_change,
+                    force=False, db=None):
+    # Saves a stock item form in one transaction: the item and level fields
+    # the user changed, compared and swapped, and the quantity change as a
+    # ledger adjustment on top of whatever the balance is by now.
+    db = db or QSqlDatabase.database()
+    if not begin_write(db):
+        raise RuntimeError("could not start a write transaction")
+    try:
+        compare_and_swap("StockItems", item_id, original_item, changed_fields(original_item, item_values),
+                         force=force, db=db)
+        if original_level is not None:
+            compare_and_swap("StockLevels", item_id, original_level, changed_fields(original_level, level_values),
+                             "item_id", force, db)
+        if quantity_change and not post_stock_movement(item_id, quantity_change, "adjustment", db=db):
+            raise RuntimeError(f"could not adjust the stock of item {item_id}")
+        if not db.commit():
+            raise RuntimeError(db.lastError().text())
+    except RuntimeError:
+        db.rollback()
+        raise
+
+# --- Order Totals ---
+ORDER_TABLES = {"PurchaseOrders": "PurchaseOrderItems", "SalesOrders": "SalesOrderItems"}
+
+def _order_totals_mismatch_query(order_table, item_table):
+    # Ids of orders whose stored totals disagree with their lines, in one
+    # pass over each table.
+    return f"""SELECT o.id FROM {order_table} o
+               LEFT JOIN (SELECT order_id, COUNT(*) AS line_count,
+                                 SUM(COALESCE(quantity, 0) * COALESCE(price, 0)) AS subtotal
+                          FROM {item_table} GROUP BY order_id) l ON l.order_id = o.id
+               WHERE o.line_count != COALESCE(l.line_count, 0)
+                  OR ABS(o.subtotal - COALESCE(l.subtotal, 0)) > {ORDER_TOTAL_TOLERANCE}
+                  OR ABS(o.total - COALESCE(l.subtotal, 0)) > {ORDER_TOTAL_TOLERANCE}"""
+
+def check_order_totals(db=None, repair=False):
+    # Returns the number of orders with wrong stored totals per order table;
+    # with repair, recomputes exactly those orders from their lines.
+    db = db or QSqlDatabase.database()
+    mismatches = {}
+    if repair and not db.transaction():
+        return None
+    query = SqlQuery(db)
+    for order_table, item_table in ORDER_TABLES.items():
+        mismatch = _order_totals_mismatch_query(order_table, item_table)
+        if repair:
+            columns = ", ".join(ORDER_TOTAL_COLUMNS)
+            ok = query.exec_(f"UPDATE {order_table} SET ({columns}) = "
+                             f"({_order_line_totals(item_table, f'{order_table}.id')}) WHERE id IN ({mismatch})")
+            mismatches[order_table] = query.numRowsAffected()
+        else:
+            ok = query.exec_(f"SELECT COUNT(*) FROM ({mismatch})") and query.next()
+            mismatches[order_table] = query.value(0) if ok else None
+        if not ok:
+            if repair:
+                db.rollback()
+            return None
+    if repair and not db.commit():
+        db.rollback()
+        return None
+    return mismatches
+
+# --- Bulk Delete and Archive ---
+BULK_CHUNK_SIZE = 500
+
+def _bulk_execute(sql, ids, db=None):
+    # Runs sql, which has an "IN ({placeholders})" list, over ids
+    # BULK_CHUNK_SIZE at a time in one transaction. Returns the number of
+    # rows changed; on failure nothing is changed and RuntimeError carries
+    # the database's message.
+    db = db or QSqlDatabase.database()
+    ids = list(ids)
+    if not db.transaction():
+        raise RuntimeError(db.lastError().text())
+    query = SqlQuery(db)
+    prepared = None
+    changed = 0
+    for start in range(0, len(ids), BULK_CHUNK_SIZE):
+        chunk = ids[start:start + BULK_CHUNK_SIZE]
+        if len(chunk) != prepared:
+            query.prepare(sql.format(placeholders=", ".join("?" * len(chunk))))
+            prepared = len(chunk)
+        for position, row_id in enumerate(chunk):
+            query.bindValue(position, row_id)
+        if not query.exec_():
+            error = query.lastError().databaseText() or query.lastError().text()
+            db.rollback()
+            raise RuntimeError(error)
+        changed += query.numRowsAffected()
+    if not db.commit():
+        error = db.lastError().text()
+        db.rollback()
+        raise RuntimeError(error)
+    return changed
+
+def bulk_delete(table, ids, db=None):
+    # Stock levels and order lines go with their item or order; anything
+    # else still referring to a row makes the whole delete fail.
+    return _bulk_execute(f"DELETE FROM {table} WHERE id IN ({{placeholders}})", ids, db)
+
+def bulk_archive(table, ids, archived=True, db=None):
+    flag = 1 if archived else 0
+    return _bulk_execute(f"UPDATE {table} SET archived = {flag} WHERE archived != {flag} AND id IN ({{placeholders}})",
+                         ids, db)
+
+def selected_rows(view):
+    # Row numbers covered by the view's selection, read from its ranges so a
+    # large selection is not expanded into one index per cell.
+    rows = set()
+    for selection_range in view.selectionModel().selection():
+        rows.update(range(selection_range.top(), selection_range.bottom() + 1))
+    return sorted(rows)
+
+def delete_selected(parent, view, model, noun):
+    # Confirms and deletes the rows selected in a KeysetTableModel view.
+    rows = selected_rows(view)
+    if not rows:
+        QMessageBox.warning(parent, "Warning", f"Please select the {noun}s to delete")
+        return False
+    reply = QMessageBox.question(parent, "Confirm", f"Delete {len(rows)} {noun}{'' if len(rows) == 1 else 's'}?",
+                                 QMessageBox.Yes | QMessageBox.No)
+    if reply != QMessageBox.Yes:
+        return False
+    try:
+        bulk_delete(model.table, model.row_ids(rows))
+    except RuntimeError as e:
+        if "FOREIGN KEY" in str(e):
+            QMessageBox.critical(parent, "Error", f"Some of the selected {noun}s are still used by orders or stock "
+                                                  f"history, so nothing was deleted. Archive them instead.")
+        else:
+            QMessageBox.critical(parent, "Error", f"Failed to delete: {e}")
+        return False
+    return True
+
+def archive_selected(parent, view, model, noun, archived=True):
+    rows = selected_rows(view)
+    if not rows:
+        QMessageBox.warning(parent, "Warning", f"Please select the {noun}s to {'archive' if archived else 'restore'}")
+        return False
+    try:
+        bulk_archive(model.table, model.row_ids(rows), archived)
+    except RuntimeError as e:
+        QMessageBox.critical(parent, "Error", f"Failed to {'archive' if archived else 'restore'}: {e}")
+        return False
+    return True
+
+# --- Order Archive ---
+# Closed orders older than a cutoff are moved, lines, ids and stored totals
+# included, to an archive database beside the live one, so the live tables
+# (and backups of the live file) only hold recent and open orders. The
+# archive's tables are created and kept in step with the live ones by the
+# writer, in prepare_archive. History is read by ATTACHing the archive on
+# demand and querying the temp views {table}History, which union the live
+# and archived rows.
+ARCHIVE_SCHEMA = "archive"
+ARCHIVE_AFTER_DAYS = 365
+ORDER_HISTORY_LIMIT = 5000
+# order type: (order table, line table, party column, party table, statuses
+# after which an order no longer changes)
+ARCHIVED_ORDERS = {
+    "Purchase": ("PurchaseOrders", "PurchaseOrderItems", "supplier_id", "Suppliers", ("Received", "Cancelled")),
+    "Sales": ("SalesOrders", "SalesOrderItems", "customer_id", "Customers", ("Completed",)),
+}
+# Profile pragmas that are set per database file, so the archive gets them too.
+ARCHIVE_FILE_PRAGMAS = ("journal_mode", "synchronous")
+
+def archive_path(path):
+    root, ext = os.path.splitext(path)
+    return f"{root}_archive{ext or '.db'}"
+
+def _table_columns(query, schema, table):
+    # (name, declared type) of each column; empty if the table does not exist.
+    query.exec_(f"PRAGMA {schema}.table_info({table})")
+    return [(name, column_type) for _, name, column_type, *_ in query_rows(query)]
+
+def _sync_archive_table(query, table, indexed_column):
+    # Creates the archive copy of table, or adds the columns the live table
+    # has gained since. No foreign keys: an archived order outlives the
+    # rows it referred to.
+    columns = _table_columns(query, "main", table)
+    archived = dict(_table_columns(query, ARCHIVE_SCHEMA, table))
+    if not archived:
+        definitions = [f"{name} INTEGER PRIMARY KEY" if name == "id" else f"{name} {column_type}"
+                       for name, column_type in columns]
+        return (query.exec_(f"CREATE TABLE {ARCHIVE_SCHEMA}.{table} ({', '.join(definitions)})")
+                and query.exec_(f"CREATE INDEX IF NOT EXISTS {ARCHIVE_SCHEMA}.idx_{table.lower()}_{indexed_column} "
+                                f"ON {table} ({indexed_column})"))
+    return all(query.exec_(f"ALTER TABLE {ARCHIVE_SCHEMA}.{table} ADD COLUMN {name} {column_type}")
+               for name, column_type in columns if name not in archived)
+
+def _create_history_view(query, table):
+    # Only the live rows if the archive is not attached or has no copy of
+    # table yet; columns the live table gained after the archive was last
+    # synced read as NULL in archived rows.
+    columns = [name for name, _ in _table_columns(query, "main", table)]
+    archived = {name for name, _ in _table_columns(query, ARCHIVE_SCHEMA, table)}
+    select = f"SELECT {', '.join(columns)}, 0 AS archived FROM main.{table}"
+    if archived:
+        archived_columns = ", ".join(name if name in archived else f"NULL AS {name}" for name in columns)
+        select += f" UNION ALL SELECT {archived_columns}, 1 AS archived FROM {ARCHIVE_SCHEMA}.{table}"
+    return (query.exec_(f"DROP VIEW IF EXISTS temp.{table}History")
+            and query.exec_(f"CREATE TEMP VIEW {table}History AS {select}"))
+
+def archive_attached(db=None):
+    query = SqlQuery(db or QSqlDatabase.database())
+    query.exec_("PRAGMA database_list")
+    return ARCHIVE_SCHEMA in [name for _, name, _ in query_rows(query)]
+
+def prepare_archive(db=None):
+    # Writer side: attaches the archive to this connection, creating it on
+    # first use, and creates its tables or adds the columns the live tables
+    # have gained since, in one write transaction. Leaves it attached.
+    db = db or QSqlDatabase.database()
+    query = SqlQuery(db)
+    if not archive_attached(db):
+        query.prepare(f"ATTACH DATABASE ? AS {ARCHIVE_SCHEMA}")
+        query.addBindValue(archive_path(db.databaseName()))
+        if not query.exec_():
+            return False
+        profile = active_db_profile()
+        for name in ARCHIVE_FILE_PRAGMAS:
+            ok = name not in profile or query.exec_(f"PRAGMA {ARCHIVE_SCHEMA}.{name} = {profile[name]}")
+            query.finish()
+            if not ok:
+                detach_archive(db)
+                return False
+    if not begin_write(db):
+        detach_archive(db)
+        return False
+    for order_table, item_table, *_ in ARCHIVED_ORDERS.values():
+        if not (_sync_archive_table(query, order_table, "order_date")
+                and _sync_archive_table(query, item_table, "order_id")):
+            db.rollback()
+            detach_archive(db)
+            return False
+    if db.commit():
+        return True
+    db.rollback()
+    detach_archive(db)
+    return False
+
+def attach_archive(db=None):
+    # Reader side, for query_service workers: attaches the archive if there
+    # is one and (re)creates the history views, so they pick up an archive
+    # made or extended since the last call. Never writes to either file.
+    db = db or QSqlDatabase.database()
+    query = SqlQuery(db)
+    path = archive_path(db.databaseName())
+    if not archive_attached(db) and os.path.exists(path):
+        query.prepare(f"ATTACH DATABASE ? AS {ARCHIVE_SCHEMA}")
+        query.addBindValue(path)
+        if not query.exec_():
+            return False
+    return all(_create_history_view(query, table)
+               for order_table, item_table, *_ in ARCHIVED_ORDERS.values()
+               for table in (order_table, item_table))
+
+def detach_archive(db=None):
+    query = SqlQuery(db or QSqlDatabase.database())
+    for order_table, item_table, *_ in ARCHIVED_ORDERS.values():
+        query.exec_(f"DROP VIEW IF EXISTS temp.{order_table}History")
+        query.exec_(f"DROP VIEW IF EXISTS temp.{item_table}History")
+    return query.exec_(f"DETACH DATABASE {ARCHIVE_SCHEMA}")
+
+def _archive_steps(order_table, item_table, statuses, order_names, item_names):
+    # SQL for moving one order table's closed orders, as (sql, takes cutoff).
+    # An order is only deleted from the live tables if the archive holds an
+    # identical copy of it and of each of its lines, so an order edited
+    # after it was copied stays live.
+    final = ", ".join(f"'{status}'" for status in statuses)
+    closed = f"status IN ({final}) AND order_date < ?"
+    order_list = ", ".join(order_names)
+    item_list = ", ".join(item_names)
+    same_order = " AND ".join(f"a.{name} IS o.{name}" for name in order_names)
+    changed_line = " OR ".join(f"al.{name} IS NOT l.{name}" for name in item_names)
+    # Archived copies of orders that are still live: left by a move that
+    # stopped half way, or by an order edited after it was copied. The live
+    # order is the current one.
+    drop_live = [
+        (f"""DELETE FROM {ARCHIVE_SCHEMA}.{item_table}
+             WHERE order_id IN (SELECT id FROM main.{order_table})""", False),
+        (f"""DELETE FROM {ARCHIVE_SCHEMA}.{order_table}
+             WHERE id IN (SELECT id FROM main.{order_table})""", False),
+    ]
+    copy = [
+        (f"""INSERT OR REPLACE INTO {ARCHIVE_SCHEMA}.{order_table} ({order_list})
+             SELECT {order_list} FROM main.{order_table} WHERE {closed}""", True),
+        (f"""INSERT OR REPLACE INTO {ARCHIVE_SCHEMA}.{item_table} ({item_list})
+             SELECT {item_list} FROM main.{item_table}
+             WHERE order_id IN (SELECT id FROM main.{order_table} WHERE {closed})""", True),
+    ]
+    delete = [
+        (f"""DELETE FROM main.{order_table} WHERE id IN (
+                 SELECT o.id FROM main.{order_table} o
+                 JOIN {ARCHIVE_SCHEMA}.{order_table} a ON a.id = o.id
+                 WHERE {same_order}
+                   AND (SELECT COUNT(*) FROM {ARCHIVE_SCHEMA}.{item_table} WHERE order_id = o.id) = o.line_count
+                   AND NOT EXISTS (SELECT 1 FROM main.{item_table} l
+                                   LEFT JOIN {ARCHIVE_SCHEMA}.{item_table} al ON al.id = l.id
+                                   WHERE l.order_id = o.id AND (al.id IS NULL OR {changed_line})))""", False),
+    ]
+    return drop_live, copy, delete
+
+def _run_archive_step(db, steps, cutoff):
+    # Runs steps in one write transaction; returns the rows changed by each,
+    # or raises RuntimeError with nothing changed.
+    if not begin_write(db):
+        raise RuntimeError(db.lastError().text() or "could not start a write transaction")
+    query = SqlQuery(db)
+    changed = []
+    for sql, takes_cutoff in steps:
+        query.prepare(sql)
+        if takes_cutoff:
+            query.addBindValue(cutoff)
+        if not query.exec_():
+            error = query.lastError().databaseText() or query.lastError().text()
+            db.rollback()
+            raise RuntimeError(error)
+        changed.append(query.numRowsAffected())
+    if not db.commit():
+        error = db.lastError().text()
+        db.rollback()
+        raise RuntimeError(error)
+    return changed
+
+def archive_closed_orders(cutoff, db=None):
+    # Moves orders in a final status dated before cutoff (YYYY-MM-DD) to the
+    # archive. The copy is committed to the archive before anything is
+    # deleted from the live file (a commit spanning two WAL databases is not
+    # atomic), so a crash in between leaves orders in both places, which the
+    # next run finishes moving. Returns {order table: orders moved}; raises
+    # RuntimeError on failure.
+    db = db or QSqlDatabase.database()
+    attached = archive_attached(db)
+    if not prepare_archive(db):
+        raise RuntimeError(db.lastError().text() or f"could not attach {archive_path(db.databaseName())}")
+    moved = {}
+    query = SqlQuery(db)
+    try:
+        for order_table, item_table, _, _, statuses in ARCHIVED_ORDERS.values():
+            drop_live, copy, delete = _archive_steps(
+                order_table, item_table, statuses,
+                [name for name, _ in _table_columns(query, "main", order_table)],
+                [name for name, _ in _table_columns(query, "main", item_table)])
+            _run_archive_step(db, drop_live + copy, cutoff)
+            # Lines go with their orders (ON DELETE CASCADE). The ledger and
+            # totals triggers skip lines whose order is already gone, so
+            # stock balances are untouched.
+            moved[order_table] = _run_archive_step(db, delete, cutoff)[0]
+            _run_archive_step(db, drop_live, cutoff)
+    finally:
+        query.finish()
+        if not attached:
+            detach_archive(db)
+    return moved
+
+def _fetch_order_history(db, cancelled, order_type, date_from, date_to):
+    # Runs on query_service: live and archived orders dated in the range,
+    # newest first.
+    order_table, _, party_column, party_table, _ = ARCHIVED_ORDERS[order_type]
+    if not attach_archive(db):
+        raise RuntimeError(db.lastError().text() or "could not attach the order archive")
+    return fetch_rows(db, cancelled,
+                      f"""SELECT o.id, p.name AS {party_column.replace("_id", "")}, o.order_date, o.status,
+                                 o.line_count, o.total, CASE o.archived WHEN 1 THEN 'Archive' ELSE 'Live' END AS source
+                          FROM {order_table}History o
+                          LEFT JOIN {party_table} p ON p.id = o.{party_column}
+                          WHERE o.order_date >= ? AND o.order_date <= ?
+                          ORDER BY o.order_date DESC, o.id DESC
+                          LIMIT ?""",
+                      [date_from, date_to, ORDER_HISTORY_LIMIT])
+
+def _fetch_order_history_lines(db, cancelled, order_type, order_id):
+    _, item_table, _, _, _ = ARCHIVED_ORDERS[order_type]
+    if not attach_archive(db):
+        raise RuntimeError(db.lastError().text() or "could not attach the order archive")
+    return fetch_rows(db, cancelled,
+                      f"""SELECT l.id, s.sku, s.name AS item, l.quantity, l.price
+                          FROM {item_table}History l
+                          LEFT JOIN StockItems s ON s.id = l.item_id
+                          WHERE l.order_id = ?
+                          ORDER BY l.id""",
+                      [order_id])
+
 # --- Dialogs ---
 class AddStockItemDialog(QDialog):
     def __init__(self, parent=None):
@@ -96,14 +2001,13 @@ class AddStockItemDialog(QDialog):
         self.setWindowTitle("Add Stock Item")
         self.setMinimumWidth(400)
         layout = QFormLayout()
+        self.sku_edit = QLineEdit()
+        layout.addRow(QLabel("SKU:"), self.sku_edit)
         self.name_edit = QLineEdit()
         layout.addRow(QLabel("Name:"), self.name_edit)
         self.description_edit = QTextEdit()
         layout.addRow(QLabel("Description:"), self.description_edit)
         self.category_combo = QComboBox()
-        query = QSqlQuery("SELECT id, name FROM Categories")
-        while query.next():
-            self.category_combo.addItem(query.value(1), query.value(0))
         layout.addRow(QLabel("Category:"), self.category_combo)
         self.unit_price_edit = QDoubleSpinBox()
         self.unit_price_edit.setRange(0, 1000000)
@@ -112,11 +2016,19 @@ class AddStockItemDialog(QDialog):
         self.quantity_edit = QSpinBox()
         self.quantity_edit.setRange(0, 1000000)
         layout.addRow(QLabel("Initial Quantity:"), self.quantity_edit)
+        self.reorder_point_edit = QSpinBox()
+        self.reorder_point_edit.setRange(0, 1000000)
+        self.reorder_point_edit.setValue(10)
+        layout.addRow(QLabel("Reorder Point:"), self.reorder_point_edit)
+        self.safety_stock_edit = QSpinBox()
+        self.safety_stock_edit.setRange(0, 1000000)
+        layout.addRow(QLabel("Safety Stock:"), self.safety_stock_edit)
         buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
         buttons.accepted.connect(self.accept)
         buttons.rejected.connect(self.reject)
         layout.addWidget(buttons)
         self.setLayout(layout)
+        bind_reference_combo(self.category_combo, "Categories", ok_button=buttons.button(QDialogButtonBox.Ok))
     
     def accept(self):
         if not self.name_edit.text().strip():
@@ -124,25 +2036,31 @@ class AddStockItemDialog(QDialog):
             return
         db = QSqlDatabase.database()
         if db.transaction():
-            query = QSqlQuery()
-            query.prepare("INSERT INTO StockItems (name, description, category_id, unit_price) VALUES (?, ?, ?, ?)")
+            query = SqlQuery()
+            query.prepare("INSERT INTO StockItems (sku, name, description, category_id, unit_price) VALUES (?, ?, ?, ?, ?)")
+            query.addBindValue(normalize_sku(self.sku_edit.text()))
             query.addBindValue(self.name_edit.text())
             query.addBindValue(self.description_edit.toPlainText())
             query.addBindValue(self.category_combo.currentData())
             query.addBindValue(self.unit_price_edit.value())
             if query.exec_():
                 item_id = query.lastInsertId()
-                query.prepare("INSERT INTO StockLevels (item_id, quantity) VALUES (?, ?)")
+                query.prepare("INSERT INTO StockLevels (item_id, quantity, reorder_point, safety_stock) VALUES (?, 0, ?, ?)")
                 query.addBindValue(item_id)
-                query.addBindValue(self.quantity_edit.value())
-                if query.exec_() and db.commit():
+                query.addBindValue(self.reorder_point_edit.value())
+                query.addBindValue(self.safety_stock_edit.value())
+                ok = query.exec_()
+                if ok and self.quantity_edit.value():
+                    ok = post_stock_movement(item_id, self.quantity_edit.value(), "opening")
+                if ok and db.commit():
+                    data_events.stock_changed.emit()
                     super().accept()
                 else:
                     db.rollback()
                     QMessageBox.critical(self, "Error", "Failed to set stock level")
             else:
                 db.rollback()
-                QMessageBox.critical(self, "Error", "Failed to add item")
+                QMessageBox.critical(self, "Error", f"Failed to add item: {query.lastError().databaseText()}")
 
 class EditStockItemDialog(QDialog):
     def __init__(self, item_id, parent=None):
@@ -151,6 +2069,7 @@ class EditStockItemDialog(QDialog):
         self.setMinimumWidth(400)
         self.item_id = item_id
         layout = QFormLayout()
+        self.sku_edit = QLineEdit()
         self.name_edit = QLineEdit()
         self.description_edit = QTextEdit()
         self.category_combo = QComboBox()
@@ -159,60 +2078,108 @@ class EditStockItemDialog(QDialog):
         self.unit_price_edit.setDecimals(2)
         self.quantity_edit = QSpinBox()
         self.quantity_edit.setRange(0, 1000000)
-        # Load existing data
-        query = QSqlQuery()
-        query.prepare("SELECT name, description, category_id, unit_price FROM StockItems WHERE id = ?")
-        query.addBindValue(item_id)
-        if query.exec_() and query.next():
-            self.name_edit.setText(query.value(0))
-            self.description_edit.setText(query.value(1))
-            category_id = query.value(2)
-            self.unit_price_edit.setValue(query.value(3))
-        query.exec_("SELECT id, name FROM Categories")
-        while query.next():
-            self.category_combo.addItem(query.value(1), query.value(0))
-            if query.value(0) == category_id:
-                self.category_combo.setCurrentIndex(self.category_combo.count() - 1)
-        query.prepare("SELECT quantity FROM StockLevels WHERE item_id = ?")
-        query.addBindValue(item_id)
-        if query.exec_() and query.next():
-            self.quantity_edit.setValue(query.value(0))
+        self.reorder_point_edit = QSpinBox()
+        self.reorder_point_edit.setRange(0, 1000000)
+        self.safety_stock_edit = QSpinBox()
+        self.safety_stock_edit.setRange(0, 1000000)
+        # Load existing data; saving writes back only what was changed here.
+        self.item, self.level, self.quantity = load_stock_item(item_id)
+        category_id = None
+        if self.item is not None:
+            category_id = self.item["category_id"]
+            self.show_values(self.item)
+        if self.level is not None:
+            self.show_values(self.level)
+        self.quantity_edit.setValue(self.quantity)
+        layout.addRow(QLabel("SKU:"), self.sku_edit)
         layout.addRow(QLabel("Name:"), self.name_edit)
         layout.addRow(QLabel("Description:"), self.description_edit)
         layout.addRow(QLabel("Category:"), self.category_combo)
         layout.addRow(QLabel("Unit Price:"), self.unit_price_edit)
         layout.addRow(QLabel("Quantity:"), self.quantity_edit)
+        layout.addRow(QLabel("Reorder Point:"), self.reorder_point_edit)
+        layout.addRow(QLabel("Safety Stock:"), self.safety_stock_edit)
         buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
         buttons.accepted.connect(self.accept)
         buttons.rejected.connect(self.reject)
         layout.addWidget(buttons)
         self.setLayout(layout)
+        bind_reference_combo(self.category_combo, "Categories", selected=category_id,
+                             ok_button=buttons.button(QDialogButtonBox.Ok))
+    
+    def item_values(self):
+        return {"sku": normalize_sku(self.sku_edit.text()), "name": self.name_edit.text(),
+                "description": self.description_edit.toPlainText(), "category_id": self.category_combo.currentData(),
+                "unit_price": self.unit_price_edit.value()}
+    
+    def level_values(self):
+        return {"reorder_point": self.reorder_point_edit.value(), "safety_stock": self.safety_stock_edit.value()}
+    
+    def show_values(self, values):
+        if "sku" in values:
+            self.sku_edit.setText(values["sku"] or "")
+        if "name" in values:
+            self.name_edit.setText(values["name"])
+        if "description" in values:
+            self.description_edit.setText(values["description"])
+        if "category_id" in values and isinstance(self.category_combo.model(), ReferenceModel):
+            row = self.category_combo.model().row_of(values["category_id"])
+            if row >= 0:
+                self.category_combo.setCurrentIndex(row)
+        if "unit_price" in values:
+            self.unit_price_edit.setValue(values["unit_price"] or 0)
+        if "reorder_point" in values:
+            self.reorder_point_edit.setValue(values["reorder_point"])
+        if "safety_stock" in values:
+            self.safety_stock_edit.setValue(values["safety_stock"])
     
     def accept(self):
         if not self.name_edit.text().strip():
             QMessageBox.warning(self, "Validation Error", "Name is required")
             return
-        db = QSqlDatabase.database()
-        if db.transaction():
-            query = QSqlQuery()
-            query.prepare("UPDATE StockItems SET name=?, description=?, category_id=?, unit_price=? WHERE id=?")
-            query.addBindValue(self.name_edit.text())
-            query.addBindValue(self.description_edit.toPlainText())
-            query.addBindValue(self.category_combo.currentData())
-            query.addBindValue(self.unit_price_edit.value())
-            query.addBindValue(self.item_id)
-            if query.exec_():
-                query.prepare("UPDATE StockLevels SET quantity=? WHERE item_id=?")
-                query.addBindValue(self.quantity_edit.value())
-                query.addBindValue(self.item_id)
-                if query.exec_() and db.commit():
-                    super().accept()
-                else:
-                    db.rollback()
-                    QMessageBox.critical(self, "Error", "Failed to update stock level")
-            else:
-                db.rollback()
-                QMessageBox.critical(self, "Error", "Failed to update item")
+        if self.item is None:
+            QMessageBox.critical(self, "Error", "This item no longer exists")
+            return
+        force = False
+        while True:
+            try:
+                save_stock_item(self.item_id, self.item, self.level, self.item_values(), self.level_values(),
+                                self.quantity_edit.value() - self.quantity, force)
+                break
+            except ConcurrentEditError as e:
+                fields = ", ".join(field.replace("_", " ") for field in e.fields)
+                reply = QMessageBox.question(
+                    self, "Changed by Another User",
+                    f"Another user has changed the {fields} of this item since you opened it.\n\n"
+                    f"Yes saves your values over theirs; No shows their values so you can review them.",
+                    QMessageBox.Yes | QMessageBox.No)
+                if reply != QMessageBox.Yes:
+                    self.merge_current()
+                    return
+                force = True
+            except RuntimeError as e:
+                QMessageBox.critical(self, "Error", f"Failed to update item: {e}")
+                return
+        data_events.stock_changed.emit()
+        super().accept()
+    
+    def merge_current(self):
+        # Takes in what was saved meanwhile: fields changed only by the other
+        # user show their value, fields changed only here keep the edit, and
+        # the quantity keeps the change made here on top of the new balance.
+        item, level, quantity = load_stock_item(self.item_id)
+        for original, current, values in ((self.item, item, self.item_values()),
+                                          (self.level, level, self.level_values())):
+            if original is None or current is None:
+                continue
+            edited = changed_fields(original, values)
+            self.show_values({name: value for name, value in current.items() if name not in edited or
+                              not _same_value(value, original[name])})
+            original.update(current)
+        if level is not None and self.level is None:
+            self.level = level
+        self.quantity_edit.setValue(quantity + self.quantity_edit.value() - self.quantity)
+        self.quantity = quantity
 
 class AddSupplierDialog(QDialog):
     def __init__(self, parent=None):
@@ -240,7 +2207,7 @@ class AddSupplierDialog(QDialog):
         if not self.name_edit.text().strip():
             QMessageBox.warning(self, "Validation Error", "Name is required")
             return
-        query = QSqlQuery()
+        query = SqlQuery()
         query.prepare("INSERT INTO Suppliers (name, contact_person, phone, email, address) VALUES (?, ?, ?, ?, ?)")
         query.addBindValue(self.name_edit.text())
         query.addBindValue(self.contact_edit.text())
@@ -265,7 +2232,7 @@ class EditSupplierDialog(QDialog):
         self.email_edit = QLineEdit()
         self.address_edit = QTextEdit()
         # Load existing data
-        query = QSqlQuery()
+        query = SqlQuery()
         query.prepare("SELECT name, contact_person, phone, email, address FROM Suppliers WHERE id = ?")
         query.addBindValue(supplier_id)
         if query.exec_() and query.next():
@@ -289,7 +2256,7 @@ class EditSupplierDialog(QDialog):
         if not self.name_edit.text().strip():
             QMessageBox.warning(self, "Validation Error", "Name is required")
             return
-        query = QSqlQuery()
+        query = SqlQuery()
         query.prepare("UPDATE Suppliers SET name=?, contact_person=?, phone=?, email=?, address=? WHERE id=?")
         query.addBindValue(self.name_edit.text())
         query.addBindValue(self.contact_edit.text())
@@ -328,7 +2295,7 @@ class AddCustomerDialog(QDialog):
         if not self.name_edit.text().strip():
             QMessageBox.warning(self, "Validation Error", "Name is required")
             return
-        query = QSqlQuery()
+        query = SqlQuery()
         query.prepare("INSERT INTO Customers (name, contact_person, phone, email, address) VALUES (?, ?, ?, ?, ?)")
         query.addBindValue(self.name_edit.text())
         query.addBindValue(self.contact_edit.text())
@@ -353,7 +2320,7 @@ class EditCustomerDialog(QDialog):
         self.email_edit = QLineEdit()
         self.address_edit = QTextEdit()
         # Load existing data
-        query = QSqlQuery()
+        query = SqlQuery()
         query.prepare("SELECT name, contact_person, phone, email, address FROM Customers WHERE id = ?")
         query.addBindValue(customer_id)
         if query.exec_() and query.next():
@@ -377,7 +2344,7 @@ class EditCustomerDialog(QDialog):
         if not self.name_edit.text().strip():
             QMessageBox.warning(self, "Validation Error", "Name is required")
             return
-        query = QSqlQuery()
+        query = SqlQuery()
         query.prepare("UPDATE Customers SET name=?, contact_person=?, phone=?, email=?, address=? WHERE id=?")
         query.addBindValue(self.name_edit.text())
         query.addBindValue(self.contact_edit.text())
@@ -397,24 +2364,22 @@ class AddPurchaseOrderDialog(QDialog):
         self.setMinimumWidth(400)
         layout = QFormLayout()
         self.supplier_combo = QComboBox()
-        query = QSqlQuery("SELECT id, name FROM Suppliers")
-        while query.next():
-            self.supplier_combo.addItem(query.value(1), query.value(0))
         layout.addRow(QLabel("Supplier:"), self.supplier_combo)
         self.order_date_edit = QDateEdit()
         self.order_date_edit.setDate(QDate.currentDate())
         layout.addRow(QLabel("Order Date:"), self.order_date_edit)
         self.status_combo = QComboBox()
-        self.status_combo.addItems(["Pending", "Received", "Cancelled"])
+        self.status_combo.addItems(PURCHASE_STATUSES)
         layout.addRow(QLabel("Status:"), self.status_combo)
         buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
         buttons.accepted.connect(self.accept)
         buttons.rejected.connect(self.reject)
         layout.addWidget(buttons)
         self.setLayout(layout)
+        bind_reference_combo(self.supplier_combo, "Suppliers", ok_button=buttons.button(QDialogButtonBox.Ok))
     
     def accept(self):
-        query = QSqlQuery()
+        query = SqlQuery()
         query.prepare("INSERT INTO PurchaseOrders (supplier_id, order_date, status) VALUES (?, ?, ?)")
         query.addBindValue(self.supplier_combo.currentData())
         query.addBindValue(self.order_date_edit.date().toString(Qt.ISODate))
@@ -431,27 +2396,25 @@ class AddSalesOrderDialog(QDialog):
         self.setMinimumWidth(400)
         layout = QFormLayout()
         self.customer_combo = QComboBox()
-        query = QSqlQuery("SELECT id, name FROM Customers")
-        while query.next():
-            self.customer_combo.addItem(query.value(1), query.value(0))
         layout.addRow(QLabel("Customer:"), self.customer_combo)
         self.order_date_edit = QDateEdit()
         self.order_date_edit.setDate(QDate.currentDate())
         layout.addRow(QLabel("Order Date:"), self.order_date_edit)
         self.status_combo = QComboBox()
-        self.status_combo.addItems(["Pending", "Shipped", "Completed"])
+        self.status_combo.addItems(SALES_STATUSES)
         layout.addRow(QLabel("Status:"), self.status_combo)
         buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
         buttons.accepted.connect(self.accept)
         buttons.rejected.connect(self.reject)
         layout.addWidget(buttons)
         self.setLayout(layout)
+        bind_reference_combo(self.customer_combo, "Customers", ok_button=buttons.button(QDialogButtonBox.Ok))
     
     def accept(self):
         if not self.customer_combo.currentData():
             QMessageBox.warning(self, "Error", "Please select a customer")
             return
-        query = QSqlQuery()
+        query = SqlQuery()
         query.prepare("INSERT INTO SalesOrders (customer_id, order_date, status) VALUES (?, ?, ?)")
         query.addBindValue(self.customer_combo.currentData())
         query.addBindValue(self.order_date_edit.date().toString(Qt.ISODate))
@@ -462,22 +2425,23 @@ class AddSalesOrderDialog(QDialog):
             QMessageBox.critical(self, "Error", "Failed to add sales order")
 
 class ManageOrderItemsDialog(QDialog):
+    # Lines can be added one at a time with Add Item, or keyed into the
+    # New Lines grid and saved together with Save Lines: one batched insert
+    # in one transaction. Either way only the new rows are added to the view.
     def __init__(self, order_id, order_type, parent=None):
         super().__init__(parent)
         self.order_id = order_id
         self.order_type = order_type  # "Purchase" or "Sales"
+        self.table = "PurchaseOrderItems" if order_type == "Purchase" else "SalesOrderItems"
         self.setWindowTitle(f"Manage Items for {order_type} Order {order_id}")
         layout = QVBoxLayout()
         self.table_view = QTableView()
-        self.model = QSqlTableModel()
-        if order_type == "Purchase":
-            self.model.setTable("PurchaseOrderItems")
-        else:
-            self.model.setTable("SalesOrderItems")
-        self.model.setFilter(f"order_id = {order_id}")
+        self.table_view.setSelectionBehavior(QTableView.SelectRows)
+        self.model = OrderLinesModel(self.table, order_id, self)
         self.model.select()
         self.table_view.setModel(self.model)
         layout.addWidget(self.table_view)
+        layout.addWidget(LoadingIndicator(self.model))
         buttons_layout = QHBoxLayout()
         add_button = QPushButton(QIcon("add.png"), "Add Item")
         add_button.clicked.connect(self.add_item)
@@ -486,45 +2450,142 @@ class ManageOrderItemsDialog(QDialog):
         delete_button.clicked.connect(self.delete_item)
         buttons_layout.addWidget(delete_button)
         layout.addLayout(buttons_layout)
+        layout.addWidget(QLabel("New Lines:"))
+        entry_layout = QHBoxLayout()
+        self.item_picker = ItemPicker()
+        self.item_picker.item_selected.connect(self.item_selected)
+        entry_layout.addWidget(self.item_picker, 1)
+        self.quantity_edit = QSpinBox()
+        self.quantity_edit.setRange(1, 1000)
+        entry_layout.addWidget(self.quantity_edit)
+        self.price_edit = QDoubleSpinBox()
+        self.price_edit.setRange(0, 1000000)
+        self.price_edit.setDecimals(2)
+        entry_layout.addWidget(self.price_edit)
+        self.stage_button = QPushButton("Stage")
+        self.stage_button.setToolTip("Add the line to the new lines below (Enter)")
+        self.stage_button.setEnabled(False)
+        self.stage_button.clicked.connect(self.stage_current)
+        entry_layout.addWidget(self.stage_button)
+        layout.addLayout(entry_layout)
+        self.staged_view = QTableView()
+        self.staged = RowsTableModel(self)
+        self.staged.columns = ["item_id", "item", "quantity", "price"]
+        self.staged_view.setModel(self.staged)
+        layout.addWidget(self.staged_view)
+        staged_buttons_layout = QHBoxLayout()
+        remove_button = QPushButton(QIcon("delete.png"), "Remove Line")
+        remove_button.clicked.connect(self.remove_staged)
+        staged_buttons_layout.addWidget(remove_button)
+        self.save_button = QPushButton("Save Lines")
+        self.save_button.clicked.connect(self.save_lines)
+        staged_buttons_layout.addWidget(self.save_button)
+        layout.addLayout(staged_buttons_layout)
+        self.staged.rowsInserted.connect(self.update_save_button)
+        self.staged.rowsRemoved.connect(self.update_save_button)
+        self.staged.modelReset.connect(self.update_save_button)
+        self.update_save_button()
+        # Enter stages the line being keyed rather than pressing Add Item.
+        for button in self.findChildren(QPushButton):
+            button.setAutoDefault(False)
+        self.stage_button.setDefault(True)
         self.setLayout(layout)
     
     def add_item(self):
         dialog = AddOrderItemDialog(self.order_type, self)
         if dialog.exec_() == QDialog.Accepted:
-            item_id = dialog.item_combo.currentData()
-            quantity = dialog.quantity_edit.value()
-            price = dialog.price_edit.value()
-            query = QSqlQuery()
-            if self.order_type == "Purchase":
-                query.prepare("INSERT INTO PurchaseOrderItems (order_id, item_id, quantity, price) VALUES (?, ?, ?, ?)")
-            else:
-                query.prepare("INSERT INTO SalesOrderItems (order_id, item_id, quantity, price) VALUES (?, ?, ?, ?)")
-            query.addBindValue(self.order_id)
-            query.addBindValue(item_id)
-            query.addBindValue(quantity)
-            query.addBindValue(price)
-            if query.exec_():
-                self.model.select()
-            else:
+            if not self.insert_item(dialog.item_picker.item_id, dialog.quantity_edit.value(),
+                                    dialog.price_edit.value()):
                 QMessageBox.critical(self, "Error", "Failed to add item")
     
+    def insert_item(self, item_id, quantity, price):
+        return self.insert_lines([(item_id, quantity, price)])
+    
+    def insert_lines(self, lines):
+        # lines are (item_id, quantity, price).
+        db = QSqlDatabase.database()
+        if not db.transaction():
+            return False
+        query = SqlQuery()
+        query.prepare(f"INSERT INTO {self.table} (order_id, item_id, quantity, price) VALUES (?, ?, ?, ?)")
+        query.addBindValue([self.order_id] * len(lines))
+        for column in zip(*lines):
+            query.addBindValue(list(column))
+        if not query.execBatch() or not db.commit():
+            db.rollback()
+            return False
+        self.model.fetch_new()
+        data_events.stock_changed.emit()
+        return True
+    
     def delete_item(self):
-        selected = self.table_view.selectedIndexes()
+        rows = selected_rows(self.table_view)
+        if not rows:
+            return
+        try:
+            self.model.delete_lines(rows)
+        except RuntimeError as e:
+            QMessageBox.critical(self, "Error", f"Failed to delete lines: {e}")
+            return
+        data_events.stock_changed.emit()
+    
+    def item_selected(self, item_id, unit_price):
+        self.stage_button.setEnabled(item_id is not None)
+        if item_id is not None:
+            self.price_edit.setValue(unit_price or 0)
+            self.quantity_edit.setFocus()
+            self.quantity_edit.selectAll()
+    
+    def stage_line(self, item_id, label, quantity, price):
+        self.staged.append_rows([(item_id, label, quantity, price)])
+    
+    def stage_current(self):
+        if self.item_picker.item_id is None:
+            return
+        self.stage_line(self.item_picker.item_id, self.item_picker.text(), self.quantity_edit.value(),
+                        self.price_edit.value())
+        self.item_picker.clear()
+        self.item_picker.text_edited("")
+        self.quantity_edit.setValue(1)
+        self.item_picker.setFocus()
+    
+    def remove_staged(self):
+        selected = self.staged_view.selectedIndexes()
         if selected:
-            row = selected[0].row()
-            self.model.removeRow(row)
-            self.model.submitAll()
+            self.staged.remove_row(selected[0].row())
+    
+    def update_save_button(self):
+        count = len(self.staged.rows)
+        self.save_button.setEnabled(count > 0)
+        self.save_button.setText(f"Save {count} Line{'' if count == 1 else 's'}" if count else "Save Lines")
+    
+    def save_lines(self):
+        lines = [(item_id, quantity, price) for item_id, label, quantity, price in self.staged.rows]
+        if not lines:
+            return True
+        if not self.insert_lines(lines):
+            QMessageBox.critical(self, "Error", "Failed to save the new lines; none were added")
+            return False
+        self.staged.beginResetModel()
+        self.staged.rows = []
+        self.staged.endResetModel()
+        return True
+    
+    def reject(self):
+        count = len(self.staged.rows)
+        if count and QMessageBox.question(self, "Unsaved Lines", f"Discard {count} unsaved line(s)?") != QMessageBox.Yes:
+            return
+        super().reject()
 
 class AddOrderItemDialog(QDialog):
     def __init__(self, order_type, parent=None):
         super().__init__(parent)
         self.setWindowTitle("Add Order Item")
+        self.setMinimumWidth(400)
         layout = QFormLayout()
-        self.item_combo = QComboBox()
-        query = QSqlQuery("SELECT id, name FROM StockItems")
-        while query.next():
-            self.item_combo.addItem(query.value(1), query.value(0))
-        layout.addRow(QLabel("Item:"), self.item_combo)
+        self.item_picker = ItemPicker()
+        self.item_picker.item_selected.connect(self.item_selected)
+        layout.addRow(QLabel("Item:"), self.item_picker)
         self.quantity_edit = QSpinBox()
         self.quantity_edit.setRange(1, 1000)
         layout.addRow(QLabel("Quantity:"), self.quantity_edit)
@@ -537,6 +2598,13 @@ class AddOrderItemDialog(QDialog):
         buttons.rejected.connect(self.reject)
         layout.addWidget(buttons)
         self.setLayout(layout)
+        self.ok_button = buttons.button(QDialogButtonBox.Ok)
+        self.ok_button.setEnabled(False)
+    
+    def item_selected(self, item_id, unit_price):
+        self.ok_button.setEnabled(item_id is not None)
+        if item_id is not None:
+            self.price_edit.setValue(unit_price or 0)
 
 class SelectSalesOrderDialog(QDialog):
     def __init__(self, parent=None):
@@ -544,37 +2612,893 @@ class SelectSalesOrderDialog(QDialog):
         self.setWindowTitle("Select Sales Order")
         layout = QFormLayout()
         self.order_combo = QComboBox()
-        query = QSqlQuery("SELECT id, customer_id FROM SalesOrders")
-        while query.next():
-            order_id = query.value(0)
-            customer_id = query.value(1)
-            customer_query = QSqlQuery(f"SELECT name FROM Customers WHERE id = {customer_id}")
-            customer_name = customer_query.next() and customer_query.value(0) or "Unknown"
-            self.order_combo.addItem(f"Order {order_id} - {customer_name}", order_id)
         layout.addRow("Select Order:", self.order_combo)
         buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
         buttons.accepted.connect(self.accept)
         buttons.rejected.connect(self.reject)
         layout.addWidget(buttons)
         self.setLayout(layout)
+        load_combo(self.order_combo,
+                   """SELECT so.id, 'Order ' || so.id || ' - ' || COALESCE(c.name, 'Unknown')
+                      FROM SalesOrders so LEFT JOIN Customers c ON c.id = so.customer_id
+                      ORDER BY so.id""",
+                   ok_button=buttons.button(QDialogButtonBox.Ok))
     
     @property
     def selected_order_id(self):
         return self.order_combo.currentData()
 
+class BatchInvoiceDialog(QDialog):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Batch Invoices")
+        self.setMinimumWidth(400)
+        layout = QFormLayout()
+        today = QDate.currentDate()
+        self.date_from_edit = QDateEdit()
+        self.date_from_edit.setDate(QDate(today.year(), today.month(), 1))
+        layout.addRow(QLabel("From:"), self.date_from_edit)
+        self.date_to_edit = QDateEdit()
+        self.date_to_edit.setDate(today)
+        layout.addRow(QLabel("To:"), self.date_to_edit)
+        self.status_combo = QComboBox()
+        self.status_combo.addItems(["Any", "Pending", "Shipped", "Completed"])
+        layout.addRow(QLabel("Status:"), self.status_combo)
+        self.out_dir_edit = QLineEdit("invoices")
+        layout.addRow(QLabel("Output Folder:"), self.out_dir_edit)
+        self.combined_check = QCheckBox("Single combined PDF")
+        layout.addRow(self.combined_check)
+        buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+        buttons.accepted.connect(self.accept)
+        buttons.rejected.connect(self.reject)
+        layout.addWidget(buttons)
+        self.setLayout(layout)
+    
+    def accept(self):
+        if not self.out_dir_edit.text().strip():
+            QMessageBox.warning(self, "Validation Error", "Output folder is required")
+            return
+        super().accept()
+    
+    @property
+    def date_from(self):
+        return self.date_from_edit.date().toString(Qt.ISODate)
+    
+    @property
+    def date_to(self):
+        return self.date_to_edit.date().toString(Qt.ISODate)
+    
+    @property
+    def status(self):
+        status = self.status_combo.currentText()
+        return None if status == "Any" else status
+
+class OrderHistoryDialog(QDialog):
+    # Live and archived orders in a date range, read through the history
+    # views. The archive is only attached once this dialog asks for it.
+    def __init__(self, order_type, parent=None):
+        super().__init__(parent)
+        self.order_type = order_type
+        self.setWindowTitle(f"{order_type} Order History")
+        self.resize(800, 600)
+        layout = QVBoxLayout()
+        filter_layout = QHBoxLayout()
+        today = QDate.currentDate()
+        self.date_from_edit = QDateEdit()
+        self.date_from_edit.setDate(today.addYears(-3))
+        filter_layout.addWidget(QLabel("From:"))
+        filter_layout.addWidget(self.date_from_edit)
+        self.date_to_edit = QDateEdit()
+        self.date_to_edit.setDate(today)
+        filter_layout.addWidget(QLabel("To:"))
+        filter_layout.addWidget(self.date_to_edit)
+        show_button = QPushButton("Show")
+        show_button.clicked.connect(self.refresh)
+        filter_layout.addWidget(show_button)
+        layout.addLayout(filter_layout)
+        self.orders_view = QTableView()
+        self.orders_model = RowsTableModel(self)
+        self.orders_view.setModel(self.orders_model)
+        self.orders_model.modelReset.connect(self.orders_view.resizeColumnsToContents)
+        self.orders_view.setSelectionBehavior(QTableView.SelectRows)
+        self.orders_view.setSelectionMode(QTableView.SingleSelection)
+        self.orders_view.selectionModel().currentRowChanged.connect(lambda current, previous: self.show_lines())
+        layout.addWidget(self.orders_view)
+        layout.addWidget(LoadingIndicator(self.orders_model))
+        self.lines_view = QTableView()
+        self.lines_model = RowsTableModel(self)
+        self.lines_view.setModel(self.lines_model)
+        self.lines_model.modelReset.connect(self.lines_view.resizeColumnsToContents)
+        layout.addWidget(self.lines_view)
+        buttons = QDialogButtonBox(QDialogButtonBox.Close)
+        buttons.rejected.connect(self.reject)
+        layout.addWidget(buttons)
+        self.setLayout(layout)
+        self.refresh()
+    
+    def refresh(self):
+        self.orders_model.load_rows(_fetch_order_history, self.order_type,
+                                    self.date_from_edit.date().toString(Qt.ISODate),
+                                    self.date_to_edit.date().toString(Qt.ISODate))
+        self.show_lines()
+    
+    def show_lines(self):
+        current = self.orders_view.currentIndex()
+        order_id = self.orders_model.index(current.row(), 0).data() if current.isValid() else None
+        self.lines_model.load_rows(_fetch_order_history_lines, self.order_type, order_id)
+
+# --- Table Models ---
+class KeysetQuery:
+    # The queries behind one sort order of a KeysetTableModel. Immutable, so
+    # a worker thread can run it while the model moves on to another order.
+    def __init__(self, table, columns, sort_column, descending, page_size):
+        self.table = table
+        self.columns = columns
+        self.id_column = columns.index("id")
+        self.sort_column = sort_column
+        self.descending = descending
+        self.page_size = page_size
+    
+    def key(self, values):
+        if self.sort_column == "id":
+            return (values[self.id_column],)
+        return (values[self.columns.index(self.sort_column)], values[self.id_column])
+    
+    def order_by(self):
+        direction = "DESC" if self.descending else "ASC"
+        if self.sort_column == "id":
+            return f"id {direction}"
+        return f"{self.sort_column} {direction}, id {direction}"
+    
+    def segments(self, key):
+        # The rows after key, as consecutive slices of the sort order that are
+        # each a single index search. A row-value (col, id) > (?, ?) would only
+        # seek on col and then scan every row sharing that value. NULLs sort
+        # first ascending and last descending.
+        if key is None:
+            return [(None, [])]
+        if len(key) == 1:
+            return [("id < ?" if self.descending else "id > ?", [key[0]])]
+        column = self.sort_column
+        value, row_id = key
+        if self.descending:
+            if value is None:
+                return [(f"{column} IS NULL AND id < ?", [row_id])]
+            return [(f"{column} = ? AND id < ?", [value, row_id]),
+                    (f"{column} < ?", [value]),
+                    (f"{column} IS NULL", [])]
+        if value is None:
+            return [(f"{column} IS NULL AND id > ?", [row_id]),
+                    (f"{column} IS NOT NULL", [])]
+        return [(f"{column} = ? AND id > ?", [value, row_id]),
+                (f"{column} > ?", [value])]
+    
+    def count(self, db=None):
+        query = new_query(db)
+        query.exec_(f"SELECT COUNT(*) FROM {self.table}")
+        return query.value(0) if query.next() else 0
+    
+    def position(self, key, db=None):
+        # Number of rows before key: the rows after it in the reverse order,
+        # counted over the same index ranges a page fetch reads.
+        reverse = KeysetQuery(self.table, self.columns, self.sort_column, not self.descending, self.page_size)
+        position = 0
+        for where, params in reverse.segments(key):
+            query = new_query(db)
+            query.prepare(f"SELECT COUNT(*) FROM {self.table}" + (f" WHERE {where}" if where else ""))
+            for value in params:
+                query.addBindValue(value)
+            if query.exec_() and query.next():
+                position += query.value(0)
+        return position
+    
+    def seek(self, page_no, db=None):
+        # No neighbouring page is cached: find the key just before the page by
+        # skipping over the index, which touches keys only.
+        key_columns = "id" if self.sort_column == "id" else f"{self.sort_column}, id"
+        query = new_query(db)
+        query.prepare(f"SELECT {key_columns} FROM {self.table} ORDER BY {self.order_by()} LIMIT 1 OFFSET ?")
+        query.addBindValue(page_no * self.page_size - 1)
+        if query.exec_() and query.next():
+            return tuple(None if query.isNull(i) else query.value(i) for i in range(query.record().count()))
+        return None
+    
+    def ids(self, first, count, db=None):
+        # Ids of count rows from row first on, read from the index alone.
+        query = new_query(db)
+        query.setForwardOnly(True)
+        query.prepare(f"SELECT id FROM {self.table} ORDER BY {self.order_by()} LIMIT ? OFFSET ?")
+        query.addBindValue(count)
+        query.addBindValue(first)
+        ids = []
+        if query.exec_():
+            while query.next():
+                ids.append(query.value(0))
+        return ids
+    
+    def load_page(self, key, db=None):
+        page = []
+        for where, params in self.segments(key):
+            sql = f"SELECT {', '.join(self.columns)} FROM {self.table}"
+            if where:
+                sql += f" WHERE {where}"
+            sql += f" ORDER BY {self.order_by()} LIMIT {self.page_size - len(page)}"
+            query = new_query(db)
+            query.setForwardOnly(True)
+            query.prepare(sql)
+            for value in params:
+                query.addBindValue(value)
+            if query.exec_():
+                page.extend(query_rows(query))
+            if len(page) >= self.page_size:
+                break
+        return page
+    
+    def load_matches(self, ids, db=None):
+        if not ids:
+            return []
+        query = new_query(db)
+        query.setForwardOnly(True)
+        query.prepare(f"SELECT {', '.join(self.columns)} FROM {self.table} "
+                      f"WHERE id IN ({', '.join('?' * len(ids))})")
+        for row_id in ids:
+            query.addBindValue(row_id)
+        rows = {}
+        if query.exec_():
+            for values in query_rows(query):
+                rows[values[self.id_column]] = values
+        # Keep rank order; rows deleted since the search are dropped.
+        return [rows[row_id] for row_id in ids if row_id in rows]
+
+def _select_keyset(db, cancelled, keyset, search_table, search_text):
+    # Row count (or ranked search matches) and the first page, in one trip.
+    if search_table is None:
+        return keyset.count(db), None, keyset.load_page(None, db)
+    ids = search_ids(keyset.table, search_table, search_text, db=db)
+    return len(ids), ids, keyset.load_matches(ids[:keyset.page_size], db)
+
+def _load_keyset_page(db, cancelled, keyset, page_no, key, match_ids):
+    if match_ids is not None:
+        return keyset.load_matches(match_ids, db)
+    if key is None and page_no > 0:
+        key = keyset.seek(page_no, db)
+    return keyset.load_page(key, db)
+
+def _load_keyset_changes(db, cancelled, keyset, ids, keep_ids, searching):
+    # Current values of the changed rows and, unless searching, the new row
+    # count and where the changed and kept rows now sit. A deleted row's old
+    # place is only known when the order is by id.
+    rows = {values[keyset.id_column]: values for values in keyset.load_matches(list(set(ids) | set(keep_ids)), db)}
+    if searching:
+        return rows, None, {}
+    positions = {}
+    for row_id in set(ids) | set(keep_ids):
+        if row_id in rows:
+            positions[row_id] = keyset.position(keyset.key(rows[row_id]), db)
+        elif keyset.sort_column == "id":
+            positions[row_id] = keyset.position((row_id,), db)
+    return rows, keyset.count(db), positions
+
+class KeysetTableModel(QAbstractTableModel):
+    # Read-only model over one table that loads rows a page at a time with
+    # keyset queries (WHERE sort > ? ... LIMIT n) as the view asks for them.
+    # Loaded pages live in a bounded LRU cache, so memory stays flat
+    # regardless of table size. Sorting is limited to columns that lead an
+    # index, which keeps every page fetch an index range scan.
+    #
+    # With a search_table (an FTS5 index over table) the model can instead
+    # hold the ids of the best-ranked matches for a search and page rows in
+    # by id.
+    #
+    # Counting and page reads run on query_service; rows of a page still in
+    # flight show a placeholder and are filled in when it arrives. Results
+    # from before the latest select() are dropped.
+    #
+    # Rows the change feed reports are re-read by id. Edited rows that keep
+    # their place are updated in the cache; inserts, deletes and moves drop
+    # the cached pages from the first row affected on and move the selection
+    # and current row to where their rows now are, so the view keeps its
+    # scroll position and selection.
+    loading_changed = pyqtSignal(bool)
+    
+    def __init__(self, table, page_size=256, max_pages=32, search_table=None, parent=None):
+        super().__init__(parent)
+        self.table = table
+        self.page_size = page_size
+        self.max_pages = max_pages
+        self.search_table = search_table
+        self.search_text = ""
+        self._match_ids = None
+        record = QSqlDatabase.database().record(table)
+        self.columns = [record.fieldName(i) for i in range(record.count())]
+        self.id_column = self.columns.index("id")
+        self.sortable = self._indexed_columns()
+        self.sort_column = "id"
+        self.descending = False
+        self.keyset = self._keyset()
+        self.loading = False
+        self._generation = 0
+        self._row_count = 0
+        self._pages = OrderedDict()
+        self._requested = set()
+        # Key of the last row before each page, filled in as pages are read.
+        self._boundaries = {}
+        # Bumped when rows move, so pages read before then are dropped.
+        self._layout = 0
+        change_feed.rows_changed.connect(self._rows_changed)
+        change_feed.start()
+    
+    def _indexed_columns(self):
+        columns = {"id"}
+        query = SqlQuery()
+        query.exec_(f"PRAGMA index_list({self.table})")
+        indexes = []
+        while query.next():
+            indexes.append(query.value(1))
+        for index in indexes:
+            query.exec_(f"PRAGMA index_info({index})")
+            while query.next():
+                if query.value(0) == 0:
+                    columns.add(query.value(2))
+        return columns
+    
+    def _keyset(self):
+        return KeysetQuery(self.table, self.columns, self.sort_column, self.descending, self.page_size)
+    
+    def _set_loading(self, loading):
+        if loading != self.loading:
+            self.loading = loading
+            self.loading_changed.emit(loading)
+    
+    def select(self):
+        # The current rows stay on screen until the new count arrives.
+        self._generation += 1
+        generation = self._generation
+        keyset = self._keyset()
+        searching = self.search_table is not None and fts_match_query(self.search_text) is not None
+        self._set_loading(True)
+        query_service.submit(_select_keyset, keyset, self.search_table if searching else None, self.search_text,
+                             on_result=lambda result: self._selected(generation, keyset, result),
+                             on_error=lambda error: self._set_loading(False), channel=self)
+        return True
+    
+    def _selected(self, generation, keyset, result):
+        if generation != self._generation:
+            return
+        row_count, match_ids, first_page = result
+        self._layout += 1
+        self.beginResetModel()
+        self.keyset = keyset
+        self._row_count = row_count
+        self._match_ids = match_ids
+        self._pages.clear()
+        self._requested.clear()
+        self._boundaries.clear()
+        self._store_page(0, first_page)
+        self.endResetModel()
+        self._set_loading(False)
+    
+    def search(self, text):
+        self.search_text = text
+        return self.select()
+    
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self._row_count
+    
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.columns)
+    
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.columns[section]
+        return super().headerData(section, orientation, role)
+    
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role not in (Qt.DisplayRole, Qt.EditRole):
+            return None
+        row = self.row(index.row())
+        if row is None:
+            return "..." if role == Qt.DisplayRole and index.column() == 0 else None
+        return row[index.column()]
+    
+    def sort(self, column, order=Qt.AscendingOrder):
+        name = self.columns[column]
+        if name not in self.sortable:
+            return
+        self.sort_column = name
+        self.descending = order == Qt.DescendingOrder
+        self.select()
+    
+    def is_sortable(self, column):
+        return self.columns[column] in self.sortable
+    
+    def row(self, row):
+        # None while the row's page is being fetched.
+        page_no, offset = divmod(row, self.page_size)
+        page = self._pages.get(page_no)
+        if page is None:
+            self._request_page(page_no)
+            return None
+        self._pages.move_to_end(page_no)
+        return page[offset] if offset < len(page) else None
+    
+    def row_id(self, row):
+        values = self.row(row)
+        return None if values is None else values[self.id_column]
+    
+    def row_ids(self, rows):
+        # Ids of the given rows, in order. Runs of rows whose pages are not
+        # in the cache are read straight from the index.
+        if self._match_ids is not None:
+            return [self._match_ids[row] for row in rows]
+        ids = []
+        for _, run in itertools.groupby(enumerate(rows), lambda pair: pair[1] - pair[0]):
+            run = [row for _, row in run]
+            cached = []
+            for row in run:
+                page = self._pages.get(row // self.page_size)
+                offset = row % self.page_size
+                if page is None or offset >= len(page):
+                    break
+                cached.append(page[offset][self.id_column])
+            ids.extend(cached if len(cached) == len(run) else self.keyset.ids(run[0], len(run)))
+        return ids
+    
+    def _cached_row(self, row):
+        page = self._pages.get(row // self.page_size)
+        offset = row % self.page_size
+        return page[offset] if page is not None and offset < len(page) else None
+    
+    def _rows_changed(self, table, changes):
+        if table != self.table or self._generation == 0:
+            return
+        if self.loading or changes is None:
+            # A select in flight may have read the rows before the change.
+            self.select()
+            return
+        keep_ids = set()
+        for index in self.persistentIndexList():
+            values = self._cached_row(index.row())
+            if values is not None:
+                keep_ids.add(values[self.id_column])
+        generation = self._generation
+        query_service.submit(_load_keyset_changes, self.keyset, list(changes), list(keep_ids),
+                             self._match_ids is not None,
+                             on_result=lambda result: self._changes_loaded(generation, changes, result))
+    
+    def _changes_loaded(self, generation, changes, result):
+        if generation != self._generation:
+            return
+        rows, row_count, positions = result
+        cached = {}
+        for page_no, page in self._pages.items():
+            for offset, values in enumerate(page):
+                if values[self.id_column] in changes:
+                    cached[values[self.id_column]] = page_no * self.page_size + offset
+        searching = self._match_ids is not None
+        if searching:
+            # New matches wait for the next search; deleted ones go.
+            match_rows = {row_id: row for row, row_id in enumerate(self._match_ids)
+                          if row_id in changes and row_id not in rows}
+        places = []
+        # A row keeps its structural flag after its insert was seen, so the
+        # flag only counts while the row count is off.
+        for row_id, structural in changes.items():
+            values = rows.get(row_id)
+            old_row = cached.get(row_id)
+            if searching:
+                if row_id in match_rows:
+                    places.append(match_rows[row_id])
+            elif structural and row_count != self._row_count or values is None or old_row is None and self.keyset.sort_column != "id" or (
+                    old_row is not None and self.keyset.key(self._cached_row(old_row)) != self.keyset.key(values)):
+                row_places = [row for row in (old_row, positions.get(row_id)) if row is not None]
+                # Without its old key a deleted row could have been anywhere.
+                places.extend(row_places or [0])
+        if not places:
+            for row_id, row in cached.items():
+                if row_id in rows:
+                    self._pages[row // self.page_size][row % self.page_size] = rows[row_id]
+                    self.dataChanged.emit(self.index(row, 0), self.index(row, len(self.columns) - 1))
+            return
+        if searching:
+            self._match_ids = array("q", (row_id for row_id in self._match_ids if row_id not in match_rows))
+            row_count = len(self._match_ids)
+            positions = {row_id: row for row, row_id in enumerate(self._match_ids)}
+        self._relayout(min(places), row_count, changes, positions, rows, cached)
+    
+    def _relayout(self, first, row_count, changes, positions, rows, cached):
+        old_count = self._row_count
+        if row_count > old_count:
+            self.beginInsertRows(QModelIndex(), old_count, row_count - 1)
+            self._row_count = row_count
+            self.endInsertRows()
+        self.layoutAboutToBeChanged.emit()
+        old_indexes = self.persistentIndexList()
+        new_indexes = []
+        for index in old_indexes:
+            values = self._cached_row(index.row())
+            row_id = None if values is None else values[self.id_column]
+            if row_id in changes and row_id not in rows:
+                new_indexes.append(QModelIndex())
+            elif index.row() >= first and positions.get(row_id, row_count) < row_count:
+                new_indexes.append(self.index(positions[row_id], index.column()))
+            else:
+                new_indexes.append(index)
+        # Pages read before now may hold rows that have since moved.
+        self._requested.clear()
+        self._layout += 1
+        first_page = first // self.page_size
+        for page_no in [page_no for page_no in self._pages if page_no >= first_page]:
+            del self._pages[page_no]
+        for page_no in [page_no for page_no in self._boundaries if page_no > first_page]:
+            del self._boundaries[page_no]
+        for row_id, row in cached.items():
+            if row // self.page_size in self._pages and row_id in rows:
+                self._pages[row // self.page_size][row % self.page_size] = rows[row_id]
+        self.changePersistentIndexList(old_indexes, new_indexes)
+        self.layoutChanged.emit()
+        if row_count < old_count:
+            self.beginRemoveRows(QModelIndex(), row_count, old_count - 1)
+            self._row_count = row_count
+            self.endRemoveRows()
+    
+    def _request_page(self, page_no):
+        # The request is tied to the keyset it reads with: a select() in
+        # flight swaps in its keyset only when its count arrives.
+        if page_no in self._requested:
+            return
+        self._requested.add(page_no)
+        keyset = self.keyset
+        layout = self._layout
+        match_ids = None
+        if self._match_ids is not None:
+            match_ids = self._match_ids[page_no * self.page_size:(page_no + 1) * self.page_size]
+        query_service.submit(_load_keyset_page, keyset, page_no, self._boundaries.get(page_no), match_ids,
+                             on_result=lambda page: self._page_loaded(keyset, layout, page_no, page),
+                             on_error=lambda error: self._page_failed(keyset, page_no, error))
+    
+    def _page_loaded(self, keyset, layout, page_no, page):
+        if keyset is not self.keyset or layout != self._layout:
+            return
+        self._requested.discard(page_no)
+        self._store_page(page_no, page)
+        first = page_no * self.page_size
+        last = min(first + self.page_size, self._row_count) - 1
+        if last >= first:
+            self.dataChanged.emit(self.index(first, 0), self.index(last, len(self.columns) - 1))
+    
+    def _page_failed(self, keyset, page_no, error):
+        # The page is fetched again the next time the view asks for it.
+        if keyset is self.keyset:
+            self._requested.discard(page_no)
+        print(f"Page query failed: {error}", file=sys.stderr)
+    
+    def _store_page(self, page_no, page):
+        if page and self._match_ids is None:
+            self._boundaries[page_no + 1] = self.keyset.key(page[-1])
+        self._pages[page_no] = page
+        while len(self._pages) > self.max_pages:
+            self._pages.popitem(last=False)
+
+SEARCH_RESULT_LIMIT = 5000
+
+ORDER_LINES_QUERY = """SELECT l.id, l.item_id, s.sku, s.name AS item, l.quantity, l.price
+                       FROM {table} l
+                       LEFT JOIN StockItems s ON s.id = l.item_id
+                       WHERE l.order_id = ? AND l.id > ?
+                       ORDER BY l.id"""
+
+class OrderLinesModel(RowsTableModel):
+    # The lines of one order, read once in the background. After that, lines
+    # added, edited or deleted through this model change only their own rows.
+    editable_columns = ("quantity", "price")
+    
+    def __init__(self, table, order_id, parent=None):
+        super().__init__(parent)
+        self.table = table
+        self.order_id = order_id
+    
+    def select(self):
+        self.load(ORDER_LINES_QUERY.format(table=self.table), [self.order_id, 0])
+    
+    def last_id(self):
+        return self.rows[-1][0] if self.rows else 0
+    
+    def fetch_new(self):
+        # Appends lines committed since the rows were read. A read still in
+        # flight may predate the commit, so it is started again instead.
+        if self.loading:
+            self.select()
+            return
+        query = SqlQuery()
+        query.setForwardOnly(True)
+        query.prepare(ORDER_LINES_QUERY.format(table=self.table))
+        query.addBindValue(self.order_id)
+        query.addBindValue(self.last_id())
+        if query.exec_():
+            self.append_rows(list(query_rows(query)))
+    
+    def delete_lines(self, rows):
+        bulk_delete(self.table, [self.rows[row][0] for row in rows])
+        for row in sorted(rows, reverse=True):
+            self.remove_row(row)
+    
+    def flags(self, index):
+        flags = super().flags(index)
+        if index.isValid() and self.columns[index.column()] in self.editable_columns:
+            flags |= Qt.ItemIsEditable
+        return flags
+    
+    def setData(self, index, value, role=Qt.EditRole):
+        if not index.isValid() or role != Qt.EditRole:
+            return False
+        column = self.columns[index.column()]
+        if column not in self.editable_columns:
+            return False
+        query = SqlQuery()
+        query.prepare(f"UPDATE {self.table} SET {column} = ? WHERE id = ?")
+        query.addBindValue(value)
+        query.addBindValue(self.rows[index.row()][0])
+        if not query.exec_():
+            return False
+        row = self.rows[index.row()]
+        self.rows[index.row()] = row[:index.column()] + (value,) + row[index.column() + 1:]
+        self.dataChanged.emit(index, index)
+        data_events.stock_changed.emit()
+        return True
+
+def fts_match_query(text):
+    # Every word typed becomes a quoted prefix term, all of which must match.
+    words = re.findall(r"\w+", text)
+    if not words:
+        return None
+    return " ".join(f'"{word}"*' for word in words)
+
+def search_ids(table, search_table, text, limit=SEARCH_RESULT_LIMIT, db=None):
+    # Up to limit matches are streamed from the index unranked, then ranked
+    # among themselves: names starting with the text, then names containing
+    # it, then matches in other columns, shorter names first. FTS5's bm25
+    # rank is avoided because it counts every row holding each term, which
+    # takes seconds for common words on large tables.
+    like = text.strip().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    query = new_query(db)
+    query.setForwardOnly(True)
+    query.prepare(f"""SELECT t.id
+                      FROM (SELECT rowid FROM {search_table} WHERE {search_table} MATCH ? LIMIT ?) AS m
+                      JOIN {table} t ON t.id = m.rowid
+                      ORDER BY CASE WHEN t.name LIKE ? ESCAPE '\\' THEN 0
+                                    WHEN t.name LIKE ? ESCAPE '\\' THEN 1
+                                    ELSE 2 END,
+                               length(t.name), t.id""")
+    query.addBindValue(fts_match_query(text))
+    query.addBindValue(limit)
+    query.addBindValue(f"{like}%")
+    query.addBindValue(f"%{like}%")
+    ids = array("q")
+    if query.exec_():
+        while query.next():
+            ids.append(query.value(0))
+    return ids
+
+class SearchBox(QLineEdit):
+    # Emits search_requested once typing pauses.
+    search_requested = pyqtSignal(str)
+    
+    def __init__(self, placeholder, delay_ms=200, parent=None):
+        super().__init__(parent)
+        self.setPlaceholderText(placeholder)
+        self.setClearButtonEnabled(True)
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(delay_ms)
+        self.timer.timeout.connect(lambda: self.search_requested.emit(self.text()))
+        self.textChanged.connect(self.timer.start)
+
+def setup_keyset_view(view, model, sample_rows=100, max_width=300):
+    view.setModel(model)
+    view.setSelectionBehavior(QTableView.SelectRows)
+    view.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+    header = view.horizontalHeader()
+    # Only offer sorting on columns the model can page through by index.
+    def sort_changed(column, order):
+        if not model.is_sortable(column):
+            header.blockSignals(True)
+            header.setSortIndicator(model.columns.index(model.sort_column),
+                                    Qt.DescendingOrder if model.descending else Qt.AscendingOrder)
+            header.blockSignals(False)
+    header.sortIndicatorChanged.connect(sort_changed)
+    view.setSortingEnabled(True)
+    # Column widths come from the first rows, which arrive with the first
+    # select() result.
+    def first_reset():
+        model.modelReset.disconnect(first_reset)
+        estimate_column_widths(view, model, sample_rows, max_width)
+    model.modelReset.connect(first_reset)
+
+def estimate_column_widths(view, model, sample_rows=100, max_width=300):
+    # Sized from the first rows instead of resizeColumnsToContents(), which
+    # would touch every row of the table.
+    metrics = view.fontMetrics()
+    padding = 24
+    for column, name in enumerate(model.columns):
+        width = metrics.horizontalAdvance(name)
+        for row in range(min(sample_rows, model.rowCount())):
+            value = model.data(model.index(row, column))
+            if value is not None:
+                width = max(width, metrics.horizontalAdvance(str(value)))
+        view.setColumnWidth(column, min(width + padding, max_width))
+
+# --- Item Picker ---
+# Type-ahead item lookup for order lines. Each step below is an index range
+# or FTS lookup that stops after `limit` rows, so a search costs the same on
+# any catalogue size: SKUs starting with the text, then names starting with
+# it (case-insensitively), then items with a word starting with each word
+# typed. Another page is fetched when the popup is scrolled to its end (not
+# through canFetchMore, which QCompleter calls until everything is loaded).
+ITEM_PICKER_PAGE = 20
+ITEM_PICKER_DELAY_MS = 50
+ITEM_PICKER_SKU_QUERY = """SELECT id, sku, name, unit_price FROM StockItems
+                           WHERE sku >= ? AND sku < ? AND archived = 0 ORDER BY sku LIMIT ?"""
+ITEM_PICKER_NAME_QUERY = """SELECT id, sku, name, unit_price FROM StockItems
+                            WHERE name >= ? COLLATE NOCASE AND name < ? COLLATE NOCASE AND archived = 0
+                            ORDER BY name COLLATE NOCASE LIMIT ?"""
+ITEM_PICKER_WORD_QUERY = """SELECT si.id, si.sku, si.name, si.unit_price
+                            FROM (SELECT rowid FROM StockItemsSearch WHERE StockItemsSearch MATCH ? LIMIT ?) AS m
+                            JOIN StockItems si ON si.id = m.rowid
+                            WHERE si.archived = 0"""
+# Sorts after every character, so [text, text + _PREFIX_END) is a prefix range.
+_PREFIX_END = "\U0010ffff"
+
+def normalize_sku(text):
+    text = (text or "").strip().upper()
+    return text or None
+
+def search_items(db, cancelled, text, limit=ITEM_PICKER_PAGE):
+    # Returns up to limit (id, sku, name, unit_price) rows.
+    text = text.strip()
+    steps = []
+    if text and " " not in text:
+        sku = text.upper()
+        steps.append((ITEM_PICKER_SKU_QUERY, [sku, sku + _PREFIX_END]))
+    steps.append((ITEM_PICKER_NAME_QUERY, [text, text + _PREFIX_END]))
+    match = fts_match_query(text)
+    if match is not None:
+        steps.append((ITEM_PICKER_WORD_QUERY, [match]))
+    rows = []
+    seen = set()
+    query = new_query(db)
+    query.setForwardOnly(True)
+    for sql, params in steps:
+        if len(rows) >= limit or cancelled():
+            break
+        query.prepare(sql)
+        for value in params + [limit]:
+            query.addBindValue(value)
+        if not query.exec_():
+            raise RuntimeError(query.lastError().text())
+        for row in query_rows(query):
+            if row[0] not in seen:
+                seen.add(row[0])
+                rows.append(row)
+                if len(rows) == limit:
+                    break
+        query.finish()
+    return rows
+
+class ItemMatchesModel(QAbstractListModel):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.rows = []
+        self.text = ""
+        self.limit = ITEM_PICKER_PAGE
+        self.exhausted = True
+        self.loading = False
+    
+    def search(self, text):
+        self.text = text
+        self.limit = ITEM_PICKER_PAGE
+        self._fetch()
+    
+    def _fetch(self):
+        self.loading = True
+        limit = self.limit
+        query_service.submit(search_items, self.text, limit,
+                             on_result=lambda rows: self._loaded(rows, limit), channel=self)
+    
+    def _loaded(self, rows, limit):
+        self.loading = False
+        self.exhausted = len(rows) < limit
+        count = len(self.rows)
+        # A further page of the same search keeps the rows already shown.
+        if limit > ITEM_PICKER_PAGE and [row[0] for row in rows[:count]] == [row[0] for row in self.rows]:
+            if len(rows) > count:
+                self.beginInsertRows(QModelIndex(), count, len(rows) - 1)
+                self.rows = rows
+                self.endInsertRows()
+        else:
+            self.beginResetModel()
+            self.rows = rows
+            self.endResetModel()
+    
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+    
+    def fetch_more(self):
+        if not self.exhausted and not self.loading:
+            self.limit += ITEM_PICKER_PAGE
+            self._fetch()
+    
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        item_id, sku, name, unit_price = self.rows[index.row()]
+        if role in (Qt.DisplayRole, Qt.EditRole):
+            return f"{sku}  {name}" if sku else name
+        if role == Qt.UserRole:
+            return index.row()
+        return None
+
+class ItemPicker(QLineEdit):
+    # Emits item_selected(item_id, unit_price) when a match is chosen, and
+    # (None, None) when the text is edited after that.
+    item_selected = pyqtSignal(object, object)
+    
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setPlaceholderText("Type a SKU or name...")
+        self.setClearButtonEnabled(True)
+        self.item_id = None
+        self.unit_price = None
+        self.model = ItemMatchesModel(self)
+        self.completer = QCompleter(self.model, self)
+        self.completer.setCompletionMode(QCompleter.UnfilteredPopupCompletion)
+        self.completer.setMaxVisibleItems(12)
+        self.completer.setWidget(self)
+        self.completer.activated[QModelIndex].connect(self.choose)
+        scroll_bar = self.completer.popup().verticalScrollBar()
+        scroll_bar.valueChanged.connect(lambda value: value == scroll_bar.maximum() and self.model.fetch_more())
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(ITEM_PICKER_DELAY_MS)
+        self.timer.timeout.connect(lambda: self.model.search(self.text()))
+        self.textEdited.connect(self.text_edited)
+        self.model.modelReset.connect(self.show_matches)
+        self.model.search("")
+    
+    def text_edited(self, text):
+        if self.item_id is not None:
+            self.item_id = self.unit_price = None
+            self.item_selected.emit(None, None)
+        self.timer.start()
+    
+    def show_matches(self):
+        if self.hasFocus() and self.item_id is None and self.model.rows:
+            self.completer.complete()
+    
+    def choose(self, index):
+        self.select_row(index.data(Qt.UserRole))
+    
+    def select_row(self, row):
+        item_id, sku, name, unit_price = self.model.rows[row]
+        self.setText(f"{sku}  {name}" if sku else name)
+        self.item_id = item_id
+        self.unit_price = unit_price
+        self.item_selected.emit(item_id, unit_price)
+
 # --- Tab Widgets ---
 class StockItemsTab(QWidget):
     def __init__(self, parent=None):
         super().__init__(parent)
         layout = QVBoxLayout()
         self.table_view = QTableView()
-        self.model = QSqlTableModel()
-        self.model.setTable("StockItems")
-        self.model.setEditStrategy(QSqlTableModel.OnManualSubmit)
+        self.model = KeysetTableModel("StockItems", search_table="StockItemsSearch")
         self.model.select()
-        self.table_view.setModel(self.model)
-        self.table_view.resizeColumnsToContents()
+        setup_keyset_view(self.table_view, self.model)
+        self.search_box = SearchBox("Search items...")
+        self.search_box.search_requested.connect(self.model.search)
+        layout.addWidget(self.search_box)
         layout.addWidget(self.table_view)
+        layout.addWidget(LoadingIndicator(self.model))
         buttons_layout = QHBoxLayout()
         add_button = QPushButton(QIcon("add.png"), "Add Item")
         add_button.setToolTip("Add a new stock item")
@@ -584,17 +3508,24 @@ class StockItemsTab(QWidget):
         edit_button.setToolTip("Edit selected stock item")
         edit_button.clicked.connect(self.edit_item)
         buttons_layout.addWidget(edit_button)
-        delete_button = QPushButton(QIcon("delete.png"), "Delete Item")
-        delete_button.setToolTip("Delete selected stock item")
+        delete_button = QPushButton(QIcon("delete.png"), "Delete Items")
+        delete_button.setToolTip("Delete the selected stock items")
         delete_button.clicked.connect(self.delete_item)
         buttons_layout.addWidget(delete_button)
+        archive_button = QPushButton("Archive")
+        archive_button.setToolTip("Hide the selected stock items from pickers and new orders")
+        archive_button.clicked.connect(self.archive_items)
+        buttons_layout.addWidget(archive_button)
+        restore_button = QPushButton("Restore")
+        restore_button.setToolTip("Bring the selected archived stock items back")
+        restore_button.clicked.connect(self.restore_items)
+        buttons_layout.addWidget(restore_button)
         layout.addLayout(buttons_layout)
         self.setLayout(layout)
     
     def add_item(self):
         dialog = AddStockItemDialog(self)
-        if dialog.exec_() == QDialog.Accepted:
-            self.model.select()
+        dialog.exec_()
     
     def edit_item(self):
         selected = self.table_view.selectedIndexes()
@@ -604,35 +3535,33 @@ class StockItemsTab(QWidget):
         row = selected[0].row()
         item_id = self.model.index(row, 0).data()
         dialog = EditStockItemDialog(item_id, self)
-        if dialog.exec_() == QDialog.Accepted:
-            self.model.select()
+        dialog.exec_()
     
     def delete_item(self):
-        selected = self.table_view.selectedIndexes()
-        if not selected:
-            QMessageBox.warning(self, "Warning", "Please select an item to delete")
-            return
-        row = selected[0].row()
-        reply = QMessageBox.question(self, "Confirm", "Delete this item?", QMessageBox.Yes | QMessageBox.No)
-        if reply == QMessageBox.Yes:
-            self.model.removeRow(row)
-            if self.model.submitAll():
-                self.model.select()
-            else:
-                QMessageBox.critical(self, "Error", "Failed to delete item")
+        if delete_selected(self, self.table_view, self.model, "item"):
+            data_events.stock_changed.emit()
+    
+    def archive_items(self):
+        if archive_selected(self, self.table_view, self.model, "item"):
+            data_events.stock_changed.emit()
+    
+    def restore_items(self):
+        if archive_selected(self, self.table_view, self.model, "item", archived=False):
+            data_events.stock_changed.emit()
 
 class SuppliersTab(QWidget):
     def __init__(self, parent=None):
         super().__init__(parent)
         layout = QVBoxLayout()
         self.table_view = QTableView()
-        self.model = QSqlTableModel()
-        self.model.setTable("Suppliers")
-        self.model.setEditStrategy(QSqlTableModel.OnManualSubmit)
+        self.model = KeysetTableModel("Suppliers", search_table="SuppliersSearch")
         self.model.select()
-        self.table_view.setModel(self.model)
-        self.table_view.resizeColumnsToContents()
+        setup_keyset_view(self.table_view, self.model)
+        self.search_box = SearchBox("Search suppliers...")
+        self.search_box.search_requested.connect(self.model.search)
+        layout.addWidget(self.search_box)
         layout.addWidget(self.table_view)
+        layout.addWidget(LoadingIndicator(self.model))
         buttons_layout = QHBoxLayout()
         add_button = QPushButton(QIcon("add.png"), "Add Supplier")
         add_button.setToolTip("Add a new supplier")
@@ -642,17 +3571,24 @@ class SuppliersTab(QWidget):
         edit_button.setToolTip("Edit selected supplier")
         edit_button.clicked.connect(self.edit_supplier)
         buttons_layout.addWidget(edit_button)
-        delete_button = QPushButton(QIcon("delete.png"), "Delete Supplier")
-        delete_button.setToolTip("Delete selected supplier")
+        delete_button = QPushButton(QIcon("delete.png"), "Delete Suppliers")
+        delete_button.setToolTip("Delete the selected suppliers")
         delete_button.clicked.connect(self.delete_supplier)
         buttons_layout.addWidget(delete_button)
+        archive_button = QPushButton("Archive")
+        archive_button.setToolTip("Hide the selected suppliers from pickers and new orders")
+        archive_button.clicked.connect(self.archive_suppliers)
+        buttons_layout.addWidget(archive_button)
+        restore_button = QPushButton("Restore")
+        restore_button.setToolTip("Bring the selected archived suppliers back")
+        restore_button.clicked.connect(self.restore_suppliers)
+        buttons_layout.addWidget(restore_button)
         layout.addLayout(buttons_layout)
         self.setLayout(layout)
     
     def add_supplier(self):
         dialog = AddSupplierDialog(self)
-        if dialog.exec_() == QDialog.Accepted:
-            self.model.select()
+        dialog.exec_()
     
     def edit_supplier(self):
         selected = self.table_view.selectedIndexes()
@@ -662,35 +3598,30 @@ class SuppliersTab(QWidget):
         row = selected[0].row()
         supplier_id = self.model.index(row, 0).data()
         dialog = EditSupplierDialog(supplier_id, self)
-        if dialog.exec_() == QDialog.Accepted:
-            self.model.select()
+        dialog.exec_()
     
     def delete_supplier(self):
-        selected = self.table_view.selectedIndexes()
-        if not selected:
-            QMessageBox.warning(self, "Warning", "Please select a supplier to delete")
-            return
-        row = selected[0].row()
-        reply = QMessageBox.question(self, "Confirm", "Delete this supplier?", QMessageBox.Yes | QMessageBox.No)
-        if reply == QMessageBox.Yes:
-            self.model.removeRow(row)
-            if self.model.submitAll():
-                self.model.select()
-            else:
-                QMessageBox.critical(self, "Error", "Failed to delete supplier")
+        delete_selected(self, self.table_view, self.model, "supplier")
+    
+    def archive_suppliers(self):
+        archive_selected(self, self.table_view, self.model, "supplier")
+    
+    def restore_suppliers(self):
+        archive_selected(self, self.table_view, self.model, "supplier", archived=False)
 
 class CustomersTab(QWidget):
     def __init__(self, parent=None):
         super().__init__(parent)
         layout = QVBoxLayout()
         self.table_view = QTableView()
-        self.model = QSqlTableModel()
-        self.model.setTable("Customers")
-        self.model.setEditStrategy(QSqlTableModel.OnManualSubmit)
+        self.model = KeysetTableModel("Customers", search_table="CustomersSearch")
         self.model.select()
-        self.table_view.setModel(self.model)
-        self.table_view.resizeColumnsToContents()
+        setup_keyset_view(self.table_view, self.model)
+        self.search_box = SearchBox("Search customers...")
+        self.search_box.search_requested.connect(self.model.search)
+        layout.addWidget(self.search_box)
         layout.addWidget(self.table_view)
+        layout.addWidget(LoadingIndicator(self.model))
         buttons_layout = QHBoxLayout()
         add_button = QPushButton(QIcon("add.png"), "Add Customer")
         add_button.setToolTip("Add a new customer")
@@ -700,17 +3631,24 @@ class CustomersTab(QWidget):
         edit_button.setToolTip("Edit selected customer")
         edit_button.clicked.connect(self.edit_customer)
         buttons_layout.addWidget(edit_button)
-        delete_button = QPushButton(QIcon("delete.png"), "Delete Customer")
-        delete_button.setToolTip("Delete selected customer")
+        delete_button = QPushButton(QIcon("delete.png"), "Delete Customers")
+        delete_button.setToolTip("Delete the selected customers")
         delete_button.clicked.connect(self.delete_customer)
         buttons_layout.addWidget(delete_button)
+        archive_button = QPushButton("Archive")
+        archive_button.setToolTip("Hide the selected customers from pickers and new orders")
+        archive_button.clicked.connect(self.archive_customers)
+        buttons_layout.addWidget(archive_button)
+        restore_button = QPushButton("Restore")
+        restore_button.setToolTip("Bring the selected archived customers back")
+        restore_button.clicked.connect(self.restore_customers)
+        buttons_layout.addWidget(restore_button)
         layout.addLayout(buttons_layout)
         self.setLayout(layout)
     
     def add_customer(self):
         dialog = AddCustomerDialog(self)
-        if dialog.exec_() == QDialog.Accepted:
-            self.model.select()
+        dialog.exec_()
     
     def edit_customer(self):
         selected = self.table_view.selectedIndexes()
@@ -720,35 +3658,27 @@ class CustomersTab(QWidget):
         row = selected[0].row()
         customer_id = self.model.index(row, 0).data()
         dialog = EditCustomerDialog(customer_id, self)
-        if dialog.exec_() == QDialog.Accepted:
-            self.model.select()
+        dialog.exec_()
     
     def delete_customer(self):
-        selected = self.table_view.selectedIndexes()
-        if not selected:
-            QMessageBox.warning(self, "Warning", "Please select a customer to delete")
-            return
-        row = selected[0].row()
-        reply = QMessageBox.question(self, "Confirm", "Delete this customer?", QMessageBox.Yes | QMessageBox.No)
-        if reply == QMessageBox.Yes:
-            self.model.removeRow(row)
-            if self.model.submitAll():
-                self.model.select()
-            else:
-                QMessageBox.critical(self, "Error", "Failed to delete customer")
+        delete_selected(self, self.table_view, self.model, "customer")
+    
+    def archive_customers(self):
+        archive_selected(self, self.table_view, self.model, "customer")
+    
+    def restore_customers(self):
+        archive_selected(self, self.table_view, self.model, "customer", archived=False)
 
 class PurchaseOrdersTab(QWidget):
     def __init__(self, parent=None):
         super().__init__(parent)
         layout = QVBoxLayout()
         self.table_view = QTableView()
-        self.model = QSqlTableModel()
-        self.model.setTable("PurchaseOrders")
-        self.model.setEditStrategy(QSqlTableModel.OnManualSubmit)
+        self.model = KeysetTableModel("PurchaseOrders")
         self.model.select()
-        self.table_view.setModel(self.model)
-        self.table_view.resizeColumnsToContents()
+        setup_keyset_view(self.table_view, self.model)
         layout.addWidget(self.table_view)
+        layout.addWidget(LoadingIndicator(self.model))
         buttons_layout = QHBoxLayout()
         add_button = QPushButton(QIcon("add.png"), "Add Order")
         add_button.setToolTip("Add a new purchase order")
@@ -758,13 +3688,24 @@ class PurchaseOrdersTab(QWidget):
         manage_items_button.setToolTip("Manage items for selected order")
         manage_items_button.clicked.connect(self.manage_items)
         buttons_layout.addWidget(manage_items_button)
+        status_button = QPushButton("Set Status")
+        status_button.setToolTip("Change the status of the selected order")
+        status_button.clicked.connect(self.set_status)
+        buttons_layout.addWidget(status_button)
+        history_button = QPushButton("History")
+        history_button.setToolTip("Show live and archived purchase orders")
+        history_button.clicked.connect(self.show_history)
+        buttons_layout.addWidget(history_button)
         layout.addLayout(buttons_layout)
         self.setLayout(layout)
     
     def add_order(self):
         dialog = AddPurchaseOrderDialog(self)
-        if dialog.exec_() == QDialog.Accepted:
-            self.model.select()
+        dialog.exec_()
+    
+    def show_history(self):
+        dialog = OrderHistoryDialog("Purchase", self)
+        dialog.exec_()
     
     def manage_items(self):
         selected = self.table_view.selectedIndexes()
@@ -775,19 +3716,40 @@ class PurchaseOrdersTab(QWidget):
         order_id = self.model.index(row, 0).data()
         dialog = ManageOrderItemsDialog(order_id, "Purchase", self)
         dialog.exec_()
+    
+    def set_status(self):
+        selected = self.table_view.selectedIndexes()
+        if not selected:
+            QMessageBox.warning(self, "Warning", "Please select an order")
+            return
+        row = selected[0].row()
+        order_id = self.model.index(row, 0).data()
+        current = self.model.index(row, 3).data()
+        index = PURCHASE_STATUSES.index(current) if current in PURCHASE_STATUSES else 0
+        status, ok = QInputDialog.getItem(self, "Set Status", f"Status of order {order_id}:", PURCHASE_STATUSES, index, False)
+        if ok and status != current:
+            version = self.model.index(row, self.model.columns.index("version")).data()
+            try:
+                updated = set_order_status("Purchase", order_id, status, {"status": current, "version": version})
+            except ConcurrentEditError as e:
+                QMessageBox.warning(self, "Changed by Another User",
+                                    f"Another user has set order {order_id} to {e.current['status']} meanwhile.")
+                return
+            if updated:
+                data_events.stock_changed.emit()
+            else:
+                QMessageBox.critical(self, "Error", "Failed to update order status")
 
 class SalesOrdersTab(QWidget):
     def __init__(self, parent=None):
         super().__init__(parent)
         layout = QVBoxLayout()
         self.table_view = QTableView()
-        self.model = QSqlTableModel()
-        self.model.setTable("SalesOrders")
-        self.model.setEditStrategy(QSqlTableModel.OnManualSubmit)
+        self.model = KeysetTableModel("SalesOrders")
         self.model.select()
-        self.table_view.setModel(self.model)
-        self.table_view.resizeColumnsToContents()
+        setup_keyset_view(self.table_view, self.model)
         layout.addWidget(self.table_view)
+        layout.addWidget(LoadingIndicator(self.model))
         buttons_layout = QHBoxLayout()
         add_button = QPushButton(QIcon("add.png"), "Add Order")
         add_button.setToolTip("Add a new sales order")
@@ -797,13 +3759,24 @@ class SalesOrdersTab(QWidget):
         manage_items_button.setToolTip("Manage items for selected order")
         manage_items_button.clicked.connect(self.manage_items)
         buttons_layout.addWidget(manage_items_button)
+        status_button = QPushButton("Set Status")
+        status_button.setToolTip("Change the status of the selected order")
+        status_button.clicked.connect(self.set_status)
+        buttons_layout.addWidget(status_button)
+        history_button = QPushButton("History")
+        history_button.setToolTip("Show live and archived sales orders")
+        history_button.clicked.connect(self.show_history)
+        buttons_layout.addWidget(history_button)
         layout.addLayout(buttons_layout)
         self.setLayout(layout)
     
     def add_order(self):
         dialog = AddSalesOrderDialog(self)
-        if dialog.exec_() == QDialog.Accepted:
-            self.model.select()
+        dialog.exec_()
+    
+    def show_history(self):
+        dialog = OrderHistoryDialog("Sales", self)
+        dialog.exec_()
     
     def manage_items(self):
         selected = self.table_view.selectedIndexes()
@@ -814,97 +3787,1528 @@ class SalesOrdersTab(QWidget):
         order_id = self.model.index(row, 0).data()
         dialog = ManageOrderItemsDialog(order_id, "Sales", self)
         dialog.exec_()
+    
+    def set_status(self):
+        selected = self.table_view.selectedIndexes()
+        if not selected:
+            QMessageBox.warning(self, "Warning", "Please select an order")
+            return
+        row = selected[0].row()
+        order_id = self.model.index(row, 0).data()
+        current = self.model.index(row, 3).data()
+        index = SALES_STATUSES.index(current) if current in SALES_STATUSES else 0
+        status, ok = QInputDialog.getItem(self, "Set Status", f"Status of order {order_id}:", SALES_STATUSES, index, False)
+        if ok and status != current:
+            version = self.model.index(row, self.model.columns.index("version")).data()
+            try:
+                updated = set_order_status("Sales", order_id, status, {"status": current, "version": version})
+            except ConcurrentEditError as e:
+                QMessageBox.warning(self, "Changed by Another User",
+                                    f"Another user has set order {order_id} to {e.current['status']} meanwhile.")
+                return
+            if updated:
+                data_events.stock_changed.emit()
+            else:
+                QMessageBox.critical(self, "Error", "Failed to update order status")
+
+LOW_STOCK_QUERY = """SELECT si.name AS "Item", sl.quantity AS "Quantity",
+                             sl.reorder_point AS "Reorder Point", sl.safety_stock AS "Safety Stock",
+                             sl.reorder_point + sl.safety_stock - sl.quantity AS "Suggested Order"
+                      FROM StockLevels sl
+                      JOIN StockItems si ON si.id = sl.item_id
+                      WHERE sl.quantity < sl.reorder_point
+                      ORDER BY sl.quantity - sl.reorder_point, si.name"""
 
 class LowStockReportTab(QWidget):
     def __init__(self, parent=None):
         super().__init__(parent)
         layout = QVBoxLayout()
         self.table_view = QTableView()
-        self.model = QSqlQueryModel()
-        self.refresh_report()
+        self.model = RowsTableModel(self)
+        self.model.modelReset.connect(self.table_view.resizeColumnsToContents)
         self.table_view.setModel(self.model)
+        self.refresh_report()
         layout.addWidget(self.table_view)
+        layout.addWidget(LoadingIndicator(self.model))
         refresh_button = QPushButton("Refresh Report")
         refresh_button.clicked.connect(self.refresh_report)
         layout.addWidget(refresh_button)
         self.setLayout(layout)
+        data_events.stock_changed.connect(self.refresh_report)
+        # StockLevels is not in the ChangeLog; any commit, including one by
+        # another instance, rereads the report, which is a cheap index read.
+        change_feed.data_changed.connect(self.refresh_report)
+        change_feed.start()
+    
+    def refresh_report(self):
+        # Reads only the items in idx_stocklevels_below_reorder.
+        self.model.load(LOW_STOCK_QUERY)
+
+class AnalyticsTab(QWidget):
+    # Rollups over an Analytics snapshot of all order lines. The snapshot is
+    # read once when the tab is first shown and again on Reload Data; every
+    # change of period or grouping after that is answered from memory.
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.analytics = None
+        layout = QVBoxLayout()
+        controls_layout = QHBoxLayout()
+        self.kind_combo = QComboBox()
+        self.kind_combo.addItem("Sales", "sales")
+        self.kind_combo.addItem("Purchases", "purchases")
+        controls_layout.addWidget(self.kind_combo)
+        controls_layout.addWidget(QLabel("By:"))
+        self.by_combo = QComboBox()
+        controls_layout.addWidget(self.by_combo)
+        today = QDate.currentDate()
+        controls_layout.addWidget(QLabel("From:"))
+        self.date_from_edit = QDateEdit(today.addYears(-1).addDays(1))
+        self.date_from_edit.setCalendarPopup(True)
+        controls_layout.addWidget(self.date_from_edit)
+        controls_layout.addWidget(QLabel("To:"))
+        self.date_to_edit = QDateEdit(today)
+        self.date_to_edit.setCalendarPopup(True)
+        controls_layout.addWidget(self.date_to_edit)
+        controls_layout.addStretch()
+        layout.addLayout(controls_layout)
+        self.table_view = QTableView()
+        self.model = RowsTableModel(self)
+        self.table_view.setModel(self.model)
+        # After setModel, so the header has taken the new columns by then.
+        self.model.modelReset.connect(self.table_view.resizeColumnsToContents)
+        layout.addWidget(self.table_view)
+        layout.addWidget(LoadingIndicator(self.model))
+        self.status_label = QLabel()
+        layout.addWidget(self.status_label)
+        reload_button = QPushButton("Reload Data")
+        reload_button.setToolTip("Read the order lines again to include recent changes")
+        reload_button.clicked.connect(self.reload_data)
+        layout.addWidget(reload_button)
+        self.setLayout(layout)
+        self.fill_by_combo()
+        self.kind_combo.currentIndexChanged.connect(self.fill_by_combo)
+        self.by_combo.currentIndexChanged.connect(self.refresh_report)
+        self.date_from_edit.dateChanged.connect(self.refresh_report)
+        self.date_to_edit.dateChanged.connect(self.refresh_report)
+        self.reload_data()
+    
+    def fill_by_combo(self):
+        kind = self.kind_combo.currentData()
+        party = "customer" if kind == "sales" else "supplier"
+        current = self.by_combo.currentData()
+        if current in ("customer", "supplier"):
+            current = party
+        self.by_combo.blockSignals(True)
+        self.by_combo.clear()
+        for by in ("item", "category", party, "month"):
+            self.by_combo.addItem(by.capitalize(), by)
+        self.by_combo.setCurrentIndex(max(0, self.by_combo.findData(current)))
+        self.by_combo.blockSignals(False)
+        self.refresh_report()
+    
+    def reload_data(self):
+        self.status_label.setText("Loading order lines...")
+        query_service.submit(load_analytics, on_result=self._data_loaded, on_error=self._load_failed, channel=self)
+    
+    def _data_loaded(self, analytics):
+        self.analytics = analytics
+        self.status_label.setText(f"{len(analytics.sales)} sales and {len(analytics.purchases)} purchase lines, "
+                                  f"read in {analytics.seconds:.1f} s")
+        self.refresh_report()
+    
+    def _load_failed(self, error):
+        self.status_label.setText(f"Could not load order lines: {error}")
     
     def refresh_report(self):
-        query = QSqlQuery("SELECT si.name, sl.quantity FROM StockItems si JOIN StockLevels sl ON si.id = sl.item_id WHERE sl.quantity < 10")
-        self.model.setQuery(query)
-        self.table_view.resizeColumnsToContents()
+        if self.analytics is None:
+            return
+        by = self.by_combo.currentData()
+        self.model.load_rows(analytics_rows, self.analytics, self.kind_combo.currentData(), by,
+                             self.date_from_edit.date().toString(Qt.ISODate),
+                             self.date_to_edit.date().toString(Qt.ISODate),
+                             None if by == "month" else ANALYTICS_TAB_ROWS)
 
 # --- PDF Generation ---
-def generate_invoice_pdf(order_id, filename):
-    c = canvas.Canvas(filename, pagesize=letter)
-    width, height = letter
-    # Company Header (hardcoded for now)
-    c.setFont("Helvetica-Bold", 16)
-    c.drawString(50, height - 50, "Your Company Name")
-    c.setFont("Helvetica", 12)
-    c.drawString(50, height - 70, "123 Business St, City, Country")
-    # Invoice Title and Details
-    c.setFont("Helvetica-Bold", 14)
-    c.drawString(50, height - 120, f"Invoice #{order_id}")
-    query = QSqlQuery(f"SELECT customer_id, order_date FROM SalesOrders WHERE id = {order_id}")
-    if query.next():
-        customer_id = query.value(0)
-        order_date = query.value(1)
-        customer_query = QSqlQuery(f"SELECT name, address FROM Customers WHERE id = {customer_id}")
-        if customer_query.next():
-            customer_name = customer_query.value(0)
-            customer_address = customer_query.value(1)
-    c.setFont("Helvetica", 12)
-    c.drawString(50, height - 150, f"Date: {order_date}")
-    c.drawString(50, height - 170, "Bill To:")
-    c.drawString(50, height - 190, customer_name)
-    c.drawString(50, height - 210, customer_address or "")
-    # Items Table
+INVOICE_QUERY = """SELECT so.order_date, c.name, c.address, si.name, soi.quantity, soi.price
+                   FROM SalesOrders so
+                   LEFT JOIN Customers c ON c.id = so.customer_id
+                   LEFT JOIN SalesOrderItems soi ON soi.order_id = so.id
+                   LEFT JOIN StockItems si ON si.id = soi.item_id
+                   WHERE so.id = ?
+                   ORDER BY soi.id"""
+INVOICE_TEMPLATE_DEFAULTS = {
+    "company_name": "Your Company Name",
+    "company_address": "123 Business St, City, Country",
+    "footer_text": "",
+}
+INVOICE_ROW_HEIGHT = 20
+INVOICE_BOTTOM_MARGIN = 100
+# The footer has its own line below the page number, and is cut off at the
+# right edge of the line table.
+INVOICE_FOOTER_Y = 18
+INVOICE_FOOTER_WIDTH = 450
+INVOICE_FIRST_ROW_Y = letter[1] - 270
+INVOICE_CONTINUED_ROW_Y = letter[1] - 140
+
+def query_rows(query):
+    columns = query.record().count()
+    while query.next():
+        yield tuple(None if query.isNull(i) else query.value(i) for i in range(columns))
+
+def build_invoice(order_id, rows):
+    # One row per order line; an order without lines still yields a single row
+    # from the LEFT JOIN with NULL line columns.
+    invoice = None
+    for order_date, customer_name, customer_address, item_name, qty, price in rows:
+        if invoice is None:
+            invoice = {
+                "order_id": order_id,
+                "order_date": order_date,
+                "customer_name": customer_name or "Unknown",
+                "customer_address": customer_address or "",
+                "lines": [],
+            }
+        if qty is not None:
+            invoice["lines"].append((item_name or "Unknown Item", qty, price or 0))
+    return invoice
+
+def fetch_invoice(order_id, db=None):
+    query = new_query(db)
+    query.prepare(INVOICE_QUERY)
+    query.addBindValue(order_id)
+    if not query.exec_():
+        return None
+    return build_invoice(order_id, query_rows(query))
+
+def fetch_invoice_template(db=None):
+    template = dict(INVOICE_TEMPLATE_DEFAULTS)
+    query = new_query(db)
+    query.exec_("SELECT key, value FROM InvoiceSettings")
+    while query.next():
+        template[query.value(0)] = query.value(1)
+    return template
+
+def invoice_page_count(line_count):
+    first = int((INVOICE_FIRST_ROW_Y - INVOICE_BOTTOM_MARGIN) // INVOICE_ROW_HEIGHT) + 1
+    per_page = int((INVOICE_CONTINUED_ROW_Y - INVOICE_BOTTOM_MARGIN) // INVOICE_ROW_HEIGHT) + 1
+    if line_count <= first:
+        return 1
+    return 1 + -(-(line_count - first) // per_page)
+
+def _draw_table_header(c, y):
     c.setFont("Helvetica-Bold", 12)
-    y = height - 250
     c.drawString(50, y, "Item")
     c.drawString(200, y, "Quantity")
     c.drawString(300, y, "Price")
     c.drawString(400, y, "Total")
     c.line(50, y - 5, 500, y - 5)
-    y -= 20
+    return y - INVOICE_ROW_HEIGHT
+
+def _draw_page_number(c, page, pages):
+    c.setFont("Helvetica", 9)
+    c.drawRightString(500, 30, f"Page {page} of {pages}")
+
+def _draw_footer(c, template):
+    text = template["footer_text"]
+    if text:
+        c.setFont("Helvetica-Oblique", 9)
+        if c.stringWidth(text, "Helvetica-Oblique", 9) > INVOICE_FOOTER_WIDTH:
+            while text and c.stringWidth(text + "...", "Helvetica-Oblique", 9) > INVOICE_FOOTER_WIDTH:
+                text = text[:-1]
+            text += "..."
+        c.drawString(50, INVOICE_FOOTER_Y, text)
+
+def _draw_first_page_static(c, template):
+    width, height = letter
+    c.setFont("Helvetica-Bold", 16)
+    c.drawString(50, height - 50, template["company_name"])
+    c.setFont("Helvetica", 12)
+    c.drawString(50, height - 70, template["company_address"])
+    c.drawString(50, height - 170, "Bill To:")
+    _draw_table_header(c, height - 250)
+    _draw_footer(c, template)
+
+def _draw_continued_page_static(c, template):
+    width, height = letter
+    c.setFont("Helvetica-Bold", 16)
+    c.drawString(50, height - 50, template["company_name"])
+    _draw_table_header(c, height - 100)
+    _draw_footer(c, template)
+
+def _draw_static(c, name, draw, template, use_template):
+    # The static part of a page is defined once per canvas as a form XObject
+    # and every later page only references it.
+    if not use_template:
+        draw(c, template)
+        return
+    if not c.hasForm(name):
+        c.beginForm(name)
+        draw(c, template)
+        c.endForm()
+    c.doForm(name)
+
+def _draw_first_page_header(c, invoice, template, use_template):
+    width, height = letter
+    _draw_static(c, "invoice_first_page", _draw_first_page_static, template, use_template)
+    c.setFont("Helvetica-Bold", 14)
+    c.drawString(50, height - 120, f"Invoice #{invoice['order_id']}")
+    c.setFont("Helvetica", 12)
+    c.drawString(50, height - 150, f"Date: {invoice['order_date']}")
+    c.drawString(50, height - 190, invoice["customer_name"])
+    c.drawString(50, height - 210, invoice["customer_address"])
+    return height - 250 - INVOICE_ROW_HEIGHT
+
+def _draw_continued_page_header(c, invoice, brought_forward, template, use_template):
+    width, height = letter
+    _draw_static(c, "invoice_continued_page", _draw_continued_page_static, template, use_template)
     c.setFont("Helvetica", 12)
+    c.drawString(50, height - 70, f"Invoice #{invoice['order_id']} (continued)")
+    y = height - 100 - INVOICE_ROW_HEIGHT
+    c.setFont("Helvetica-Oblique", 12)
+    c.drawString(300, y, "Brought forward:")
+    c.drawString(400, y, f"${brought_forward:.2f}")
+    return y - INVOICE_ROW_HEIGHT
+
+def render_invoice(c, invoice, template=None, use_template=True):
+    if template is None:
+        template = INVOICE_TEMPLATE_DEFAULTS
+    lines = invoice["lines"]
+    pages = invoice_page_count(len(lines))
+    page = 1
     total_amount = 0
-    query = QSqlQuery(f"SELECT item_id, quantity, price FROM SalesOrderItems WHERE order_id = {order_id}")
-    while query.next():
-        item_id = query.value(0)
-        qty = query.value(1)
-        price = query.value(2)
-        item_query = QSqlQuery(f"SELECT name FROM StockItems WHERE id = {item_id}")
-        item_name = item_query.next() and item_query.value(0) or "Unknown Item"
+    y = _draw_first_page_header(c, invoice, template, use_template)
+    c.setFont("Helvetica", 12)
+    for item_name, qty, price in lines:
+        if y < INVOICE_BOTTOM_MARGIN:
+            c.line(50, y + INVOICE_ROW_HEIGHT - 5, 500, y + INVOICE_ROW_HEIGHT - 5)
+            c.setFont("Helvetica-Oblique", 12)
+            c.drawString(300, y, "Carried forward:")
+            c.drawString(400, y, f"${total_amount:.2f}")
+            _draw_page_number(c, page, pages)
+            c.showPage()
+            page += 1
+            y = _draw_continued_page_header(c, invoice, total_amount, template, use_template)
+            c.setFont("Helvetica", 12)
         line_total = qty * price
         total_amount += line_total
         c.drawString(50, y, item_name[:20])
         c.drawString(200, y, str(qty))
         c.drawString(300, y, f"${price:.2f}")
         c.drawString(400, y, f"${line_total:.2f}")
-        y -= 20
+        y -= INVOICE_ROW_HEIGHT
     # Total
     c.line(50, y - 5, 500, y - 5)
     c.setFont("Helvetica-Bold", 12)
     c.drawString(300, y - 25, "Total:")
     c.drawString(400, y - 25, f"${total_amount:.2f}")
+    _draw_page_number(c, page, pages)
     c.showPage()
+    return total_amount
+
+def new_canvas(filename):
+    # reportlab's canvas module is slow to import, so it is only loaded once
+    # the first invoice is actually drawn.
+    from reportlab.pdfgen import canvas
+    return canvas.Canvas(filename, pagesize=letter)
+
+def write_invoice_pdf(invoice, filename, template=None, cache=None):
+    if cache is not None:
+        key = cache.key(invoice, template)
+        cached = cache.get(key)
+        if cached is None:
+            cached = cache.put(key, lambda path: write_invoice_pdf(invoice, path, template))
+        shutil.copyfile(cached, filename)
+        return
+    c = new_canvas(filename)
+    render_invoice(c, invoice, template)
     c.save()
 
+def generate_invoice_pdf(order_id, filename, cache=None, db=None):
+    invoice = fetch_invoice(order_id, db)
+    if invoice is None:
+        return False
+    write_invoice_pdf(invoice, filename, fetch_invoice_template(db), cache)
+    return True
+
+def benchmark_invoice_template(line_count=2000, runs=3):
+    invoice = {
+        "order_id": 1,
+        "order_date": "2024-01-01",
+        "customer_name": "Benchmark Customer",
+        "customer_address": "1 Benchmark Road",
+        "lines": [(f"Item {i}", i % 9 + 1, 9.99) for i in range(line_count)],
+    }
+    template = dict(INVOICE_TEMPLATE_DEFAULTS, footer_text="Thank you for your business")
+    pages = invoice_page_count(line_count)
+    results = {"lines": line_count, "pages": pages}
+    for label, use_template in (("inline", False), ("template", True)):
+        best = None
+        for _ in range(runs):
+            buffer = io.BytesIO()
+            start = time.perf_counter()
+            c = new_canvas(buffer)
+            render_invoice(c, invoice, template, use_template)
+            c.save()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        results[label] = {
+            "ms_per_page": round(best * 1000 / pages, 3),
+            "bytes_per_page": round(len(buffer.getvalue()) / pages),
+        }
+    return results
+
+# --- Invoice Cache ---
+INVOICE_CACHE_DIR = os.environ.get("INVOICE_CACHE_DIR", "invoice_cache")
+INVOICE_CACHE_MAX_BYTES = int(os.environ.get("INVOICE_CACHE_MAX_MB", "256")) * 1024 * 1024
+# Bump when the rendered layout changes so old PDFs stop matching.
+INVOICE_LAYOUT_VERSION = 2
+
+class InvoiceCache:
+    # PDFs are stored under the SHA-256 of everything that is printed on the
+    # invoice, so any change to the order, its lines, the customer or an item
+    # name produces a new key and the old entry is simply never hit again.
+    # Recency is the file mtime, which is refreshed on every hit.
+    def __init__(self, directory=INVOICE_CACHE_DIR, max_bytes=INVOICE_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._size = None
+    
+    def key(self, invoice, template=None):
+        payload = json.dumps([INVOICE_LAYOUT_VERSION, invoice, template], sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+    
+    def path(self, key):
+        return os.path.join(self.directory, f"{key}.pdf")
+    
+    def get(self, key):
+        path = self.path(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+    
+    def put(self, key, render):
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(suffix=".tmp", dir=self.directory)
+        os.close(fd)
+        try:
+            render(tmp_path)
+            size = os.path.getsize(tmp_path)
+            os.replace(tmp_path, self.path(key))
+        except Exception:
+            os.remove(tmp_path)
+            raise
+        if self._size is None:
+            self._size = self._scan_size()
+        else:
+            self._size += size
+        if self._size > self.max_bytes:
+            self.evict()
+        return self.path(key)
+    
+    def _entries(self):
+        entries = []
+        if not os.path.isdir(self.directory):
+            return entries
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith(".pdf"):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+    
+    def _scan_size(self):
+        return sum(size for _, size, _ in self._entries())
+    
+    def evict(self):
+        # Trim to 90% of the limit so a full cache does not rescan on every put.
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * 0.9
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+        self._size = total
+    
+    def clear(self):
+        for _, _, path in self._entries():
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        self._size = 0
+
+# --- Batch Invoice Generation ---
+BATCH_CHUNK_SIZE = 25
+_worker_conn = None
+_worker_cache = None
+_worker_template = None
+
+def fetch_invoice_sqlite(conn, order_id):
+    return build_invoice(order_id, conn.execute(INVOICE_QUERY, (order_id,)))
+
+def fetch_invoice_template_sqlite(conn):
+    template = dict(INVOICE_TEMPLATE_DEFAULTS)
+    template.update(conn.execute("SELECT key, value FROM InvoiceSettings"))
+    return template
+
+def select_batch_orders(conn, date_from=None, date_to=None, status=None, min_total=None, max_total=None):
+    sql = "SELECT id FROM SalesOrders WHERE 1 = 1"
+    params = []
+    if min_total is not None:
+        sql += " AND total >= ?"
+        params.append(min_total)
+    if max_total is not None:
+        sql += " AND total <= ?"
+        params.append(max_total)
+    if date_from:
+        sql += " AND order_date >= ?"
+        params.append(date_from)
+    if date_to:
+        sql += " AND order_date <= ?"
+        params.append(date_to)
+    if status:
+        sql += " AND status = ?"
+        params.append(status)
+    sql += " ORDER BY id"
+    return [row[0] for row in conn.execute(sql, params)]
+
+def _init_invoice_worker(db_path, cache_dir=None):
+    # Each worker process keeps its own SQLite connection for its lifetime.
+    global _worker_conn, _worker_cache, _worker_template
+    _worker_conn = connect_sqlite(db_path)
+    _worker_template = fetch_invoice_template_sqlite(_worker_conn)
+    if cache_dir is not None:
+        _worker_cache = InvoiceCache(cache_dir)
+
+def _fetch_invoice_chunk(order_ids):
+    return [fetch_invoice_sqlite(_worker_conn, order_id) for order_id in order_ids]
+
+def _render_invoice_chunk(order_ids, out_dir):
+    written = []
+    for order_id in order_ids:
+        invoice = fetch_invoice_sqlite(_worker_conn, order_id)
+        if invoice is None:
+            continue
+        filename = os.path.join(out_dir, f"invoice_{order_id}.pdf")
+        write_invoice_pdf(invoice, filename, _worker_template, _worker_cache)
+        written.append(filename)
+    return written
+
+def generate_invoices_batch(db_path, order_ids, out_dir, combined_filename=None,
+                            workers=None, progress=None, cancel_event=None, cache_dir=None):
+    # Without combined_filename every worker renders its own orders to
+    # invoice_<id>.pdf. With it, workers only load the orders and this process
+    # appends them, in order, to a single canvas.
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    os.makedirs(out_dir, exist_ok=True)
+    chunks = [order_ids[i:i + BATCH_CHUNK_SIZE] for i in range(0, len(order_ids), BATCH_CHUNK_SIZE)]
+    combined = None
+    if combined_filename:
+        combined_path = os.path.join(out_dir, combined_filename)
+        combined = new_canvas(combined_path)
+        conn = connect_sqlite(db_path)
+        try:
+            template = fetch_invoice_template_sqlite(conn)
+        finally:
+            conn.close()
+    written = []
+    pending = {}
+    next_chunk = 0
+    done = 0
+    executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                   initializer=_init_invoice_worker, initargs=(db_path, cache_dir))
+    try:
+        if combined is not None:
+            futures = {executor.submit(_fetch_invoice_chunk, chunk): i for i, chunk in enumerate(chunks)}
+        else:
+            futures = {executor.submit(_render_invoice_chunk, chunk, out_dir): i for i, chunk in enumerate(chunks)}
+        for future in as_completed(futures):
+            if cancel_event is not None and cancel_event.is_set():
+                break
+            index = futures[future]
+            if combined is not None:
+                pending[index] = future.result()
+                while next_chunk in pending:
+                    for invoice in pending.pop(next_chunk):
+                        if invoice is not None:
+                            render_invoice(combined, invoice, template)
+                    next_chunk += 1
+            else:
+                written.extend(future.result())
+            done += len(chunks[index])
+            if progress is not None:
+                progress(done, len(order_ids))
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+    if combined is not None and not (cancel_event is not None and cancel_event.is_set()):
+        combined.save()
+        written.append(combined_path)
+    return written
+
+class BatchInvoiceThread(QThread):
+    progress = pyqtSignal(int, int)
+    completed = pyqtSignal(list)
+    failed = pyqtSignal(str)
+    
+    def __init__(self, db_path, order_ids, out_dir, combined_filename=None, cache_dir=None, parent=None):
+        super().__init__(parent)
+        self.db_path = db_path
+        self.order_ids = order_ids
+        self.out_dir = out_dir
+        self.combined_filename = combined_filename
+        self.cache_dir = cache_dir
+        self.cancel_event = threading.Event()
+    
+    def cancel(self):
+        self.cancel_event.set()
+    
+    def run(self):
+        try:
+            written = generate_invoices_batch(self.db_path, self.order_ids, self.out_dir,
+                                              self.combined_filename, progress=self.progress.emit,
+                                              cancel_event=self.cancel_event, cache_dir=self.cache_dir)
+        except Exception as e:
+            self.failed.emit(str(e))
+            return
+        self.completed.emit(written)
+
+# --- Export ---
+# Each export is a fixed query with a fixed schema of (column, type) pairs,
+# so the files keep the same layout whatever the data. Rows are streamed
+# from a forward-only sqlite3 cursor EXPORT_BATCH_ROWS at a time and each
+# batch is written out before the next is fetched, so memory stays flat
+# however large the export.
+EXPORT_BATCH_ROWS = 131072
+EXPORT_FORMATS = {"csv": ".csv", "parquet": ".parquet"}
+EXPORTS = {
+    "sales_order_items": (
+        "SELECT id, order_id, item_id, quantity, price FROM SalesOrderItems ORDER BY id",
+        [("id", "int64"), ("order_id", "int64"), ("item_id", "int64"), ("quantity", "int64"),
+         ("price", "float64")],
+    ),
+    "stock_levels": (
+        "SELECT item_id, quantity, reorder_point, safety_stock FROM StockLevels ORDER BY item_id",
+        [("item_id", "int64"), ("quantity", "int64"), ("reorder_point", "int64"), ("safety_stock", "int64")],
+    ),
+    "low_stock": (
+        """SELECT si.id, si.name, sl.quantity, sl.reorder_point, sl.safety_stock,
+                  sl.reorder_point + sl.safety_stock - sl.quantity
+           FROM StockLevels sl
+           JOIN StockItems si ON si.id = sl.item_id
+           WHERE sl.quantity < sl.reorder_point
+           ORDER BY sl.quantity - sl.reorder_point, si.name""",
+        [("item_id", "int64"), ("item", "string"), ("quantity", "int64"), ("reorder_point", "int64"),
+         ("safety_stock", "int64"), ("suggested_order", "int64")],
+    ),
+}
+
+class CsvExportWriter:
+    def __init__(self, path, schema):
+        self.stream = open(path, "w", newline="", encoding="utf-8")
+        self.writer = csv.writer(self.stream)
+        self.writer.writerow([name for name, type_name in schema])
+    
+    def write(self, rows):
+        self.writer.writerows(rows)
+    
+    def close(self):
+        self.stream.close()
+
+class ParquetExportWriter:
+    # Zstandard-compressed Parquet; every batch becomes one row group.
+    def __init__(self, path, schema):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise RuntimeError("Parquet export requires pyarrow (pip install pyarrow)")
+        self.pyarrow = pyarrow
+        self.schema = pyarrow.schema([(name, getattr(pyarrow, type_name)()) for name, type_name in schema])
+        self.writer = pyarrow.parquet.ParquetWriter(path, self.schema, compression="zstd")
+    
+    def write(self, rows):
+        pyarrow = self.pyarrow
+        arrays = [pyarrow.array(column, type=field.type) for column, field in zip(zip(*rows), self.schema)]
+        self.writer.write_table(pyarrow.Table.from_arrays(arrays, schema=self.schema))
+    
+    def close(self):
+        self.writer.close()
+
+EXPORT_WRITERS = {"csv": CsvExportWriter, "parquet": ParquetExportWriter}
+
+def export_dataset(db_path, name, path, fmt="csv", progress=None, cancel_event=None):
+    # Writes to a temporary file next to path and renames it into place, so
+    # readers never see a half-written export. Returns the number of rows
+    # written, or None if cancelled.
+    sql, schema = EXPORTS[name]
+    partial_path = path + ".part"
+    conn = connect_sqlite(db_path)
+    try:
+        cursor = conn.execute(sql)
+        writer = EXPORT_WRITERS[fmt](partial_path, schema)
+        rows_written = 0
+        try:
+            while True:
+                if cancel_event is not None and cancel_event.is_set():
+                    break
+                rows = cursor.fetchmany(EXPORT_BATCH_ROWS)
+                if not rows:
+                    break
+                writer.write(rows)
+                rows_written += len(rows)
+                if progress is not None:
+                    progress(rows_written)
+        finally:
+            writer.close()
+    except Exception:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        raise
+    finally:
+        conn.close()
+    if cancel_event is not None and cancel_event.is_set():
+        os.remove(partial_path)
+        return None
+    os.replace(partial_path, path)
+    return rows_written
+
+class ExportThread(QThread):
+    progress = pyqtSignal(int)
+    completed = pyqtSignal(int)
+    failed = pyqtSignal(str)
+    
+    def __init__(self, db_path, name, path, fmt, parent=None):
+        super().__init__(parent)
+        self.db_path = db_path
+        self.name = name
+        self.path = path
+        self.fmt = fmt
+        self.cancel_event = threading.Event()
+    
+    def cancel(self):
+        self.cancel_event.set()
+    
+    def run(self):
+        try:
+            rows_written = export_dataset(self.db_path, self.name, self.path, self.fmt,
+                                          progress=self.progress.emit, cancel_event=self.cancel_event)
+        except Exception as e:
+            self.failed.emit(str(e))
+            return
+        self.completed.emit(-1 if rows_written is None else rows_written)
+
+# --- Analytics ---
+# Order lines are read once into NumPy arrays sorted by order date, so any
+# date range is a contiguous slice found by binary search and a rollup is
+# one bincount per measure over that slice. Rollups are cached per
+# (dimension, period) until the lines are loaded again.
+ANALYTICS_BATCH_ROWS = 262144
+ANALYTICS_CACHE_SIZE = 64
+ANALYTICS_TAB_ROWS = 500
+# Sorts after every real day, so lines with a missing or invalid order date
+# fall outside every date range.
+ANALYTICS_NO_DAY = 2 ** 31 - 1
+ANALYTICS_KINDS = {
+    # kind: (order table, line table, party column, party table, excluded statuses, measures)
+    "sales": ("SalesOrders", "SalesOrderItems", "customer_id", "Customers", (),
+              [("units", "units"), ("revenue", "amount"), ("cost", "cost"), ("margin", "margin")]),
+    "purchases": ("PurchaseOrders", "PurchaseOrderItems", "supplier_id", "Suppliers", ("Cancelled",),
+                  [("units", "units"), ("spend", "amount")]),
+}
+# dimension: (array, name table)
+ANALYTICS_DIMENSIONS = {
+    "item": ("item", "StockItems"),
+    "category": ("category", "Categories"),
+    "customer": ("party", "Customers"),
+    "supplier": ("party", "Suppliers"),
+    "month": ("month", None),
+}
+
+def _require_numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise RuntimeError("Analytics requires numpy (pip install numpy)")
+    return numpy
+
+def _read_array(np, conn, sql, dtype, cancelled):
+    cursor = conn.execute(sql)
+    chunks = []
+    while True:
+        rows = cursor.fetchmany(ANALYTICS_BATCH_ROWS)
+        if not rows:
+            break
+        chunks.append(np.array(rows, dtype=dtype))
+        if cancelled():
+            return None
+    return np.concatenate(chunks) if chunks else np.empty((0, len(cursor.description)), dtype=dtype)
+
+def _lookup(np, ids, values, fill):
+    # values by id, as an array indexed by id.
+    table = np.full(int(ids.max(initial=0)) + 1, fill, dtype=values.dtype)
+    table[ids] = values
+    return table
+
+def analytics_day(date):
+    np = _require_numpy()
+    return int(np.datetime64(date, "D").astype(np.int64))
+
+class OrderLines:
+    # The lines of one kind of order as parallel arrays, sorted by day.
+    def __init__(self, np, kind, columns):
+        self.np = np
+        self.kind = kind
+        order = np.argsort(columns["day"], kind="stable")
+        for name, values in columns.items():
+            setattr(self, name, values[order])
+        dated = self.day != ANALYTICS_NO_DAY
+        self.dated_count = int(np.count_nonzero(dated))
+        self.month = np.zeros_like(self.day)
+        self.month[dated] = self.day[dated].astype("datetime64[D]").astype("datetime64[M]").astype(np.int32)
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def __len__(self):
+        return len(self.day)
+    
+    def span(self, date_from=None, date_to=None):
+        np = self.np
+        start = 0 if date_from is None else int(np.searchsorted(self.day, analytics_day(date_from), "left"))
+        end = self.dated_count if date_to is None else int(np.searchsorted(self.day, analytics_day(date_to), "right"))
+        return start, max(start, end)
+    
+    def rollup(self, by, date_from=None, date_to=None):
+        # {"key": ids (or months since 1970-01), "lines": ..., measure: ...},
+        # one entry per key with lines in the period, in key order.
+        np = self.np
+        array_name = ANALYTICS_DIMENSIONS[by][0]
+        start, end = self.span(date_from, date_to)
+        cache_key = (array_name, start, end)
+        with self._lock:
+            if cache_key in self._cache:
+                self._cache.move_to_end(cache_key)
+                return self._cache[cache_key]
+        keys = getattr(self, array_name)[start:end]
+        lines = np.bincount(keys)
+        present = np.flatnonzero(lines)
+        result = {"key": present, "lines": lines[present]}
+        for measure, column in ANALYTICS_KINDS[self.kind][5]:
+            result[measure] = np.bincount(keys, weights=getattr(self, column)[start:end],
+                                          minlength=len(lines))[present]
+        with self._lock:
+            self._cache[cache_key] = result
+            while len(self._cache) > ANALYTICS_CACHE_SIZE:
+                self._cache.popitem(last=False)
+        return result
+
+def _load_order_lines(np, conn, kind, item_category, cancelled):
+    order_table, line_table, party_column, party_table, excluded, measures = ANALYTICS_KINDS[kind]
+    where = ""
+    if excluded:
+        where = f" WHERE COALESCE(status, '') NOT IN ({', '.join(repr(status) for status in excluded)})"
+    # julianday() is NULL for dates it cannot parse.
+    orders = _read_array(np, conn, f"""SELECT id, COALESCE(CAST(julianday(order_date) - 2440587.5 AS INTEGER), {ANALYTICS_NO_DAY}),
+                                              COALESCE({party_column}, 0)
+                                       FROM {order_table}{where}""", np.int64, cancelled)
+    if orders is None:
+        return None
+    lines = _read_array(np, conn, f"""SELECT order_id, item_id, quantity, price FROM {line_table}
+                                      WHERE order_id IS NOT NULL AND item_id IS NOT NULL
+                                        AND quantity IS NOT NULL AND price IS NOT NULL""", np.float64, cancelled)
+    if lines is None:
+        return None
+    position = _lookup(np, orders[:, 0], np.arange(len(orders), dtype=np.int64), -1)
+    order_ids = lines[:, 0].astype(np.int64)
+    known = order_ids < len(position)
+    order_index = np.full(len(lines), -1, dtype=np.int64)
+    order_index[known] = position[order_ids[known]]
+    lines = lines[order_index >= 0]
+    order_index = order_index[order_index >= 0]
+    item = lines[:, 1].astype(np.int32)
+    in_catalogue = item < len(item_category)
+    category = np.zeros(len(item), dtype=np.int32)
+    category[in_catalogue] = item_category[item[in_catalogue]]
+    return {
+        "day": orders[order_index, 1].astype(np.int32),
+        "party": orders[order_index, 2].astype(np.int32),
+        "item": item,
+        "category": category,
+        "units": lines[:, 2],
+        "amount": lines[:, 2] * lines[:, 3],
+    }
+
+class Analytics:
+    # Sales and purchase order lines, loaded together so each sale can be
+    # costed at the item's average purchase price. Lines of items never
+    # purchased have no cost and add nothing to cost or margin.
+    def __init__(self, sales, purchases, seconds):
+        self.sales = sales
+        self.purchases = purchases
+        self.seconds = seconds
+    
+    def lines(self, kind):
+        return self.sales if kind == "sales" else self.purchases
+    
+    def rollup(self, kind, by, date_from=None, date_to=None):
+        return self.lines(kind).rollup(by, date_from, date_to)
+
+def load_analytics(db, cancelled=lambda: False):
+    # Runs on a query_service worker or headless; db only names the file,
+    # the arrays are filled through a plain sqlite3 cursor.
+    np = _require_numpy()
+    start = time.perf_counter()
+    conn = connect_sqlite(db.databaseName())
+    try:
+        items = _read_array(np, conn, "SELECT id, COALESCE(category_id, 0) FROM StockItems", np.int64, cancelled)
+        if items is None:
+            return None
+        item_category = _lookup(np, items[:, 0], items[:, 1].astype(np.int32), 0)
+        columns = {}
+        for kind in ANALYTICS_KINDS:
+            columns[kind] = _load_order_lines(np, conn, kind, item_category, cancelled)
+            if columns[kind] is None:
+                return None
+    finally:
+        conn.close()
+    purchases = columns["purchases"]
+    sales = columns["sales"]
+    size = int(max(purchases["item"].max(initial=0), sales["item"].max(initial=0))) + 1
+    purchased_units = np.bincount(purchases["item"], weights=purchases["units"], minlength=size)
+    purchased_amount = np.bincount(purchases["item"], weights=purchases["amount"], minlength=size)
+    unit_cost = np.full(size, np.nan)
+    np.divide(purchased_amount, purchased_units, out=unit_cost, where=purchased_units > 0)
+    cost = sales["units"] * unit_cost[sales["item"]]
+    costed = ~np.isnan(cost)
+    sales["cost"] = np.where(costed, cost, 0.0)
+    sales["margin"] = np.where(costed, sales["amount"] - sales["cost"], 0.0)
+    return Analytics(OrderLines(np, "sales", sales), OrderLines(np, "purchases", purchases),
+                     time.perf_counter() - start)
+
+def _month_label(month):
+    return f"{1970 + month // 12:04d}-{month % 12 + 1:02d}"
+
+def analytics_rows(db, cancelled, analytics, kind, by, date_from=None, date_to=None, limit=None):
+    # The rollup as (columns, rows) for display: months in order, anything
+    # else by value, largest first, with names read for the rows kept.
+    np = _require_numpy()
+    result = analytics.rollup(kind, by, date_from, date_to)
+    measures = [measure for measure, column in ANALYTICS_KINDS[kind][5]]
+    if by == "month":
+        order = np.arange(len(result["key"]))
+    else:
+        order = np.argsort(-result[measures[1]], kind="stable")
+    if limit is not None:
+        order = order[:limit]
+    keys = result["key"][order].tolist()
+    name_table = ANALYTICS_DIMENSIONS[by][1]
+    if name_table is None:
+        labels = [_month_label(key) for key in keys]
+    else:
+        names = {}
+        query = SqlQuery(db)
+        query.setForwardOnly(True)
+        for chunk_start in range(0, len(keys), 500):
+            chunk = keys[chunk_start:chunk_start + 500]
+            query.prepare(f"SELECT id, name FROM {name_table} WHERE id IN ({', '.join('?' * len(chunk))})")
+            for key in chunk:
+                query.addBindValue(key)
+            if query.exec_():
+                names.update(query_rows(query))
+        labels = [names.get(key, f"#{key}" if key else "(none)") for key in keys]
+    columns = [by.capitalize(), "Lines"] + [measure.capitalize() for measure in measures]
+    # Adding 0.0 turns the -0.0 that rounding can leave into 0.0.
+    values = [result["lines"][order].tolist()] + [(np.round(result[measure][order], 2) + 0.0).tolist()
+                                                  for measure in measures]
+    return columns, [list(row) for row in zip(labels, *values)]
+
+# --- Bulk Import ---
+# CSV files are streamed in chunks of IMPORT_CHUNK_ROWS; each chunk is
+# validated in Python against in-memory lookups and written with one
+# execBatch per table. The whole file is one transaction, so a failed or
+# cancelled import leaves the database untouched.
+IMPORT_CHUNK_ROWS = 10000
+IMPORT_REPORTED_REJECTS = 100
+IMPORT_KINDS = ["items", "stock_levels", "suppliers", "customers"]
+IMPORT_COLUMNS = {
+    "items": ["name", "description", "category", "unit_price", "quantity", "reorder_point", "safety_stock", "sku"],
+    "stock_levels": ["item", "quantity", "reorder_point", "safety_stock"],
+    "suppliers": ["name", "contact_person", "phone", "email", "address"],
+    "customers": ["name", "contact_person", "phone", "email", "address"],
+}
+IMPORT_REQUIRED_COLUMNS = {
+    "items": ["name"],
+    "stock_levels": ["item", "quantity"],
+    "suppliers": ["name"],
+    "customers": ["name"],
+}
+IMPORT_TABLES = {"items": "StockItems", "suppliers": "Suppliers", "customers": "Customers"}
+# Each chunk of validated rows is bound once into the temp.import_rows
+# staging table and copied from there into the real tables set-based, which
+# is much cheaper than binding the same values again per target table.
+IMPORT_STAGING_COLUMNS = {
+    "items": ["id", "name", "description", "category_id", "unit_price", "quantity", "reorder_point", "safety_stock",
+              "sku"],
+    "stock_levels": ["item_id", "quantity", "delta", "reorder_point", "safety_stock"],
+    "suppliers": ["id", "name", "contact_person", "phone", "email", "address"],
+    "customers": ["id", "name", "contact_person", "phone", "email", "address"],
+}
+_IMPORT_CONTACT_STATEMENTS = [
+    """INSERT INTO {table} (id, name, contact_person, phone, email, address)
+       SELECT id, name, contact_person, phone, email, address FROM temp.import_rows ORDER BY seq""",
+]
+IMPORT_STATEMENTS = {
+    "items": [
+        """INSERT INTO StockItems (id, name, description, category_id, unit_price, sku)
+           SELECT id, name, description, category_id, unit_price, sku FROM temp.import_rows ORDER BY seq""",
+        """INSERT INTO StockLevels (item_id, quantity, reorder_point, safety_stock)
+           SELECT id, quantity, reorder_point, safety_stock FROM temp.import_rows ORDER BY seq""",
+        """INSERT INTO StockMovements (item_id, quantity, movement_date, reason)
+           SELECT id, quantity, datetime('now', 'localtime'), 'import' FROM temp.import_rows
+           WHERE quantity != 0 ORDER BY seq""",
+    ],
+    "stock_levels": [
+        """INSERT INTO StockLevels (item_id, quantity, reorder_point, safety_stock)
+           SELECT item_id, quantity, reorder_point, safety_stock FROM temp.import_rows WHERE true ORDER BY seq
+           ON CONFLICT (item_id) DO UPDATE SET quantity = excluded.quantity,
+                                                reorder_point = excluded.reorder_point,
+                                                safety_stock = excluded.safety_stock""",
+        # Quantities are balances: record the differences in the ledger.
+        """INSERT INTO StockMovements (item_id, quantity, movement_date, reason)
+           SELECT item_id, delta, datetime('now', 'localtime'), 'import' FROM temp.import_rows
+           WHERE delta != 0 ORDER BY seq""",
+    ],
+    "suppliers": _IMPORT_CONTACT_STATEMENTS,
+    "customers": _IMPORT_CONTACT_STATEMENTS,
+}
+
+def _import_number(value, field, convert, default=None, minimum=None):
+    if not value:
+        return default
+    try:
+        number = convert(value)
+    except ValueError:
+        raise ValueError(f"{field} is not a number: {value!r}")
+    if minimum is not None and number < minimum:
+        raise ValueError(f"{field} must be at least {minimum}")
+    return number
+
+class CsvImporter:
+    def __init__(self, db, kind, create_categories=True):
+        if kind not in IMPORT_KINDS:
+            raise ValueError(f"unknown import kind {kind!r}")
+        self.db = db
+        self.kind = kind
+        self.table = IMPORT_TABLES.get(kind)
+        self.create_categories = create_categories
+        self.query = SqlQuery(db)
+        self.query.setForwardOnly(True)
+        self.categories = {}
+        self.names = set()
+        self.skus = set()
+        self.items = {}
+        self.levels = {}
+        self.first_id = self.next_id = None
+    
+    def _load_lookups(self):
+        # Everything a row is resolved against is loaded once, so validation
+        # never issues a query per row.
+        query = self.query
+        if self.table is not None:
+            # New rows get explicit ids, so one batch can fill several tables.
+            query.exec_(f"""SELECT MAX(COALESCE((SELECT seq FROM sqlite_sequence WHERE name = '{self.table}'), 0),
+                                       COALESCE((SELECT MAX(id) FROM {self.table}), 0))""")
+            query.next()
+            self.first_id = self.next_id = query.value(0) + 1
+        if self.kind == "items":
+            query.exec_("SELECT id, name FROM Categories")
+            while query.next():
+                self.categories[query.value(1).strip().lower()] = query.value(0)
+            query.exec_("SELECT sku FROM StockItems WHERE sku IS NOT NULL")
+            while query.next():
+                self.skus.add(query.value(0))
+        elif self.kind == "stock_levels":
+            query.exec_("""SELECT si.id, si.name, sl.quantity, sl.reorder_point, sl.safety_stock
+                           FROM StockItems si LEFT JOIN StockLevels sl ON sl.item_id = si.id""")
+            while query.next():
+                item_id = query.value(0)
+                self.items.setdefault(query.value(1).strip().lower(), item_id)
+                if query.isNull(2):
+                    self.levels[item_id] = (0, 10, 0)
+                else:
+                    self.levels[item_id] = (query.value(2), query.value(3), query.value(4))
+        else:
+            query.exec_(f"SELECT name FROM {self.table}")
+            while query.next():
+                self.names.add(query.value(0).strip().lower())
+        query.finish()
+    
+    def _category_id(self, name):
+        key = name.lower()
+        if key not in self.categories:
+            if not self.create_categories:
+                raise ValueError(f"unknown category {name!r}")
+            query = SqlQuery(self.db)
+            query.prepare("INSERT INTO Categories (name) VALUES (?)")
+            query.addBindValue(name)
+            if not query.exec_():
+                raise RuntimeError(query.lastError().text())
+            self.categories[key] = query.lastInsertId()
+        return self.categories[key]
+    
+    def _validate_items(self, fields):
+        name, description, category, unit_price, quantity, reorder_point, safety_stock, sku = fields
+        if not name:
+            raise ValueError("name is required")
+        sku = normalize_sku(sku)
+        if sku is not None and sku in self.skus:
+            raise ValueError(f"duplicate sku {sku!r}")
+        unit_price = _import_number(unit_price, "unit_price", float, minimum=0)
+        quantity = _import_number(quantity, "quantity", int, default=0, minimum=0)
+        reorder_point = _import_number(reorder_point, "reorder_point", int, default=10, minimum=0)
+        safety_stock = _import_number(safety_stock, "safety_stock", int, default=0, minimum=0)
+        # Resolved last so a rejected row never creates a category.
+        category_id = self._category_id(category) if category else None
+        if sku is not None:
+            self.skus.add(sku)
+        return name, description or None, category_id, unit_price, quantity, reorder_point, safety_stock, sku
+    
+    def _validate_stock_levels(self, fields):
+        item, quantity, reorder_point, safety_stock = fields
+        if not item:
+            raise ValueError("item is required")
+        item_id = self.items.get(item.lower())
+        if item_id is None and item.isdigit() and int(item) in self.levels:
+            item_id = int(item)
+        if item_id is None:
+            raise ValueError(f"unknown item {item!r}")
+        if not quantity:
+            raise ValueError("quantity is required")
+        current, current_reorder_point, current_safety_stock = self.levels[item_id]
+        quantity = _import_number(quantity, "quantity", int, minimum=0)
+        reorder_point = _import_number(reorder_point, "reorder_point", int, current_reorder_point, 0)
+        safety_stock = _import_number(safety_stock, "safety_stock", int, current_safety_stock, 0)
+        # Later rows for the same item see this row's values.
+        self.levels[item_id] = (quantity, reorder_point, safety_stock)
+        return item_id, quantity, quantity - current, reorder_point, safety_stock
+    
+    def _validate_contact(self, fields):
+        name, contact_person, phone, email, address = fields
+        if not name:
+            raise ValueError("name is required")
+        key = name.lower()
+        if key in self.names:
+            raise ValueError(f"duplicate name {name!r}")
+        if email and "@" not in email:
+            raise ValueError(f"invalid email {email!r}")
+        self.names.add(key)
+        return name, contact_person or None, phone or None, email or None, address or None
+    
+    def _allocate_ids(self, count):
+        ids = list(range(self.next_id, self.next_id + count))
+        self.next_id += count
+        return ids
+    
+    def _write(self, rows):
+        columns = [list(column) for column in zip(*rows)]
+        if self.table is not None:
+            columns.insert(0, self._allocate_ids(len(rows)))
+        staging_columns = IMPORT_STAGING_COLUMNS[self.kind]
+        query = self.query
+        if not query.prepare(f"INSERT INTO temp.import_rows ({', '.join(staging_columns)}) "
+                             f"VALUES ({', '.join('?' * len(staging_columns))})"):
+            raise RuntimeError(query.lastError().text())
+        for column in columns:
+            query.addBindValue(column)
+        if not query.execBatch():
+            raise RuntimeError(query.lastError().text())
+        for statement in IMPORT_STATEMENTS[self.kind] + ["DELETE FROM temp.import_rows"]:
+            if not query.exec_(statement.format(table=self.table)):
+                raise RuntimeError(query.lastError().text())
+    
+    def _begin_import(self):
+        # Per-row triggers dominate bulk load time, so two are dropped for the
+        # import and their work done in bulk, all inside this transaction:
+        # the FTS insert trigger flushes the index on every statement, so
+        # the new rows are indexed with one INSERT ... SELECT at the end; the
+        # ledger trigger is replaced by writing the resulting balances, which
+        # the importer already knows, next to the movements. A reference
+        # table's version counter is bumped once instead of per row, and the
+        # new rows go into the ChangeLog with one INSERT ... SELECT.
+        staging_columns = ", ".join(IMPORT_STAGING_COLUMNS[self.kind])
+        if not self.query.exec_(f"CREATE TEMP TABLE import_rows (seq INTEGER PRIMARY KEY, {staging_columns})"):
+            raise RuntimeError(self.query.lastError().text())
+        triggers = []
+        if self.table is not None:
+            triggers.append(f"{self.table}Search_ai")
+        if self.kind in ("items", "stock_levels"):
+            triggers.append("stockmovements_apply")
+        if self.table in REFERENCE_TABLES:
+            triggers.append(f"{self.table.lower()}_version_insert")
+        if self.table in CHANGE_LOG_TABLES:
+            triggers.append(f"{self.table.lower()}_log_insert")
+        for trigger in triggers:
+            if not self.query.exec_(f"DROP TRIGGER IF EXISTS {trigger}"):
+                raise RuntimeError(self.query.lastError().text())
+    
+    def _finish_import(self):
+        query = self.query
+        statements = []
+        if self.table is not None:
+            columns = ", ".join(SEARCH_COLUMNS[self.table])
+            query.prepare(f"INSERT INTO {self.table}Search (rowid, {columns}) "
+                          f"SELECT id, {columns} FROM {self.table} WHERE id >= ?")
+            query.addBindValue(self.first_id)
+            if not query.exec_():
+                raise RuntimeError(query.lastError().text())
+            statements.append(_fts_insert_trigger(self.table, SEARCH_COLUMNS[self.table]))
+        if self.kind in ("items", "stock_levels"):
+            statements.append(STOCK_MOVEMENTS_APPLY_TRIGGER)
+        if self.table in REFERENCE_TABLES:
+            statements.append(_reference_version_triggers(self.table)[0])
+            statements.append(f"UPDATE ReferenceVersions SET version = version + 1 WHERE table_name = '{self.table}'")
+        if self.table in CHANGE_LOG_TABLES:
+            query.prepare("INSERT OR REPLACE INTO ChangeLog (table_name, row_id, structural) "
+                          f"SELECT '{self.table}', id, 1 FROM {self.table} WHERE id >= ? ORDER BY id")
+            query.addBindValue(self.first_id)
+            if not query.exec_():
+                raise RuntimeError(query.lastError().text())
+            statements.append(_change_log_triggers(self.table)[0])
+        statements.append("DROP TABLE temp.import_rows")
+        for statement in statements:
+            if not query.exec_(statement):
+                raise RuntimeError(query.lastError().text())
+    
+    def run(self, stream, rejects_stream=None, progress=None):
+        return self.run_rows(csv.reader(stream), rejects_stream, progress)
+    
+    def run_rows(self, reader, rejects_stream=None, progress=None):
+        # reader yields a header row and then one list of strings per record.
+        # progress(rows_read) is called after every chunk; returning False
+        # cancels the import.
+        validate = {
+            "items": self._validate_items,
+            "stock_levels": self._validate_stock_levels,
+            "suppliers": self._validate_contact,
+            "customers": self._validate_contact,
+        }[self.kind]
+        report = {"kind": self.kind, "imported": 0, "rejected": 0, "rejects": [], "cancelled": False}
+        start = time.perf_counter()
+        reader = iter(reader)
+        header = [column.strip().lower() for column in next(reader, [])]
+        missing = [column for column in IMPORT_REQUIRED_COLUMNS[self.kind] if column not in header]
+        if missing:
+            raise ValueError(f"missing column(s): {', '.join(missing)}")
+        # Position of each known column in the file; absent ones read as "".
+        positions = [header.index(column) if column in header else len(header)
+                     for column in IMPORT_COLUMNS[self.kind]]
+        padding = [""]
+        rejects_writer = None
+        if rejects_stream is not None:
+            rejects_writer = csv.writer(rejects_stream)
+            rejects_writer.writerow(["line", "reason"] + header)
+        if not self.db.transaction():
+            raise RuntimeError(self.db.lastError().text())
+        try:
+            self._load_lookups()
+            self._begin_import()
+            line = 1
+            while True:
+                chunk = list(itertools.islice(reader, IMPORT_CHUNK_ROWS))
+                if not chunk:
+                    break
+                rows = []
+                for values in chunk:
+                    line += 1
+                    try:
+                        if len(values) < len(header):
+                            raise ValueError(f"expected {len(header)} fields, found {len(values)}")
+                        padded = values + padding
+                        rows.append(validate([padded[position].strip() for position in positions]))
+                    except ValueError as error:
+                        report["rejected"] += 1
+                        if len(report["rejects"]) < IMPORT_REPORTED_REJECTS:
+                            report["rejects"].append((line, str(error)))
+                        if rejects_writer is not None:
+                            rejects_writer.writerow([line, str(error)] + values)
+                if rows:
+                    self._write(rows)
+                    report["imported"] += len(rows)
+                if progress is not None and progress(report["imported"] + report["rejected"]) is False:
+                    report["cancelled"] = True
+                    break
+            if report["cancelled"]:
+                self.query.finish()
+                self.db.rollback()
+                report["imported"] = 0
+            else:
+                self._finish_import()
+                if not self.db.commit():
+                    raise RuntimeError(self.db.lastError().text())
+        except Exception:
+            self.query.finish()
+            self.db.rollback()
+            raise
+        elapsed = time.perf_counter() - start
+        rows_read = report["imported"] + report["rejected"]
+        report["seconds"] = round(elapsed, 3)
+        report["rows_per_s"] = round(rows_read / elapsed) if elapsed else 0
+        return report
+
+def import_csv(db, kind, path, rejects_path=None, create_categories=True, progress=None):
+    importer = CsvImporter(db, kind, create_categories)
+    with open(path, newline="", encoding="utf-8-sig") as stream:
+        if rejects_path is None:
+            return importer.run(stream, progress=progress)
+        with open(rejects_path, "w", newline="", encoding="utf-8") as rejects_stream:
+            return importer.run(stream, rejects_stream, progress)
+
+def _write_bench_csv(path, kind, rows, rng):
+    with open(path, "w", newline="", encoding="utf-8") as stream:
+        writer = csv.writer(stream)
+        writer.writerow(IMPORT_COLUMNS[kind])
+        for i in range(rows):
+            if kind == "items":
+                writer.writerow([f"Item {i}", f"Imported item number {i}", f"Category {rng.randrange(50)}",
+                                 f"{rng.uniform(1, 500):.2f}", rng.randrange(200), rng.randrange(5, 50), "",
+                                 f"BENCH-{i:07d}"])
+            elif kind == "stock_levels":
+                writer.writerow([f"Item {rng.randrange(rows)}", rng.randrange(200), "", ""])
+            else:
+                writer.writerow([f"{kind.title()} {i}", f"Contact {i}", f"555-{i:07d}",
+                                 f"contact{i}@example.com", f"{i} Main Street"])
+
+def benchmark_import(rows=200000, seed=1):
+    # Imports generated CSV files of each kind into a fresh database with
+    # the configured profile; stock levels are imported against the items.
+    rng = random.Random(seed)
+    results = {"rows": rows, "profile": DB_PROFILE}
+    with tempfile.TemporaryDirectory() as directory:
+        db = open_database(os.path.join(directory, "bench.db"), "bench_import")
+        migrate_database(db)
+        for kind in IMPORT_KINDS:
+            path = os.path.join(directory, f"{kind}.csv")
+            _write_bench_csv(path, kind, rows, rng)
+            report = import_csv(db, kind, path)
+            results[kind] = {key: report[key] for key in ("imported", "rejected", "seconds", "rows_per_s")}
+        db.close()
+        del db
+        QSqlDatabase.removeDatabase("bench_import")
+    return results
+
+# --- Synthetic Data ---
+# A seeded generator for benchmark databases: the same seed and sizes always
+# give the same data. Item and customer popularity follow Zipf-like
+# weights, prices and stock are log-normal, order sizes are geometric and
+# order dates are spread evenly over the DATASET_DAYS up to a fixed end date,
+# so a dataset does not depend on the day it is made. Catalogue rows go through
+# CsvImporter; orders and their lines are inserted with execBatch so the
+# ledger triggers post stock movements for received and shipped orders.
+DATASET_SIZES = {
+    "small": {"categories": 10, "suppliers": 20, "customers": 200, "items": 1000,
+              "purchase_orders": 200, "sales_orders": 2000},
+    "medium": {"categories": 40, "suppliers": 200, "customers": 5000, "items": 20000,
+               "purchase_orders": 2000, "sales_orders": 50000},
+    "large": {"categories": 200, "suppliers": 2000, "customers": 100000, "items": 1000000,
+              "purchase_orders": 20000, "sales_orders": 1000000},
+}
+DATASET_DAYS = 730
+DATASET_END_DATE = "2025-12-31"
+DATASET_LINES_PER_ORDER = 3.0
+DATASET_BATCH_ROWS = 50000
+# Purchase lines are priced at this share of the item's sale price.
+DATASET_COST_RATIO = 0.65
+_DATASET_ADJECTIVES = ["Compact", "Heavy Duty", "Wireless", "Premium", "Basic", "Industrial", "Portable",
+                       "Stainless", "Ergonomic", "Eco", "Digital", "Classic"]
+_DATASET_NOUNS = ["Drill", "Cable", "Monitor", "Jacket", "Kettle", "Router", "Chair", "Lamp", "Battery",
+                  "Headset", "Wrench", "Backpack", "Printer", "Sensor", "Blender", "Keyboard"]
+_DATASET_CATEGORIES = ["Electronics", "Clothing", "Tools", "Kitchen", "Office", "Garden", "Sports",
+                       "Automotive", "Toys", "Health", "Lighting", "Networking"]
+_DATASET_FIRST_NAMES = ["Ali", "Maria", "John", "Wei", "Fatima", "Carlos", "Anna", "Kenji", "Priya", "Omar"]
+_DATASET_LAST_NAMES = ["Khan", "Garcia", "Smith", "Chen", "Hassan", "Silva", "Novak", "Sato", "Patel", "Brown"]
+
+def _zipf_cum_weights(n, exponent=1.1):
+    return list(itertools.accumulate(1 / rank ** exponent for rank in range(1, n + 1)))
+
+def _dataset_contact(rng, kind, i):
+    person = f"{rng.choice(_DATASET_FIRST_NAMES)} {rng.choice(_DATASET_LAST_NAMES)}"
+    name = f"{person} {'Trading' if kind == 'suppliers' else 'Store'} {i}"
+    return [name, person, f"555-{rng.randrange(10 ** 7):07d}",
+            f"{person.split()[0].lower()}.{i}@example.com", f"{rng.randrange(1, 999)} Market Street"]
+
+def _dataset_rows(rng, kind, sizes):
+    if kind == "items":
+        yield IMPORT_COLUMNS["items"]
+        categories = [_DATASET_CATEGORIES[i % len(_DATASET_CATEGORIES)] + ("" if i < len(_DATASET_CATEGORIES)
+                      else f" {i // len(_DATASET_CATEGORIES)}") for i in range(sizes["categories"])]
+        weights = _zipf_cum_weights(len(categories), 0.8)
+        for i in range(sizes["items"]):
+            category = rng.choices(categories, cum_weights=weights)[0]
+            yield [f"{rng.choice(_DATASET_ADJECTIVES)} {rng.choice(_DATASET_NOUNS)} {i:06d}",
+                   f"Generated item {i}",
+                   category,
+                   f"{rng.lognormvariate(3.0, 1.0):.2f}",
+                   str(int(rng.lognormvariate(4.0, 1.0))),
+                   str(rng.randint(5, 50)),
+                   str(rng.randint(0, 20)),
+                   f"{category[:3].upper()}-{i:07d}"]
+    else:
+        yield IMPORT_COLUMNS[kind]
+        for i in range(sizes[kind]):
+            yield _dataset_contact(rng, kind, i)
+
+def _dataset_ids(db, table):
+    query = SqlQuery(db)
+    query.setForwardOnly(True)
+    query.exec_(f"SELECT id FROM {table} ORDER BY id")
+    ids = array("q")
+    while query.next():
+        ids.append(query.value(0))
+    return ids
+
+def _dataset_orders(db, rng, order_table, line_table, party_column, party_ids, count, statuses,
+                    status_weights, item_ids, prices, lines_per_order, end_date):
+    query = SqlQuery(db)
+    query.exec_(f"SELECT COALESCE(MAX(id), 0) FROM {order_table}")
+    query.next()
+    next_id = query.value(0) + 1
+    # Popularity ranks are shuffled so they do not follow id order.
+    parties = list(party_ids)
+    rng.shuffle(parties)
+    party_weights = _zipf_cum_weights(len(parties))
+    items = list(range(len(item_ids)))
+    rng.shuffle(items)
+    item_weights = _zipf_cum_weights(len(items))
+    start = QDate.fromString(end_date, Qt.ISODate).addDays(1 - DATASET_DAYS)
+    lines_written = 0
+    for chunk_start in range(0, count, DATASET_BATCH_ROWS):
+        orders = [[], [], [], []]
+        lines = [[], [], [], []]
+        for order_id in range(next_id + chunk_start, next_id + min(count, chunk_start + DATASET_BATCH_ROWS)):
+            orders[0].append(order_id)
+            orders[1].append(rng.choices(parties, cum_weights=party_weights)[0])
+            orders[2].append(start.addDays(rng.randrange(DATASET_DAYS)).toString(Qt.ISODate))
+            orders[3].append(rng.choices(statuses, weights=status_weights)[0])
+            line_count = min(1 + int(rng.expovariate(1 / (lines_per_order - 1))), 50)
+            for index in rng.choices(items, cum_weights=item_weights, k=line_count):
+                lines[0].append(order_id)
+                lines[1].append(item_ids[index])
+                lines[2].append(1 + int(rng.expovariate(0.5)))
+                lines[3].append(prices[index])
+        for sql, columns in ((f"INSERT INTO {order_table} (id, {party_column}, order_date, status) VALUES (?, ?, ?, ?)",
+                              orders),
+                             (f"INSERT INTO {line_table} (order_id, item_id, quantity, price) VALUES (?, ?, ?, ?)",
+                              lines)):
+            query.prepare(sql)
+            for column in columns:
+                query.addBindValue(column)
+            if not query.execBatch():
+                raise RuntimeError(query.lastError().text())
+        lines_written += len(lines[0])
+    return lines_written
+
+def generate_dataset(db, seed=0, sizes=None, lines_per_order=DATASET_LINES_PER_ORDER, end_date=DATASET_END_DATE):
+    # Fills an empty, migrated database; returns the number of rows made.
+    if not QDate.fromString(end_date, Qt.ISODate).isValid():
+        raise ValueError(f"invalid end date {end_date!r}, expected YYYY-MM-DD")
+    sizes = dict(DATASET_SIZES["small"], **(sizes or {}))
+    rng = random.Random(seed)
+    query = SqlQuery(db)
+    query.exec_("SELECT EXISTS (SELECT 1 FROM StockItems) OR EXISTS (SELECT 1 FROM SalesOrders)")
+    not_empty = query.next() and query.value(0)
+    query.finish()
+    if not_empty:
+        raise ValueError("generate_dataset needs an empty database")
+    counts = {}
+    for kind in ("suppliers", "customers", "items"):
+        report = CsvImporter(db, kind).run_rows(_dataset_rows(rng, kind, sizes))
+        counts[kind] = report["imported"]
+    counts["categories"] = sizes["categories"]
+    query.setForwardOnly(True)
+    query.exec_("SELECT id, unit_price FROM StockItems ORDER BY id")
+    item_ids = array("q")
+    prices = array("d")
+    while query.next():
+        item_ids.append(query.value(0))
+        prices.append(query.value(1))
+    query.finish()
+    if not db.transaction():
+        raise RuntimeError(db.lastError().text())
+    try:
+        counts["purchase_order_lines"] = _dataset_orders(
+            db, rng, "PurchaseOrders", "PurchaseOrderItems", "supplier_id", _dataset_ids(db, "Suppliers"),
+            sizes["purchase_orders"], PURCHASE_STATUSES, [15, 80, 5], item_ids,
+            array("d", (round(price * DATASET_COST_RATIO, 2) for price in prices)), lines_per_order * 3, end_date)
+        counts["sales_order_lines"] = _dataset_orders(
+            db, rng, "SalesOrders", "SalesOrderItems", "customer_id", _dataset_ids(db, "Customers"),
+            sizes["sales_orders"], SALES_STATUSES, [15, 15, 70], item_ids, prices, lines_per_order, end_date)
+        if not db.commit():
+            raise RuntimeError(db.lastError().text())
+    except Exception:
+        db.rollback()
+        raise
+    counts["purchase_orders"] = sizes["purchase_orders"]
+    counts["sales_orders"] = sizes["sales_orders"]
+    return counts
+
+# --- Startup Timing ---
+class StartupTimer:
+    # Records how long each startup phase took, measured from process start
+    # (before the Qt imports), so time-to-interactive can be tracked.
+    def __init__(self, t0):
+        self.t0 = t0
+        self.last = t0
+        self.phases = []
+    
+    def mark(self, name, duration=None):
+        now = time.perf_counter()
+        if duration is None:
+            duration = now - self.last
+        self.last = now
+        self.phases.append((name, duration))
+    
+    def elapsed(self):
+        return time.perf_counter() - self.t0
+    
+    def report(self):
+        return {
+            "phases_ms": {name: round(duration * 1000, 1) for name, duration in self.phases},
+            "time_to_interactive_ms": round(self.elapsed() * 1000, 1),
+        }
+
+startup_timer = StartupTimer(_STARTUP_T0)
+
 # --- Main Window ---
 class MainWindow(QMainWindow):
     def __init__(self):
         super().__init__()
         self.setWindowTitle("Stock Management System")
         self.setGeometry(100, 100, 1000, 700)
-        # Splash Screen (requires a logo.png file or remove this part)
-        splash = QSplashScreen(QPixmap("logo.png"))
-        splash.show()
-        QTimer.singleShot(2000, splash.close)
+        self.invoice_cache = InvoiceCache()
+        self.checkpoint_timer = QTimer(self)
+        self.checkpoint_timer.timeout.connect(checkpoint_database)
+        self.checkpoint_timer.start(WAL_CHECKPOINT_INTERVAL_MS)
+        query_service.submit(lambda db, cancelled: snapshot_due(db=db) and take_stock_snapshot(db))
+        reference_data.start()
         # Menu Bar
         menubar = self.menuBar()
         file_menu = menubar.addMenu("File")
+        import_action = QAction("Import CSV...", self)
+        import_action.triggered.connect(self.import_csv_file)
+        file_menu.addAction(import_action)
+        export_action = QAction("Export...", self)
+        export_action.triggered.connect(self.export_data)
+        file_menu.addAction(export_action)
         exit_action = QAction("Exit", self)
         exit_action.setShortcut("Ctrl+Q")
         exit_action.triggered.connect(self.close)
@@ -921,41 +5325,64 @@ class MainWindow(QMainWindow):
         orders_menu.addAction(purchase_orders_action)
         sales_orders_action = QAction("Sales Orders", self)
         orders_menu.addAction(sales_orders_action)
+        archive_orders_action = QAction("Archive Old Orders...", self)
+        archive_orders_action.triggered.connect(self.archive_old_orders)
+        orders_menu.addAction(archive_orders_action)
         reports_menu = menubar.addMenu("Reports")
         low_stock_action = QAction("Low Stock Report", self)
         reports_menu.addAction(low_stock_action)
+        analytics_action = QAction("Analytics", self)
+        reports_menu.addAction(analytics_action)
         generate_invoice_action = QAction("Generate Invoice", self)
         reports_menu.addAction(generate_invoice_action)
+        batch_invoices_action = QAction("Batch Invoices...", self)
+        reports_menu.addAction(batch_invoices_action)
+        query_report_action = QAction("Query Statistics...", self)
+        query_report_action.triggered.connect(self.save_query_report)
+        reports_menu.addAction(query_report_action)
         # Toolbar
         toolbar = QToolBar()
         self.addToolBar(toolbar)
         toolbar.addAction(exit_action)
         # Status Bar
         self.statusBar().showMessage("Welcome to Stock Management System")
+        self.query_stats_label = QLabel(query_stats.summary())
+        self.statusBar().addPermanentWidget(self.query_stats_label)
+        self.query_stats_timer = QTimer(self)
+        self.query_stats_timer.timeout.connect(lambda: self.query_stats_label.setText(query_stats.summary()))
+        self.query_stats_timer.start(QUERY_STATS_REFRESH_MS)
         # Central Widget
         self.tabs = QTabWidget()
         self.setCentralWidget(self.tabs)
-        # Add Tabs
-        self.stock_items_tab = StockItemsTab()
-        self.tabs.addTab(self.stock_items_tab, "Stock Items")
-        self.suppliers_tab = SuppliersTab()
-        self.tabs.addTab(self.suppliers_tab, "Suppliers")
-        self.customers_tab = CustomersTab()
-        self.tabs.addTab(self.customers_tab, "Customers")
-        self.purchase_orders_tab = PurchaseOrdersTab()
-        self.tabs.addTab(self.purchase_orders_tab, "Purchase Orders")
-        self.sales_orders_tab = SalesOrdersTab()
-        self.tabs.addTab(self.sales_orders_tab, "Sales Orders")
-        self.low_stock_tab = LowStockReportTab()
-        self.tabs.addTab(self.low_stock_tab, "Low Stock Report")
+        # Add Tabs. Each page starts as an empty placeholder and the real tab
+        # (and its query) is only built the first time the page is shown.
+        self.tab_pages = [
+            ("Stock Items", "stock_items_tab", StockItemsTab),
+            ("Suppliers", "suppliers_tab", SuppliersTab),
+            ("Customers", "customers_tab", CustomersTab),
+            ("Purchase Orders", "purchase_orders_tab", PurchaseOrdersTab),
+            ("Sales Orders", "sales_orders_tab", SalesOrdersTab),
+            ("Low Stock Report", "low_stock_tab", LowStockReportTab),
+            ("Analytics", "analytics_tab", AnalyticsTab),
+        ]
+        for title, attr, tab_class in self.tab_pages:
+            setattr(self, attr, None)
+            placeholder = QWidget()
+            placeholder_layout = QVBoxLayout()
+            placeholder_layout.setContentsMargins(0, 0, 0, 0)
+            placeholder.setLayout(placeholder_layout)
+            self.tabs.addTab(placeholder, title)
+        self.tabs.currentChanged.connect(self.ensure_tab)
         # Connect menu actions to tab switching
-        stock_items_action.triggered.connect(lambda: self.tabs.setCurrentWidget(self.stock_items_tab))
-        suppliers_action.triggered.connect(lambda: self.tabs.setCurrentWidget(self.suppliers_tab))
-        customers_action.triggered.connect(lambda: self.tabs.setCurrentWidget(self.customers_tab))
-        purchase_orders_action.triggered.connect(lambda: self.tabs.setCurrentWidget(self.purchase_orders_tab))
-        sales_orders_action.triggered.connect(lambda: self.tabs.setCurrentWidget(self.sales_orders_tab))
-        low_stock_action.triggered.connect(lambda: self.tabs.setCurrentWidget(self.low_stock_tab))
+        stock_items_action.triggered.connect(lambda: self.tabs.setCurrentIndex(0))
+        suppliers_action.triggered.connect(lambda: self.tabs.setCurrentIndex(1))
+        customers_action.triggered.connect(lambda: self.tabs.setCurrentIndex(2))
+        purchase_orders_action.triggered.connect(lambda: self.tabs.setCurrentIndex(3))
+        sales_orders_action.triggered.connect(lambda: self.tabs.setCurrentIndex(4))
+        low_stock_action.triggered.connect(lambda: self.tabs.setCurrentIndex(5))
+        analytics_action.triggered.connect(lambda: self.tabs.setCurrentIndex(6))
         generate_invoice_action.triggered.connect(self.generate_sales_invoice)
+        batch_invoices_action.triggered.connect(self.generate_batch_invoices)
         # Apply Stylesheet for Enhanced UI
         self.setStyleSheet("""
             QMainWindow {
@@ -1009,19 +5436,1083 @@ class MainWindow(QMainWindow):
             }
         """)
     
+    def ensure_tab(self, index):
+        title, attr, tab_class = self.tab_pages[index]
+        tab = getattr(self, attr)
+        if tab is None:
+            start = time.perf_counter()
+            tab = tab_class()
+            self.tabs.widget(index).layout().addWidget(tab)
+            setattr(self, attr, tab)
+            startup_timer.mark(f"tab {title}", time.perf_counter() - start)
+        return tab
+    
+    def showEvent(self, event):
+        self.ensure_tab(self.tabs.currentIndex())
+        super().showEvent(event)
+    
+    def closeEvent(self, event):
+        query_service.shutdown()
+        checkpoint_database(mode="TRUNCATE")
+        if os.environ.get("STOCK_QUERY_REPORT"):
+            query_stats.dump(os.environ["STOCK_QUERY_REPORT"])
+        super().closeEvent(event)
+    
+    def save_query_report(self):
+        path, _ = QFileDialog.getSaveFileName(self, "Save Query Statistics", "query_report.json",
+                                              "JSON files (*.json)")
+        if not path:
+            return
+        try:
+            query_stats.dump(path)
+        except OSError as error:
+            QMessageBox.critical(self, "Error", f"Could not save query statistics: {error}")
+            return
+        self.statusBar().showMessage(f"Query statistics saved to {path}")
+    
+    def archive_old_orders(self):
+        days, ok = QInputDialog.getInt(self, "Archive Old Orders",
+                                       "Move received, cancelled and completed orders older than this many days\n"
+                                       "to the order archive:", ARCHIVE_AFTER_DAYS, 1, 100000)
+        if not ok:
+            return
+        cutoff = QDate.currentDate().addDays(-days).toString(Qt.ISODate)
+        self.statusBar().showMessage(f"Archiving orders dated before {cutoff}...")
+        
+        def archived(moved):
+            self.statusBar().showMessage(f"Moved {moved['PurchaseOrders']} purchase and {moved['SalesOrders']} "
+                                         f"sales order(s) to {archive_path(QSqlDatabase.database().databaseName())}")
+        
+        def failed(error):
+            self.statusBar().clearMessage()
+            QMessageBox.critical(self, "Error", f"Failed to archive orders: {error}")
+        
+        query_service.submit(lambda db, cancelled: archive_closed_orders(cutoff, db),
+                             on_result=archived, on_error=failed)
+    
+    def import_csv_file(self):
+        labels = {"Stock Items": "items", "Stock Levels": "stock_levels",
+                  "Suppliers": "suppliers", "Customers": "customers"}
+        label, ok = QInputDialog.getItem(self, "Import CSV", "Import:", list(labels), 0, False)
+        if not ok:
+            return
+        path, _ = QFileDialog.getOpenFileName(self, "Import CSV", "", "CSV files (*.csv);;All files (*)")
+        if not path:
+            return
+        rejects_path = os.path.splitext(path)[0] + ".rejects.csv"
+        progress = QProgressDialog(f"Importing {os.path.basename(path)}...", "Cancel", 0, 0, self)
+        progress.setWindowModality(Qt.WindowModal)
+        progress.setMinimumDuration(0)
+        
+        def report_progress(rows_read):
+            progress.setLabelText(f"Importing {os.path.basename(path)}... {rows_read} rows")
+            QCoreApplication.processEvents()
+            return not progress.wasCanceled()
+        
+        try:
+            report = import_csv(QSqlDatabase.database(), labels[label], path, rejects_path,
+                                progress=report_progress)
+        except (OSError, ValueError, RuntimeError, UnicodeDecodeError) as error:
+            progress.close()
+            QMessageBox.critical(self, "Error", f"Import failed: {error}")
+            return
+        progress.close()
+        if not report["rejected"]:
+            os.remove(rejects_path)
+        if report["cancelled"]:
+            QMessageBox.information(self, "Import CSV", "Import cancelled; nothing was imported")
+            return
+        data_events.stock_changed.emit()
+        message = f"Imported {report['imported']} row(s) in {report['seconds']:.1f} s"
+        if report["rejected"]:
+            message += f"; {report['rejected']} rejected row(s) written to {rejects_path}"
+        self.statusBar().showMessage(message)
+        QMessageBox.information(self, "Import CSV", message)
+    
+    def export_data(self):
+        labels = {"Sales Order Items": "sales_order_items", "Stock Levels": "stock_levels",
+                  "Low Stock Report": "low_stock"}
+        label, ok = QInputDialog.getItem(self, "Export", "Export:", list(labels), 0, False)
+        if not ok:
+            return
+        name = labels[label]
+        path, selected_filter = QFileDialog.getSaveFileName(
+            self, "Export", name + ".csv", "CSV files (*.csv);;Parquet files (*.parquet)")
+        if not path:
+            return
+        fmt = "parquet" if path.endswith(".parquet") or selected_filter.startswith("Parquet") else "csv"
+        if not path.endswith(EXPORT_FORMATS[fmt]):
+            path += EXPORT_FORMATS[fmt]
+        progress = QProgressDialog(f"Exporting {label}...", "Cancel", 0, 0, self)
+        progress.setWindowModality(Qt.WindowModal)
+        progress.setMinimumDuration(0)
+        self.export_thread = ExportThread(QSqlDatabase.database().databaseName(), name, path, fmt, self)
+        self.export_thread.progress.connect(
+            lambda rows_written: progress.setLabelText(f"Exporting {label}... {rows_written} rows"))
+        progress.canceled.connect(self.export_thread.cancel)
+        self.export_thread.completed.connect(lambda rows_written: self.export_done(progress, path, rows_written))
+        self.export_thread.failed.connect(lambda error: self.export_failed(progress, error))
+        self.export_thread.start()
+    
+    def export_done(self, progress, path, rows_written):
+        progress.close()
+        if rows_written < 0:
+            self.statusBar().showMessage("Export cancelled")
+            return
+        self.statusBar().showMessage(f"Exported {rows_written} row(s) to {path}")
+    
+    def export_failed(self, progress, error):
+        progress.close()
+        QMessageBox.critical(self, "Error", f"Export failed: {error}")
+    
     def generate_sales_invoice(self):
         dialog = SelectSalesOrderDialog(self)
         if dialog.exec_() == QDialog.Accepted:
             order_id = dialog.selected_order_id
             filename = f"invoice_{order_id}.pdf"
-            generate_invoice_pdf(order_id, filename)
+            self.statusBar().showMessage(f"Generating invoice for order {order_id}...")
+            query_service.submit(
+                lambda db, cancelled: generate_invoice_pdf(order_id, filename, self.invoice_cache, db),
+                on_result=lambda found: self.invoice_done(order_id, filename, found),
+                on_error=lambda error: self.invoice_done(order_id, filename, False, error))
+    
+    def invoice_done(self, order_id, filename, found, error=None):
+        self.statusBar().clearMessage()
+        if found:
             QMessageBox.information(self, "Success", f"Invoice generated: {filename}")
+        elif error:
+            QMessageBox.critical(self, "Error", f"Invoice generation failed: {error}")
+        else:
+            QMessageBox.critical(self, "Error", f"Sales order {order_id} not found")
+    
+    def generate_batch_invoices(self):
+        dialog = BatchInvoiceDialog(self)
+        if dialog.exec_() != QDialog.Accepted:
+            return
+        db_path = QSqlDatabase.database().databaseName()
+        conn = connect_sqlite(db_path)
+        try:
+            order_ids = select_batch_orders(conn, dialog.date_from, dialog.date_to, dialog.status)
+        finally:
+            conn.close()
+        if not order_ids:
+            QMessageBox.information(self, "Batch Invoices", "No sales orders match the selection")
+            return
+        combined_filename = None
+        if dialog.combined_check.isChecked():
+            combined_filename = f"invoices_{dialog.date_from}_{dialog.date_to}.pdf"
+        progress = QProgressDialog("Generating invoices...", "Cancel", 0, len(order_ids), self)
+        progress.setWindowModality(Qt.WindowModal)
+        progress.setMinimumDuration(0)
+        self.batch_thread = BatchInvoiceThread(db_path, order_ids, dialog.out_dir_edit.text().strip(),
+                                               combined_filename, self.invoice_cache.directory, self)
+        self.batch_thread.progress.connect(lambda done, total: progress.setValue(done))
+        progress.canceled.connect(self.batch_thread.cancel)
+        self.batch_thread.completed.connect(lambda written: self.batch_invoices_done(progress, written))
+        self.batch_thread.failed.connect(lambda error: self.batch_invoices_failed(progress, error))
+        self.batch_thread.start()
+    
+    def batch_invoices_done(self, progress, written):
+        cancelled = self.batch_thread.cancel_event.is_set()
+        progress.close()
+        message = f"{len(written)} invoice file(s) written"
+        if cancelled:
+            message = "Batch cancelled: " + message
+        self.statusBar().showMessage(message)
+        QMessageBox.information(self, "Batch Invoices", message)
+    
+    def batch_invoices_failed(self, progress, error):
+        progress.close()
+        QMessageBox.critical(self, "Error", f"Batch invoice generation failed: {error}")
+
+# --- App Benchmarks ---
+# Times the interactive hot paths the way the GUI drives them, on the default
+# connection and the offscreen platform. Asynchronous steps are timed until
+# their result is on screen: a tab until its model stops loading, a dialog
+# until its combo boxes are filled. Each metric is run once to warm up and
+# then `repeat` times; results are in milliseconds.
+APP_BENCH_REPEAT = 5
+APP_BENCH_TIMEOUT_S = 120
+APP_BENCH_TABS = [StockItemsTab, SuppliersTab, CustomersTab, PurchaseOrdersTab, SalesOrdersTab, LowStockReportTab]
+# A metric counts as a regression only when it is slower than the baseline
+# by more than the tolerance and by more than this many milliseconds.
+APP_BENCH_MIN_REGRESSION_MS = 5.0
+ORDER_ENTRY_BENCH_LINES = 200
+BULK_DELETE_BENCH_ROWS = 50000
+CONCURRENT_BENCH_CLERKS = 4
+CONCURRENT_BENCH_EDITS = 100
+CONCURRENT_BENCH_ITEMS = 5
+
+def _wait_until(condition, timeout=APP_BENCH_TIMEOUT_S):
+    # Worker results arrive as queued events, so the loop sleeps until one
+    # is posted; the timer only bounds the wait.
+    timer = QTimer()
+    timer.start(50)
+    deadline = time.perf_counter() + timeout
+    while not condition():
+        if time.perf_counter() > deadline:
+            raise TimeoutError("timed out waiting for a background query")
+        QCoreApplication.processEvents(QEventLoop.AllEvents | QEventLoop.WaitForMoreEvents)
+    timer.stop()
+
+def _dispose(widget):
+    widget.deleteLater()
+    QCoreApplication.sendPostedEvents(None, QEvent.DeferredDelete)
+
+def _timing_summary(samples):
+    ordered = sorted(samples)
+    return {
+        "median_ms": round(ordered[len(ordered) // 2] * 1000, 2),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 2),
+        "min_ms": round(ordered[0] * 1000, 2),
+        "max_ms": round(ordered[-1] * 1000, 2),
+        "runs": len(ordered),
+    }
+
+def _bench_ids(sql, rng, count, unique=False):
+    query = SqlQuery()
+    query.setForwardOnly(True)
+    query.exec_(sql)
+    ids = []
+    while query.next():
+        ids.append(query.value(0))
+    if not ids:
+        return []
+    if unique:
+        return rng.sample(ids, min(count, len(ids)))
+    return [rng.choice(ids) for _ in range(count)]
+
+def _bench_tab(tab_class):
+    tab = tab_class()
+    _wait_until(lambda: not tab.model.loading)
+    return tab
+
+def _bench_dialog(dialog_class, *args):
+    dialog = dialog_class(*args)
+    combos = dialog.findChildren(QComboBox)
+    pickers = dialog.findChildren(ItemPicker)
+    _wait_until(lambda: all(combo.isEnabled() for combo in combos)
+                and not any(picker.model.loading for picker in pickers))
+    return dialog
+
+def table_counts(db=None):
+    counts = {}
+    query = SqlQuery(db)
+    for table in ("Categories", "Suppliers", "Customers", "StockItems", "PurchaseOrders", "PurchaseOrderItems",
+                  "SalesOrders", "SalesOrderItems", "StockMovements"):
+        query.exec_(f"SELECT COUNT(*) FROM {table}")
+        query.next()
+        counts[table] = query.value(0)
+    return counts
+
+def open_bench_database(path, info, source=None, size="small", seed=0):
+    # Opens a database at path to benchmark: a copy of source, or a freshly
+    # generated dataset. Notes where it came from in info.
+    if source:
+        source_conn = connect_sqlite(source)
+        target = sqlite3.connect(path)
+        try:
+            source_conn.backup(target)
+        finally:
+            target.close()
+            source_conn.close()
+        info["source"] = os.path.abspath(source)
+    db = open_database(path)
+    if db is None or not migrate_database(db):
+        return None
+    if not source:
+        start = time.perf_counter()
+        generate_dataset(db, seed, DATASET_SIZES[size])
+        info["size"] = size
+        info["generate_seconds"] = round(time.perf_counter() - start, 1)
+    return db
+
+def benchmark_app(repeat=APP_BENCH_REPEAT, seed=0):
+    # Needs a QApplication and an open, migrated default connection. Edits
+    # stock items and adds order lines, so run it on a copy of real data.
+    rng = random.Random(seed)
+    runs = repeat + 1
+    metrics = {}
+    
+    def measure(name, step, count=runs):
+        samples = []
+        for i in range(count):
+            start = time.perf_counter()
+            step(i)
+            samples.append(time.perf_counter() - start)
+        metrics[name] = _timing_summary(samples[1:])
+    
+    for tab_class in APP_BENCH_TABS:
+        measure(f"tab_load.{tab_class.__name__}", lambda i: _dispose(_bench_tab(tab_class)))
+    items = _bench_ids("SELECT item_id FROM StockLevels WHERE quantity > 0", rng, runs)
+    if items:
+        dialogs = []
+        measure("edit_stock_item_dialog.open",
+                lambda i: dialogs.append(_bench_dialog(EditStockItemDialog, items[i])))
+        
+        def save(i):
+            dialog = dialogs[i]
+            dialog.quantity_edit.setValue(dialog.quantity_edit.value() + (1 if i % 2 else -1))
+            dialog.accept()
+            if dialog.result() != QDialog.Accepted:
+                raise RuntimeError(f"saving stock item {items[i]} failed")
+        
+        measure("edit_stock_item_dialog.save", save)
+        for dialog in dialogs:
+            _dispose(dialog)
+    measure("add_order_item_dialog.open", lambda i: _dispose(_bench_dialog(AddOrderItemDialog, "Sales")))
+    measure("add_purchase_order_dialog.open", lambda i: _dispose(_bench_dialog(AddPurchaseOrderDialog)))
+    measure("add_sales_order_dialog.open", lambda i: _dispose(_bench_dialog(AddSalesOrderDialog)))
+    if items:
+        # Half the searches are SKU prefixes, half the start of a name.
+        query = SqlQuery()
+        texts = []
+        for i, item_id in enumerate(items):
+            query.prepare("SELECT sku, name FROM StockItems WHERE id = ?")
+            query.addBindValue(item_id)
+            if query.exec_() and query.next():
+                sku, name = query.value(0), query.value(1)
+                texts.append(sku[:6] if sku and i % 2 else name[:4])
+        query.finish()
+        dialog = _bench_dialog(AddOrderItemDialog, "Sales")
+        picker = dialog.item_picker
+        
+        def search(i):
+            picker.model.search(texts[i % len(texts)])
+            _wait_until(lambda: not picker.model.loading)
+            if not picker.model.rows:
+                raise RuntimeError(f"no items match {texts[i % len(texts)]!r}")
+        
+        measure("item_picker.search", search)
+        _dispose(dialog)
+    orders = _bench_ids("SELECT id FROM SalesOrders", rng, 1)
+    if orders and items:
+        dialog = ManageOrderItemsDialog(orders[0], "Sales")
+        _wait_until(lambda: not dialog.model.loading)
+        
+        def add_item(i):
+            if not dialog.insert_item(items[i], 1, 1.0):
+                raise RuntimeError(f"adding an item to sales order {orders[0]} failed")
+        
+        measure("manage_order_items.add_item", add_item)
+        _dispose(dialog)
+    report_tab = _bench_tab(LowStockReportTab)
+    
+    def refresh_report(i):
+        report_tab.refresh_report()
+        _wait_until(lambda: not report_tab.model.loading)
+    
+    measure("low_stock_report.refresh_report", refresh_report)
+    _dispose(report_tab)
+    
+    def load_analytics_tab(i):
+        tab = AnalyticsTab()
+        _wait_until(lambda: tab.analytics is not None and not tab.model.loading)
+        return tab
+    
+    measure("analytics_tab.load", lambda i: _dispose(load_analytics_tab(i)), count=2)
+    analytics_tab = load_analytics_tab(0)
+    # Periods are counted back from the newest order rather than from today,
+    # so the same data is sliced the same way on any day.
+    query = SqlQuery()
+    query.exec_("SELECT MAX(order_date) FROM SalesOrders")
+    newest = QDate.fromString(query.value(0), Qt.ISODate) if query.next() and not query.isNull(0) else QDate()
+    query.finish()
+    newest = newest if newest.isValid() else QDate.currentDate()
+    
+    def reslice(i):
+        # A year ending i months back, so each run is a period not seen yet.
+        date_to = newest.addMonths(-i)
+        analytics_tab.date_to_edit.setDate(date_to)
+        analytics_tab.date_from_edit.setDate(date_to.addYears(-1).addDays(1))
+        _wait_until(lambda: not analytics_tab.model.loading)
+    
+    measure("analytics_tab.reslice", reslice)
+    _dispose(analytics_tab)
+    invoices = _bench_ids("SELECT DISTINCT order_id FROM SalesOrderItems", rng, runs)
+    if invoices:
+        with tempfile.TemporaryDirectory() as out_dir:
+            measure("generate_invoice_pdf",
+                    lambda i: generate_invoice_pdf(invoices[i], os.path.join(out_dir, f"invoice_{i}.pdf")))
+    measure("select_sales_order_dialog.open", lambda i: _dispose(_bench_dialog(SelectSalesOrderDialog)))
+    return metrics
+
+def _entry_rate(seconds, lines):
+    return {"seconds": round(seconds, 3), "lines_per_second": round(lines / seconds, 1)}
+
+def benchmark_order_entry(lines=ORDER_ENTRY_BENCH_LINES, seed=0):
+    # Keys the same lines into two new purchase orders: one at a time the
+    # way ManageOrderItemsDialog used to (an autocommitted INSERT, then
+    # re-selecting a QSqlTableModel of the lines), and staged in the dialog
+    # then saved as one batch. Same requirements as benchmark_app.
+    rng = random.Random(seed)
+    item_ids = _bench_ids("SELECT id FROM StockItems", rng, lines)
+    suppliers = _bench_ids("SELECT id FROM Suppliers", rng, 1)
+    if not item_ids or not suppliers:
+        raise ValueError("benchmark_order_entry needs stock items and a supplier")
+    entries = [(item_id, rng.randint(1, 20), round(rng.uniform(1, 100), 2)) for item_id in item_ids]
+    query = SqlQuery()
+    orders = []
+    for _ in range(2):
+        query.prepare("INSERT INTO PurchaseOrders (supplier_id, order_date, status) VALUES (?, ?, 'Pending')")
+        query.addBindValue(suppliers[0])
+        query.addBindValue(QDate.currentDate().toString(Qt.ISODate))
+        if not query.exec_():
+            raise RuntimeError(query.lastError().text())
+        orders.append(query.lastInsertId())
+    result = {"lines": len(entries)}
+    model = QSqlTableModel()
+    model.setTable("PurchaseOrderItems")
+    model.setFilter(f"order_id = {orders[0]}")
+    select_model(model)
+    start = time.perf_counter()
+    for item_id, quantity, price in entries:
+        query.prepare("INSERT INTO PurchaseOrderItems (order_id, item_id, quantity, price) VALUES (?, ?, ?, ?)")
+        for value in (orders[0], item_id, quantity, price):
+            query.addBindValue(value)
+        if not query.exec_():
+            raise RuntimeError(query.lastError().text())
+        select_model(model)
+        data_events.stock_changed.emit()
+    result["one_at_a_time"] = _entry_rate(time.perf_counter() - start, len(entries))
+    dialog = ManageOrderItemsDialog(orders[1], "Purchase")
+    _wait_until(lambda: not dialog.model.loading)
+    start = time.perf_counter()
+    for item_id, quantity, price in entries:
+        dialog.stage_line(item_id, str(item_id), quantity, price)
+    if not dialog.save_lines():
+        raise RuntimeError(f"saving the lines of purchase order {orders[1]} failed")
+    result["batched"] = _entry_rate(time.perf_counter() - start, len(entries))
+    if dialog.model.rowCount() != len(entries):
+        raise RuntimeError(f"expected {len(entries)} lines in the view, found {dialog.model.rowCount()}")
+    _dispose(dialog)
+    result["speedup"] = round(result["batched"]["lines_per_second"] / result["one_at_a_time"]["lines_per_second"], 1)
+    return result
+
+def _foreign_key_violations(db=None):
+    query = new_query(db)
+    query.exec_("PRAGMA foreign_key_check")
+    return sum(1 for _ in query_rows(query))
+
+def benchmark_bulk_delete(rows=BULK_DELETE_BENCH_ROWS, seed=0):
+    # Deletes rows sales orders (their lines go by cascade) and archives as
+    # many stock items, each as one chunked bulk operation, then counts the
+    # rows left pointing at nothing.
+    rng = random.Random(seed)
+    order_ids = _bench_ids("SELECT id FROM SalesOrders", rng, rows, unique=True)
+    item_ids = _bench_ids("SELECT id FROM StockItems WHERE archived = 0", rng, rows, unique=True)
+    if not order_ids:
+        raise ValueError("benchmark_bulk_delete needs sales orders")
+    query = SqlQuery()
+    query.exec_("SELECT COUNT(*) FROM SalesOrderItems")
+    lines_before = next(query_rows(query))[0]
+    result = {"orders": len(order_ids), "items": len(item_ids)}
+    start = time.perf_counter()
+    deleted = bulk_delete("SalesOrders", order_ids)
+    result["delete_orders_seconds"] = round(time.perf_counter() - start, 3)
+    query.exec_("SELECT COUNT(*) FROM SalesOrderItems")
+    result["orders_deleted"] = deleted
+    result["lines_cascaded"] = lines_before - next(query_rows(query))[0]
+    start = time.perf_counter()
+    result["items_archived"] = bulk_archive("StockItems", item_ids)
+    result["archive_items_seconds"] = round(time.perf_counter() - start, 3)
+    result["orphans"] = _foreign_key_violations()
+    return result
+
+def _clerk_edits(path, name, item_ids, edits, seed, outcome):
+    # One workstation: opens an item, waits a moment as a user would, changes
+    # one field and the quantity, and saves. After a conflict it reopens the
+    # item and makes its edit again.
+    rng = random.Random(seed)
+    db = open_database(path, name)
+    try:
+        for i in range(edits):
+            item_id = rng.choice(item_ids)
+            field = rng.choice(("unit_price", "description", "reorder_point"))
+            change = rng.randint(-5, 5)
+            while True:
+                item, level, quantity = load_stock_item(item_id, db)
+                time.sleep(rng.uniform(0, 0.002))
+                item_values = {name: item[name] for name in STOCK_ITEM_FIELDS}
+                level_values = {name: level[name] for name in STOCK_LEVEL_FIELDS}
+                if field == "unit_price":
+                    item_values["unit_price"] = round(rng.uniform(1, 100), 2)
+                elif field == "description":
+                    item_values["description"] = f"{name} edit {i}"
+                else:
+                    level_values["reorder_point"] = rng.randint(0, 50)
+                try:
+                    save_stock_item(item_id, item, level, item_values, level_values, change, db=db)
+                    if changed_fields(item, item_values) or changed_fields(level, level_values):
+                        outcome["writes"] += 1
+                    break
+                except ConcurrentEditError:
+                    outcome["conflicts"] += 1
+            outcome["saves"] += 1
+            outcome["quantity"][item_id] = outcome["quantity"].get(item_id, 0) + change
+    except Exception as e:
+        outcome["error"] = repr(e)
+    finally:
+        db.close()
+
+def benchmark_concurrent_edits(path, clerks=CONCURRENT_BENCH_CLERKS, edits=CONCURRENT_BENCH_EDITS,
+                               items=CONCURRENT_BENCH_ITEMS, seed=0):
+    # Clerks on their own connections edit the same few items at once. Every
+    # quantity change must reach the balance and every save
+    # that changed a field must leave a new version behind, however the
+    # saves interleave.
+    rng = random.Random(seed)
+    item_ids = _bench_ids("SELECT item_id FROM StockLevels", rng, items, unique=True)
+    if not item_ids:
+        raise ValueError("benchmark_concurrent_edits needs stock items")
+    placeholders = ", ".join("?" * len(item_ids))
+    state_sql = f"""SELECT si.id, sl.quantity, si.version + sl.version FROM StockItems si
+                    JOIN StockLevels sl ON sl.item_id = si.id WHERE si.id IN ({placeholders})"""
+    query = SqlQuery()
+    query.prepare(state_sql)
+    for item_id in item_ids:
+        query.addBindValue(item_id)
+    query.exec_()
+    before = {row[0]: row[1:] for row in query_rows(query)}
+    outcomes = [{"saves": 0, "writes": 0, "conflicts": 0, "quantity": {}} for _ in range(clerks)]
+    threads = [threading.Thread(target=_clerk_edits,
+                                args=(path, f"clerk_{i}", item_ids, edits, seed + i, outcomes[i]))
+               for i in range(clerks)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    seconds = time.perf_counter() - start
+    for i in range(clerks):
+        QSqlDatabase.removeDatabase(f"clerk_{i}")
+    errors = [outcome["error"] for outcome in outcomes if "error" in outcome]
+    if errors:
+        raise RuntimeError(errors[0])
+    query.exec_()
+    after = {row[0]: row[1:] for row in query_rows(query)}
+    saves = sum(outcome["saves"] for outcome in outcomes)
+    lost_quantity = sum(abs(before[item_id][0] + sum(outcome["quantity"].get(item_id, 0) for outcome in outcomes)
+                            - after[item_id][0]) for item_id in item_ids)
+    versions = sum(after[item_id][1] - before[item_id][1] for item_id in item_ids)
+    return {"clerks": clerks, "items": len(item_ids), "saves": saves,
+            "conflicts": sum(outcome["conflicts"] for outcome in outcomes),
+            "writes": sum(outcome["writes"] for outcome in outcomes), "saves_per_second": round(saves / seconds, 1),
+            "lost_quantity": lost_quantity, "lost_writes": sum(outcome["writes"] for outcome in outcomes) - versions}
+
+def compare_benchmarks(result, baseline, tolerance):
+    # Returns (metric, baseline_ms, current_ms) for each slower median.
+    regressions = []
+    for name, current in result["metrics"].items():
+        previous = baseline.get("metrics", {}).get(name)
+        if previous is None:
+            continue
+        limit = max(previous["median_ms"] * (1 + tolerance), previous["median_ms"] + APP_BENCH_MIN_REGRESSION_MS)
+        if current["median_ms"] > limit:
+            regressions.append((name, previous["median_ms"], current["median_ms"]))
+    return regressions
+
+# --- Query Plans ---
+# Hot statements and the index each one must be planned with.
+HOT_QUERY_PLANS = {
+    "order items (purchase)": ("SELECT * FROM PurchaseOrderItems WHERE order_id = 1",
+                               "idx_purchaseorderitems_order_id"),
+    "order items (sales)": ("SELECT * FROM SalesOrderItems WHERE order_id = 1",
+                            "idx_salesorderitems_order_id"),
+    "item usage (purchase)": ("SELECT id FROM PurchaseOrderItems WHERE item_id = 1",
+                              "idx_purchaseorderitems_item_id"),
+    "item usage (sales)": ("SELECT id FROM SalesOrderItems WHERE item_id = 1",
+                           "idx_salesorderitems_item_id"),
+    "customer orders": ("SELECT id FROM SalesOrders WHERE customer_id = 1",
+                        "idx_salesorders_customer_id"),
+    "supplier orders": ("SELECT id FROM PurchaseOrders WHERE supplier_id = 1",
+                        "idx_purchaseorders_supplier_id"),
+    "sales orders by date": ("SELECT id FROM SalesOrders WHERE order_date >= '2024-01-01' AND order_date <= '2024-01-31'",
+                             "idx_salesorders_order_date"),
+    "purchase orders by date": ("SELECT id FROM PurchaseOrders WHERE order_date >= '2024-01-01' AND order_date <= '2024-01-31'",
+                                "idx_purchaseorders_order_date"),
+    "stock items page by name": ("SELECT * FROM StockItems WHERE name > 'm' ORDER BY name ASC, id ASC LIMIT 256",
+                                 "idx_stockitems_name"),
+    "item picker by sku": (ITEM_PICKER_SKU_QUERY.replace("LIMIT ?", "LIMIT 20").replace("?", "'A'"),
+                           "idx_stockitems_sku"),
+    "item picker by name": (ITEM_PICKER_NAME_QUERY.replace("LIMIT ?", "LIMIT 20").replace("?", "'a'"),
+                            "idx_stockitems_name_nocase"),
+    "item search": ("SELECT rowid FROM StockItemsSearch WHERE StockItemsSearch MATCH '\"wid\"*' LIMIT 5000",
+                    "StockItemsSearch VIRTUAL TABLE INDEX"),
+    "item movements as of": ("SELECT SUM(quantity) FROM StockMovements WHERE item_id = 1 AND id > 100 AND movement_date <= '2024-01-31'",
+                             "idx_stockmovements_item_id"),
+    "low stock": (LOW_STOCK_QUERY, "idx_stocklevels_below_reorder"),
+    "invoice lines": (INVOICE_QUERY.replace("?", "1"), "idx_salesorderitems_order_id"),
+    "sales orders page by total": ("SELECT * FROM SalesOrders WHERE total > 100 ORDER BY total DESC, id DESC LIMIT 256",
+                                   "idx_salesorders_total"),
+    "purchase orders by total": ("SELECT id FROM PurchaseOrders WHERE total >= 1000",
+                                 "idx_purchaseorders_total"),
+}
+
+def explain_query_plan(sql, db=None):
+    query = SqlQuery(db)
+    if not query.exec_(f"EXPLAIN QUERY PLAN {sql}"):
+        return None
+    details = []
+    while query.next():
+        details.append(query.value(3))
+    return details
+
+def check_query_plans(db=None):
+    failures = []
+    for name, (sql, index) in HOT_QUERY_PLANS.items():
+        plan = explain_query_plan(sql, db)
+        if plan is None or not any(index in detail for detail in plan):
+            failures.append((name, plan))
+    return failures
+
+# --- Command Line ---
+def run_batch_invoices_cli(argv):
+    parser = argparse.ArgumentParser(prog="helo.py batch-invoices")
+    parser.add_argument("--db", default=DB_FILENAME)
+    parser.add_argument("--from", dest="date_from")
+    parser.add_argument("--to", dest="date_to")
+    parser.add_argument("--status")
+    parser.add_argument("--min-total", type=float)
+    parser.add_argument("--max-total", type=float)
+    parser.add_argument("--out", default="invoices")
+    parser.add_argument("--combined", metavar="FILENAME")
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--cache-dir", default=INVOICE_CACHE_DIR)
+    parser.add_argument("--no-cache", action="store_true")
+    args = parser.parse_args(argv)
+    conn = connect_sqlite(args.db)
+    try:
+        order_ids = select_batch_orders(conn, args.date_from, args.date_to, args.status, args.min_total, args.max_total)
+    finally:
+        conn.close()
+    written = generate_invoices_batch(args.db, order_ids, args.out, args.combined, args.workers,
+                                      progress=lambda done, total: print(f"{done}/{total}", file=sys.stderr),
+                                      cache_dir=None if args.no_cache else args.cache_dir)
+    print(f"{len(written)} invoice file(s) written to {args.out}")
+    return 0
+
+def run_bench_invoice_cli(argv):
+    parser = argparse.ArgumentParser(prog="helo.py bench-invoice")
+    parser.add_argument("--lines", type=int, default=2000)
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args(argv)
+    print(json.dumps(benchmark_invoice_template(args.lines, args.runs), indent=2))
+    return 0
+
+def run_check_plans_cli(argv):
+    parser = argparse.ArgumentParser(prog="helo.py check-plans")
+    parser.add_argument("--db", default=DB_FILENAME)
+    args = parser.parse_args(argv)
+    app = QCoreApplication(sys.argv[:1])
+    db = open_database(args.db)
+    if db is None or not migrate_database(db):
+        print(f"Could not open {args.db}", file=sys.stderr)
+        return 1
+    failures = check_query_plans(db)
+    for name, plan in failures:
+        print(f"FAIL {name}: {plan}")
+    print(f"{len(HOT_QUERY_PLANS) - len(failures)}/{len(HOT_QUERY_PLANS)} hot queries use their index")
+    return 1 if failures else 0
+
+def run_check_totals_cli(argv):
+    parser = argparse.ArgumentParser(prog="helo.py check-totals")
+    parser.add_argument("--db", default=DB_FILENAME)
+    parser.add_argument("--repair", action="store_true", help="recompute the totals that are wrong")
+    args = parser.parse_args(argv)
+    app = QCoreApplication(sys.argv[:1])
+    db = open_database(args.db)
+    if db is None or not migrate_database(db):
+        print(f"Could not open {args.db}", file=sys.stderr)
+        return 1
+    mismatches = check_order_totals(db, args.repair)
+    if mismatches is None:
+        print(f"Could not check order totals: {db.lastError().text()}", file=sys.stderr)
+        return 1
+    for table, count in mismatches.items():
+        print(f"{table}: {count} order(s) {'repaired' if args.repair else 'with wrong totals'}")
+    return 0 if args.repair or not any(mismatches.values()) else 1
+
+def run_bench_order_entry_cli(argv):
+    parser = argparse.ArgumentParser(prog="helo.py bench-order-entry")
+    parser.add_argument("--db", help="benchmark a copy of this database instead of generating one")
+    parser.add_argument("--size", choices=list(DATASET_SIZES), default="small")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--lines", type=int, default=ORDER_ENTRY_BENCH_LINES)
+    args = parser.parse_args(argv)
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    app = QApplication(sys.argv[:1])
+    with tempfile.TemporaryDirectory() as work_dir:
+        path = os.path.join(work_dir, "bench.db")
+        result = {"seed": args.seed}
+        db = open_bench_database(path, result, args.db, args.size, args.seed)
+        if db is None:
+            print(f"Could not open {args.db or path}", file=sys.stderr)
+            return 1
+        try:
+            result.update(benchmark_order_entry(args.lines, args.seed))
+        finally:
+            query_service.shutdown()
+            db.close()
+    print(json.dumps(result, indent=2))
+    return 0
+
+def run_bench_bulk_delete_cli(argv):
+    parser = argparse.ArgumentParser(prog="helo.py bench-bulk-delete")
+    parser.add_argument("--db", help="benchmark a copy of this database instead of generating one")
+    parser.add_argument("--size", choices=list(DATASET_SIZES), default="medium")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--rows", type=int, default=BULK_DELETE_BENCH_ROWS)
+    args = parser.parse_args(argv)
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    app = QApplication(sys.argv[:1])
+    with tempfile.TemporaryDirectory() as work_dir:
+        path = os.path.join(work_dir, "bench.db")
+        result = {"seed": args.seed}
+        db = open_bench_database(path, result, args.db, args.size, args.seed)
+        if db is None:
+            print(f"Could not open {args.db or path}", file=sys.stderr)
+            return 1
+        try:
+            result.update(benchmark_bulk_delete(args.rows, args.seed))
+        finally:
+            query_service.shutdown()
+            db.close()
+    print(json.dumps(result, indent=2))
+    return 0 if result.get("orphans") == 0 else 1
+
+def run_bench_concurrent_edits_cli(argv):
+    parser = argparse.ArgumentParser(prog="helo.py bench-concurrent-edits")
+    parser.add_argument("--db", help="benchmark a copy of this database instead of generating one")
+    parser.add_argument("--size", choices=list(DATASET_SIZES), default="small")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--clerks", type=int, default=CONCURRENT_BENCH_CLERKS)
+    parser.add_argument("--edits", type=int, default=CONCURRENT_BENCH_EDITS, help="saves per clerk")
+    parser.add_argument("--items", type=int, default=CONCURRENT_BENCH_ITEMS, help="items the clerks share")
+    args = parser.parse_args(argv)
+    app = QCoreApplication(sys.argv[:1])
+    with tempfile.TemporaryDirectory() as work_dir:
+        path = os.path.join(work_dir, "bench.db")
+        result = {"seed": args.seed}
+        db = open_bench_database(path, result, args.db, args.size, args.seed)
+        if db is None:
+            print(f"Could not open {args.db or path}", file=sys.stderr)
+            return 1
+        try:
+            result.update(benchmark_concurrent_edits(path, args.clerks, args.edits, args.items, args.seed))
+        finally:
+            db.close()
+    print(json.dumps(result, indent=2))
+    return 0 if result.get("lost_quantity") == 0 and result.get("lost_writes") == 0 else 1
+
+def run_analytics_cli(argv):
+    parser = argparse.ArgumentParser(prog="helo.py analytics")
+    parser.add_argument("--db", default=DB_FILENAME)
+    parser.add_argument("--kind", choices=list(ANALYTICS_KINDS), default="sales")
+    parser.add_argument("--by", choices=list(ANALYTICS_DIMENSIONS), default="category")
+    parser.add_argument("--from", dest="date_from", help="first order date, YYYY-MM-DD")
+    parser.add_argument("--to", dest="date_to", help="last order date, YYYY-MM-DD")
+    parser.add_argument("--top", type=int, default=20, help="rows to print, 0 for all")
+    args = parser.parse_args(argv)
+    if args.by == {"sales": "supplier", "purchases": "customer"}[args.kind]:
+        parser.error(f"{args.kind} cannot be grouped by {args.by}")
+    app = QCoreApplication(sys.argv[:1])
+    db = open_database(args.db)
+    if db is None or not migrate_database(db):
+        print(f"Could not open {args.db}", file=sys.stderr)
+        return 1
+    try:
+        analytics = load_analytics(db)
+    except RuntimeError as error:
+        print(error, file=sys.stderr)
+        return 1
+    timings = []
+    for _ in range(2):
+        start = time.perf_counter()
+        columns, rows = analytics_rows(db, lambda: False, analytics, args.kind, args.by, args.date_from, args.date_to,
+                                       args.top or None)
+        timings.append(round((time.perf_counter() - start) * 1000, 2))
+    print(json.dumps({
+        "lines": {"sales": len(analytics.sales), "purchases": len(analytics.purchases)},
+        "load_seconds": round(analytics.seconds, 2),
+        "rollup_ms": timings[0],
+        "cached_rollup_ms": timings[1],
+        "columns": columns,
+        "rows": rows,
+    }, indent=2))
+    return 0
+
+def run_bench_db_cli(argv):
+    parser = argparse.ArgumentParser(prog="helo.py bench-db")
+    parser.add_argument("--commits", type=int, default=500)
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--reads", type=int, default=20000)
+    args = parser.parse_args(argv)
+    app = QCoreApplication(sys.argv[:1])
+    print(json.dumps(benchmark_db_profile(args.commits, args.rows, args.reads), indent=2))
+    return 0
+
+def run_stock_as_of_cli(argv):
+    parser = argparse.ArgumentParser(prog="helo.py stock-as-of")
+    parser.add_argument("date", help="ISO date or datetime, e.g. 2024-03-31 or '2024-03-31 18:00:00'")
+    parser.add_argument("--db", default=DB_FILENAME)
+    parser.add_argument("--item", type=int)
+    args = parser.parse_args(argv)
+    app = QCoreApplication(sys.argv[:1])
+    db = open_database(args.db)
+    if db is None or not migrate_database(db):
+        print(f"Could not open {args.db}", file=sys.stderr)
+        return 1
+    # A bare date means the end of that day.
+    as_of = args.date if " " in args.date else f"{args.date} 23:59:59"
+    for item_id, name, quantity in stock_as_of(as_of, args.item):
+        print(f"{item_id}\t{name}\t{quantity}")
+    return 0
+
+def run_snapshot_stock_cli(argv):
+    parser = argparse.ArgumentParser(prog="helo.py snapshot-stock")
+    parser.add_argument("--db", default=DB_FILENAME)
+    args = parser.parse_args(argv)
+    app = QCoreApplication(sys.argv[:1])
+    db = open_database(args.db)
+    if db is None or not migrate_database(db) or not take_stock_snapshot():
+        print(f"Could not snapshot {args.db}", file=sys.stderr)
+        return 1
+    return 0
+
+def run_archive_orders_cli(argv):
+    parser = argparse.ArgumentParser(prog="helo.py archive-orders")
+    parser.add_argument("--db", default=DB_FILENAME)
+    parser.add_argument("--days", type=int, default=ARCHIVE_AFTER_DAYS,
+                        help="archive closed orders older than this many days")
+    parser.add_argument("--before", help="archive closed orders dated before this day, YYYY-MM-DD (overrides --days)")
+    parser.add_argument("--vacuum", action="store_true", help="then compact the live file to its new size")
+    args = parser.parse_args(argv)
+    app = QCoreApplication(sys.argv[:1])
+    db = open_database(args.db)
+    if db is None or not migrate_database(db):
+        print(f"Could not open {args.db}", file=sys.stderr)
+        return 1
+    cutoff = args.before or QDate.currentDate().addDays(-args.days).toString(Qt.ISODate)
+    result = {"cutoff": cutoff, "archive": archive_path(args.db), "live_bytes_before": os.path.getsize(args.db)}
+    start = time.perf_counter()
+    try:
+        result["moved"] = archive_closed_orders(cutoff, db)
+    except RuntimeError as e:
+        print(f"Could not archive orders: {e}", file=sys.stderr)
+        return 1
+    result["seconds"] = round(time.perf_counter() - start, 2)
+    if args.vacuum:
+        query = SqlQuery(db)
+        if not query.exec_("VACUUM"):
+            print(f"Could not vacuum {args.db}: {query.lastError().text()}", file=sys.stderr)
+            return 1
+        checkpoint_database(db, "TRUNCATE")
+    result["live_bytes_after"] = os.path.getsize(args.db)
+    print(json.dumps(result, indent=2))
+    return 0
+
+def run_import_csv_cli(argv):
+    parser = argparse.ArgumentParser(prog="helo.py import-csv")
+    parser.add_argument("kind", choices=IMPORT_KINDS)
+    parser.add_argument("csv_file")
+    parser.add_argument("--db", default=DB_FILENAME)
+    parser.add_argument("--rejects", metavar="FILENAME", help="write rejected rows with their reasons here")
+    parser.add_argument("--no-create-categories", action="store_true",
+                        help="reject items whose category does not exist")
+    args = parser.parse_args(argv)
+    app = QCoreApplication(sys.argv[:1])
+    db = open_database(args.db)
+    if db is None or not migrate_database(db):
+        print(f"Could not open {args.db}", file=sys.stderr)
+        return 1
+    try:
+        report = import_csv(db, args.kind, args.csv_file, args.rejects, not args.no_create_categories,
+                            progress=lambda rows_read: print(f"{rows_read} rows", file=sys.stderr))
+    except (OSError, ValueError, RuntimeError, UnicodeDecodeError) as error:
+        print(f"Import failed: {error}", file=sys.stderr)
+        return 1
+    print(json.dumps(report, indent=2))
+    return 0
+
+def run_bench_import_cli(argv):
+    parser = argparse.ArgumentParser(prog="helo.py bench-import")
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+    app = QCoreApplication(sys.argv[:1])
+    print(json.dumps(benchmark_import(args.rows, args.seed), indent=2))
+    return 0
+
+def run_export_cli(argv):
+    parser = argparse.ArgumentParser(prog="helo.py export")
+    parser.add_argument("datasets", nargs="+", choices=list(EXPORTS) + ["all"])
+    parser.add_argument("--db", default=DB_FILENAME)
+    parser.add_argument("--format", choices=list(EXPORT_FORMATS), default="csv")
+    parser.add_argument("--out-dir", default=".")
+    args = parser.parse_args(argv)
+    names = list(EXPORTS) if "all" in args.datasets else args.datasets
+    os.makedirs(args.out_dir, exist_ok=True)
+    for name in names:
+        path = os.path.join(args.out_dir, name + EXPORT_FORMATS[args.format])
+        start = time.perf_counter()
+        try:
+            rows_written = export_dataset(args.db, name, path, args.format)
+        except (OSError, RuntimeError, sqlite3.Error) as error:
+            print(f"Export of {name} failed: {error}", file=sys.stderr)
+            return 1
+        print(f"{name}: {rows_written} rows to {path} in {time.perf_counter() - start:.1f} s")
+    return 0
+
+def run_check_responsiveness_cli(argv):
+    parser = argparse.ArgumentParser(prog="helo.py check-responsiveness")
+    parser.add_argument("--db", default=DB_FILENAME)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--tick-ms", type=int, default=50)
+    args = parser.parse_args(argv)
+    app = QCoreApplication(sys.argv[:1])
+    db = open_database(args.db)
+    if db is None:
+        print(f"Could not open {args.db}", file=sys.stderr)
+        return 1
+    report = check_event_loop_responsiveness(args.seconds, args.tick_ms)
+    query_service.shutdown()
+    print(json.dumps(report, indent=2))
+    return 0 if report["responsive"] else 1
+
+def run_generate_data_cli(argv):
+    parser = argparse.ArgumentParser(prog="helo.py generate-data")
+    parser.add_argument("--db", required=True, help="new or empty database file to fill")
+    parser.add_argument("--size", choices=list(DATASET_SIZES), default="small")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--end-date", default=DATASET_END_DATE, help="date of the newest orders, YYYY-MM-DD")
+    for name in DATASET_SIZES["small"]:
+        parser.add_argument("--" + name.replace("_", "-"), dest=name, type=int, help="override the preset count")
+    args = parser.parse_args(argv)
+    sizes = dict(DATASET_SIZES[args.size])
+    sizes.update({name: getattr(args, name) for name in sizes if getattr(args, name) is not None})
+    app = QCoreApplication(sys.argv[:1])
+    db = open_database(args.db)
+    if db is None or not migrate_database(db):
+        print(f"Could not open {args.db}", file=sys.stderr)
+        return 1
+    start = time.perf_counter()
+    try:
+        counts = generate_dataset(db, args.seed, sizes, end_date=args.end_date)
+    except (ValueError, RuntimeError) as error:
+        print(f"Generation failed: {error}", file=sys.stderr)
+        return 1
+    print(json.dumps({"seed": args.seed, "end_date": args.end_date, "counts": counts,
+                      "seconds": round(time.perf_counter() - start, 1)}, indent=2))
+    return 0
+
+def run_bench_app_cli(argv):
+    parser = argparse.ArgumentParser(prog="helo.py bench-app")
+    parser.add_argument("--db", help="benchmark a copy of this database instead of generating one")
+    parser.add_argument("--size", choices=list(DATASET_SIZES), default="small")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=APP_BENCH_REPEAT)
+    parser.add_argument("--out", metavar="FILENAME", help="also write the JSON result here")
+    parser.add_argument("--compare", metavar="BASELINE", help="exit 1 if slower than this earlier result")
+    parser.add_argument("--tolerance", type=float, default=0.3, help="allowed slowdown, 0.3 = 30%%")
+    args = parser.parse_args(argv)
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    app = QApplication(sys.argv[:1])
+    with tempfile.TemporaryDirectory() as work_dir:
+        path = os.path.join(work_dir, "bench.db")
+        result = {"seed": args.seed, "repeat": args.repeat}
+        db = open_bench_database(path, result, args.db, args.size, args.seed)
+        if db is None:
+            print(f"Could not open {args.db or path}", file=sys.stderr)
+            return 1
+        result["counts"] = table_counts(db)
+        query = SqlQuery(db)
+        query.exec_("SELECT sqlite_version()")
+        query.next()
+        result["environment"] = {
+            "python": sys.version.split()[0],
+            "qt": QT_VERSION_STR,
+            "pyqt": PYQT_VERSION_STR,
+            "sqlite": query.value(0),
+            "platform": sys.platform,
+            "qpa": os.environ["QT_QPA_PLATFORM"],
+            "db_profile": DB_PROFILE,
+        }
+        query_stats.reset()
+        try:
+            result["metrics"] = benchmark_app(args.repeat, args.seed)
+            result["queries"] = query_stats.report(top=10)
+        finally:
+            query_service.shutdown()
+            db.close()
+    output = json.dumps(result, indent=2)
+    print(output)
+    if args.out:
+        with open(args.out, "w") as out:
+            out.write(output + "\n")
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = compare_benchmarks(result, baseline, args.tolerance)
+        for name, before, after in regressions:
+            print(f"REGRESSION {name}: {before:.2f} ms -> {after:.2f} ms", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+CLI_COMMANDS = {
+    "batch-invoices": run_batch_invoices_cli,
+    "bench-invoice": run_bench_invoice_cli,
+    "check-plans": run_check_plans_cli,
+    "check-totals": run_check_totals_cli,
+    "bench-db": run_bench_db_cli,
+    "stock-as-of": run_stock_as_of_cli,
+    "snapshot-stock": run_snapshot_stock_cli,
+    "archive-orders": run_archive_orders_cli,
+    "import-csv": run_import_csv_cli,
+    "bench-import": run_bench_import_cli,
+    "export": run_export_cli,
+    "check-responsiveness": run_check_responsiveness_cli,
+    "generate-data": run_generate_data_cli,
+    "bench-app": run_bench_app_cli,
+    "analytics": run_analytics_cli,
+    "bench-order-entry": run_bench_order_entry_cli,
+    "bench-bulk-delete": run_bench_bulk_delete_cli,
+    "bench-concurrent-edits": run_bench_concurrent_edits_cli,
+}
 
 # --- Application Entry Point ---
 if __name__ == "__main__":
+    if db_profile_error():
+        print(db_profile_error(), file=sys.stderr)
+        sys.exit(2)
+    if len(sys.argv) > 1 and sys.argv[1] in CLI_COMMANDS:
+        sys.exit(CLI_COMMANDS[sys.argv[1]](sys.argv[2:]))
+    startup_timer.mark("imports")
     app = QApplication(sys.argv)
+    # Splash Screen (requires a logo.png file or remove this part)
+    splash = QSplashScreen(QPixmap("logo.png"))
+    splash.show()
+    app.processEvents()
     if not setup_database():
         sys.exit(1)
+    startup_timer.mark("database")
     window = MainWindow()
+    startup_timer.mark("main window")
     window.show()
+    
+    def startup_finished():
+        # Runs on the first event loop iteration after the window is shown.
+        splash.finish(window)
+        report = startup_timer.report()
+        window.statusBar().showMessage(
+            f"Welcome to Stock Management System (ready in {report['time_to_interactive_ms']:.0f} ms)")
+        if os.environ.get("STOCK_STARTUP_LOG"):
+            with open(os.environ["STOCK_STARTUP_LOG"], "a") as log:
+                log.write(json.dumps(report) + "\n")
+        if "--startup-report" in sys.argv:
+            # Measure-and-exit mode for tracking startup time between releases.
+            print(json.dumps(report, indent=2))
+            app.quit()
+    
+    QTimer.singleShot(0, startup_finished)
     sys.exit(app.exec_())
\ No newline at end of file
@@ -0,0 +1,87 @@
+import re
+import sqlite3
+
+from PyQt5.QtSql import QSqlDatabase
+
+import helo
+
+MIGRATION_INDEXES = {
+    name
+    for steps in helo.MIGRATIONS
+    for step in steps if isinstance(step, str)
+    for name in re.findall(r"CREATE (?:UNIQUE )?INDEX IF NOT EXISTS (\w+)", step)
+}
+
+
+def make_baseline_database(path):
+    # The schema the app created before it kept a user_version, with the
+    # orphans it could leave behind: nothing enforced foreign keys, so
+    # deleting a row left everything that referred to it in place.
+    conn = sqlite3.connect(path)
+    for step in helo.MIGRATIONS[0]:
+        if isinstance(step, str):
+            conn.execute(step)
+    conn.executescript("""
+        INSERT INTO Categories (id, name) VALUES (1, 'Tools'), (2, 'Garden');
+        INSERT INTO StockItems (id, name, category_id, unit_price) VALUES
+            (1, 'Drill', 1, 50.0), (2, 'Rake', 2, 12.5), (3, 'Hose', 2, 20.0);
+        INSERT INTO StockLevels (item_id, quantity) VALUES (1, 5), (2, 0), (3, 7);
+        INSERT INTO Suppliers (id, name) VALUES (1, 'Acme'), (2, 'Globex');
+        INSERT INTO Customers (id, name) VALUES (1, 'Ali'), (2, 'Maria');
+        INSERT INTO PurchaseOrders (id, supplier_id, order_date, status) VALUES
+            (1, 1, '2024-01-10', 'Received'), (2, 2, '2024-02-10', 'Pending');
+        INSERT INTO PurchaseOrderItems (order_id, item_id, quantity, price) VALUES
+            (1, 1, 10, 30.0), (1, 3, 4, 11.0), (2, 2, 6, 7.0);
+        INSERT INTO SalesOrders (id, customer_id, order_date, status) VALUES
+            (1, 1, '2024-03-01', 'Completed'), (2, 2, '2024-03-02', 'Pending');
+        INSERT INTO SalesOrderItems (order_id, item_id, quantity, price) VALUES
+            (1, 1, 2, 50.0), (1, 3, 1, 20.0), (2, 2, 3, 12.5);
+        DELETE FROM StockItems WHERE id = 3;
+        DELETE FROM Categories WHERE id = 2;
+        DELETE FROM Suppliers WHERE id = 2;
+        DELETE FROM Customers WHERE id = 2;
+        DELETE FROM SalesOrders WHERE id = 1;
+    """)
+    conn.commit()
+    conn.close()
+
+
+def migrate(path):
+    db = helo.open_database(path, "migration_test")
+    try:
+        assert helo.schema_version(db) == 0
+        assert helo.migrate_database(db)
+        return helo.schema_version(db)
+    finally:
+        db.close()
+        del db
+        QSqlDatabase.removeDatabase("migration_test")
+
+
+def test_baseline_database_migrates_to_latest(qapp, tmp_path):
+    path = str(tmp_path / "baseline.db")
+    make_baseline_database(path)
+    assert migrate(path) == helo.SCHEMA_VERSION
+    conn = sqlite3.connect(path)
+    assert conn.execute("PRAGMA foreign_key_check").fetchall() == []
+    assert conn.execute("PRAGMA integrity_check").fetchall() == [("ok",)]
+    indexes = {name for name, in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    assert MIGRATION_INDEXES <= indexes
+    assert "idx_stockmovements_item_id" in indexes
+    # Stock and order lines of the deleted item and order are gone; lines of
+    # the deleted item on a surviving order are kept without an item.
+    assert conn.execute("SELECT item_id FROM StockLevels ORDER BY item_id").fetchall() == [(1,), (2,)]
+    assert conn.execute("SELECT COUNT(*) FROM SalesOrderItems WHERE order_id = 1").fetchone() == (0,)
+    assert conn.execute("SELECT item_id FROM PurchaseOrderItems WHERE order_id = 1 ORDER BY id").fetchall() == [(1,), (None,)]
+    assert conn.execute("SELECT total FROM PurchaseOrders WHERE id = 1").fetchone() == (344.0,)
+    conn.close()
+
+
+def test_empty_database_migrates_to_latest(qapp, tmp_path):
+    path = str(tmp_path / "empty.db")
+    assert migrate(path) == helo.SCHEMA_VERSION
+    conn = sqlite3.connect(path)
+    assert conn.execute("PRAGMA foreign_key_check").fetchall() == []
+    indexes = {name for name, in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    assert MIGRATION_INDEXES <= indexes
+    conn.close()
@@ -0,0 +1,66 @@
+import sqlite3
+import time
+
+import pytest
+from PyQt5.QtCore import QTimer
+from PyQt5.QtSql import QSqlDatabase
+
+import helo
+
+TICK_MS = 50
+# A tick delayed by this much means the GUI thread was blocked.
+MAX_GAP_MS = 4 * TICK_MS
+
+
+@pytest.fixture(scope="module")
+def database(qapp, tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("responsiveness") / "stock.db")
+    db = helo.open_database(path)
+    assert db is not None and helo.migrate_database(db)
+    helo.generate_dataset(db, sizes=helo.DATASET_SIZES["small"])
+    yield path
+    helo.change_feed.poll_timer.stop()
+    helo.query_service.shutdown()
+    name = db.connectionName()
+    db.close()
+    del db
+    QSqlDatabase.removeDatabase(name)
+
+
+def longest_tick_gap_ms(qapp, done, seconds):
+    # Runs the event loop until done() or seconds pass, with a timer ticking
+    # every TICK_MS; returns the longest time between two ticks.
+    ticks = []
+    timer = QTimer()
+    timer.timeout.connect(lambda: ticks.append(time.perf_counter()))
+    timer.start(TICK_MS)
+    deadline = time.perf_counter() + seconds
+    while not done() and time.perf_counter() < deadline:
+        qapp.processEvents()
+        time.sleep(0.001)
+    timer.stop()
+    assert done()
+    return max((later - earlier) * 1000 for earlier, later in zip(ticks, ticks[1:]))
+
+
+def test_timer_ticks_while_a_slow_query_runs(database):
+    report = helo.check_event_loop_responsiveness(seconds=1.0, tick_ms=TICK_MS)
+    assert report["responsive"], report
+
+
+def test_change_feed_reads_a_large_change_log_without_blocking(qapp, database):
+    helo.change_feed.start()
+    changes = []
+    helo.change_feed.rows_changed.connect(lambda table, rows: changes.append((table, rows)))
+    # Another instance commits a batch far over CHANGE_FEED_MAX_ROWS.
+    conn = sqlite3.connect(database)
+    conn.execute("""WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < 200000)
+                    INSERT OR REPLACE INTO ChangeLog (table_name, row_id, structural)
+                    SELECT 'Customers', i, 0 FROM n""")
+    conn.commit()
+    last_id = conn.execute("SELECT MAX(id) FROM ChangeLog").fetchone()[0]
+    conn.close()
+    gap_ms = longest_tick_gap_ms(qapp, lambda: helo.change_feed.cursor == last_id,
+                                 3 * helo.DATA_VERSION_POLL_MS / 1000)
+    assert gap_ms < MAX_GAP_MS
+    assert ("Customers", None) in changes